@@ -0,0 +1,277 @@
+"""
+Admission control for upstream (Azure OpenAI) calls.
+
+Every async chat / embedding request goes through the gate of its call
+type – ``extractor``, ``completion`` (QA and onboarding replies, summaries)
+or ``embedding`` – which lets at most ``limit`` calls run at once and
+queues the rest (bounded, best priority first, FIFO within a priority):
+
+* QA turns outrank onboarding turns, which outrank batch items; when a
+  queue is full, a better-priority call evicts the worst waiter.
+* A turn's calls must get their slots before the turn's deadline
+  (ADMIT_WAIT seconds after it started). The expected wait – calls queued
+  ahead × the recent time a slot is held – is checked up front, so a call
+  that cannot make it is turned away at once instead of after waiting.
+
+A call that cannot be queued raises :class:`Overloaded` (429), one that
+cannot get a slot before its deadline raises it with 503; the API turns both into
+responses with ``Retry-After``. Priority and deadline are per turn
+(context variables set by :func:`begin`), the call type per call site
+(:func:`call`). A call shared by several turns (single flight) queues with
+a :class:`Ticket` that every joining turn raises to its own priority and
+deadline, so it is never held back by the turn that happened to start it.
+"""
+from __future__ import annotations
+from contextlib import asynccontextmanager, contextmanager
+from contextvars import ContextVar
+from typing import Dict, List
+import asyncio, heapq, itertools, math, os, time
+from logger import init_logger
+import metrics
+
+logger = init_logger(name="chatbot.admission", level="DEBUG", filename="admission.log")
+
+ADMISSION         = os.getenv("ADMISSION", "1") == "1"
+ADMIT_EXTRACTOR   = int(os.getenv("ADMIT_EXTRACTOR", "16"))     # concurrent calls per type
+ADMIT_COMPLETION  = int(os.getenv("ADMIT_COMPLETION", "32"))
+ADMIT_EMBEDDING   = int(os.getenv("ADMIT_EMBEDDING", "16"))
+ADMIT_QUEUE       = int(os.getenv("ADMIT_QUEUE", "128"))        # waiting calls per type
+ADMIT_WAIT        = float(os.getenv("ADMIT_WAIT", "20"))        # seconds a turn may queue
+ADMIT_RETRY_AFTER = int(os.getenv("ADMIT_RETRY_AFTER", "2"))    # seconds, Retry-After
+
+# priorities (lower first)
+QA, ONBOARDING, BATCH = 0, 1, 2
+
+_CALL: ContextVar[str] = ContextVar("admission_call", default="completion")
+_PRIORITY: ContextVar[int] = ContextVar("admission_priority", default=ONBOARDING)
+_DEADLINE: ContextVar[float | None] = ContextVar("admission_deadline", default=None)
+_TICKET: ContextVar["Ticket | None"] = ContextVar("admission_ticket", default=None)
+
+
+class Overloaded(Exception):
+    """No upstream capacity for this call: 429 (queue full) or 503 (deadline passed)."""
+
+    def __init__(self, status: int, detail: str, retry_after: int = ADMIT_RETRY_AFTER):
+        super().__init__(detail)
+        self.status, self.detail, self.retry_after = status, detail, retry_after
+
+
+class Ticket:
+    """Priority and deadline a call queues with; :meth:`join` raises them while it waits."""
+
+    __slots__ = ("priority", "deadline", "_queued")
+
+    def __init__(self, priority: int, deadline: float | None):
+        self.priority, self.deadline = priority, deadline
+        self._queued: List[tuple] = []          # (gate, heap entry) while waiting
+
+    def join(self, priority: int, deadline: float | None):
+        """Another caller waits on this call: best priority, latest deadline."""
+        if self.deadline is not None:
+            self.deadline = None if deadline is None else max(self.deadline, deadline)
+        if priority < self.priority:
+            self.priority = priority
+            for gate, entry in self._queued:
+                entry[0] = priority
+                heapq.heapify(gate._queue)
+
+
+class Gate:
+    """Concurrency limit with a bounded priority wait queue (one event loop)."""
+
+    def __init__(self, name: str, limit: int, queue_size: int = ADMIT_QUEUE):
+        self.name, self.limit, self.queue_size = name, limit, queue_size
+        self.active = self.waiting = 0
+        self._queue: List[list] = []            # heap of [priority, seq, future]
+        self._seq = itertools.count()
+        self.admitted = self.queued = self.evicted = 0
+        self.rejected_full = self.rejected_deadline = 0
+        self.hold_s = 0.0                       # EWMA of how long a slot is held
+
+    def _worst(self) -> list | None:
+        live = [e for e in self._queue if not e[2].done()]
+        return max(live, key=lambda e: (e[0], e[1])) if live else None
+
+    def expected_wait(self, priority: int) -> float:
+        """Seconds a call of *priority* would likely wait for a slot now."""
+        if self.active < self.limit:
+            return 0.0
+        ahead = sum(1 for e in self._queue if e[0] <= priority and not e[2].done())
+        return (ahead // self.limit + 1) * self.hold_s
+
+    def would_reject(self, priority: int) -> int | None:
+        """Status a call of *priority* would be turned away with now (None → queued / admitted)."""
+        if self.active >= self.limit and self.waiting >= self.queue_size:
+            worst = self._worst()
+            if worst is None or worst[0] <= priority:
+                return 429
+        if self.expected_wait(priority) > ADMIT_WAIT:
+            return 503
+        return None
+
+    def retry_after(self, priority: int, budget: float = ADMIT_WAIT) -> int:
+        """Seconds until a retry could fit in *budget* (spreads retries out instead of bunching them)."""
+        return max(ADMIT_RETRY_AFTER, math.ceil(self.expected_wait(priority) - budget))
+
+    def _reject(self, status: int, reason: str, priority: int = QA):
+        if reason == "full":
+            self.rejected_full += 1
+        else:
+            self.rejected_deadline += 1
+        metrics.ADMISSION_REJECTED.inc(gate=self.name, reason=reason)
+        detail = ("Too many requests, please retry shortly." if status == 429
+                  else "The service is busy, please retry shortly.")
+        logger.warning("%s: rejected (%s) – active %d/%d, queued %d/%d", self.name, reason,
+                       self.active, self.limit, self.waiting, self.queue_size)
+        raise Overloaded(status, detail, self.retry_after(priority))
+
+    async def acquire(self, ticket: Ticket):
+        priority = ticket.priority
+        if self.active < self.limit and not self.waiting:
+            self.active += 1
+            self.admitted += 1
+            metrics.ADMISSION_WAIT.observe(0.0, gate=self.name)
+            return
+        worst = None
+        if self.waiting >= self.queue_size:
+            worst = self._worst()
+            if worst is None or worst[0] <= priority:
+                self._reject(429, "full", priority)
+        # only a call that can make its deadline may evict a waiter
+        timeout = None if ticket.deadline is None else ticket.deadline - time.monotonic()
+        if timeout is not None and (timeout <= 0 or self.expected_wait(priority) > timeout):
+            self._reject(503, "deadline", priority)
+        if worst is not None:
+            self.evicted += 1                   # make room for a better-priority call
+            worst[2].set_exception(Overloaded(429, "Too many requests, please retry shortly.",
+                                              self.retry_after(worst[0])))
+            self.waiting -= 1
+            metrics.ADMISSION_REJECTED.inc(gate=self.name, reason="evicted")
+
+        fut = asyncio.get_running_loop().create_future()
+        entry = [priority, next(self._seq), fut]
+        heapq.heappush(self._queue, entry)
+        ticket._queued.append((self, entry))
+        self.waiting += 1
+        self.queued += 1
+        self._wake()
+        t0 = time.monotonic()
+        try:
+            # the deadline may move out while we wait (a later turn joined the call)
+            while not fut.done():
+                timeout = None if ticket.deadline is None else ticket.deadline - time.monotonic()
+                if timeout is not None and timeout <= 0:
+                    self._left(fut)
+                    self._reject(503, "deadline", ticket.priority)
+                await asyncio.wait([fut], timeout=timeout)
+            fut.result()                        # raises Overloaded when evicted
+        except asyncio.CancelledError:
+            self._left(fut)
+            raise
+        finally:
+            ticket._queued.remove((self, entry))
+            metrics.ADMISSION_WAIT.observe(time.monotonic() - t0, gate=self.name)
+        self.admitted += 1
+
+    def _left(self, fut: asyncio.Future):
+        """A waiter gave up; hand back a slot that was granted in the meantime."""
+        if fut.done() and not fut.cancelled() and fut.exception() is None:
+            self.release()
+        elif not fut.done() or fut.cancelled():
+            fut.cancel()                        # skipped by _wake
+            self.waiting -= 1
+
+    def release(self, held: float | None = None):
+        if held is not None:
+            self.hold_s = held if not self.hold_s else 0.8 * self.hold_s + 0.2 * held
+        self.active -= 1
+        self._wake()
+
+    def _wake(self):
+        """Grant free slots to the best waiters."""
+        while self._queue and self.active < self.limit:
+            _, _, fut = heapq.heappop(self._queue)
+            if fut.done():                      # evicted / gave up
+                continue
+            self.waiting -= 1
+            self.active += 1
+            fut.set_result(None)
+
+    def stats(self) -> Dict[str, float]:
+        return {"limit": self.limit, "active": self.active, "queued_now": self.waiting,
+                "queue_size": self.queue_size, "admitted": self.admitted,
+                "queued": self.queued, "evicted": self.evicted,
+                "rejected_full": self.rejected_full, "rejected_deadline": self.rejected_deadline,
+                "hold_ms": round(self.hold_s * 1000, 1)}
+
+
+GATES: Dict[str, Gate] = {
+    "extractor":  Gate("extractor", ADMIT_EXTRACTOR),
+    "completion": Gate("completion", ADMIT_COMPLETION),
+    "embedding":  Gate("embedding", ADMIT_EMBEDDING),
+}
+
+
+def begin(priority: int, wait: float | None = ADMIT_WAIT):
+    """Start a turn (or batch item): its priority and queueing deadline."""
+    _PRIORITY.set(priority)
+    _DEADLINE.set(None if wait is None else time.monotonic() + wait)
+
+
+def check(priority: int):
+    """Fail fast (429 / 503) when a call of *priority* would be turned away by some gate."""
+    if not ADMISSION:
+        return
+    for gate in GATES.values():
+        status = gate.would_reject(priority)
+        if status is not None:
+            gate._reject(status, "full" if status == 429 else "deadline", priority)
+
+
+def ticket() -> Ticket:
+    """The current turn's priority and deadline, as a ticket for a call it starts."""
+    return _TICKET.get() or Ticket(_PRIORITY.get(), _DEADLINE.get())
+
+
+def join(shared: Ticket):
+    """The current turn waits on a call queued with *shared*."""
+    shared.join(_PRIORITY.get(), _DEADLINE.get())
+
+
+@contextmanager
+def using(shared: Ticket):
+    """Queue the calls made inside the block with *shared* instead of the turn's own ticket."""
+    token = _TICKET.set(shared)
+    try:
+        yield
+    finally:
+        _TICKET.reset(token)
+
+
+@contextmanager
+def call(kind: str):
+    """Route the upstream calls made inside the block through gate *kind*."""
+    token = _CALL.set(kind)
+    try:
+        yield
+    finally:
+        _CALL.reset(token)
+
+
+@asynccontextmanager
+async def slot(kind: str | None = None):
+    """Hold a slot of gate *kind* (default: the current call type) for the block."""
+    if not ADMISSION:
+        yield
+        return
+    gate = GATES[kind or _CALL.get()]
+    await gate.acquire(ticket())
+    t0 = time.monotonic()
+    try:
+        yield
+    finally:
+        gate.release(time.monotonic() - t0)
+
+
+def stats() -> Dict[str, float]:
+    return {f"{name}_{k}": v for name, gate in GATES.items() for k, v in gate.stats().items()}
@@ -0,0 +1,119 @@
+from __future__ import annotations
+from collections import OrderedDict
+from typing import Dict, FrozenSet, Hashable, Tuple
+import itertools, os, threading, time
+import numpy as np
+from logger import init_logger
+
+logger = init_logger(name="chatbot.answer_cache", level="DEBUG", filename="answer_cache.log")
+
+ANSWER_CACHE           = os.getenv("ANSWER_CACHE", "1") == "1"
+ANSWER_CACHE_THRESHOLD = float(os.getenv("ANSWER_CACHE_THRESHOLD", "0.95"))  # cosine
+ANSWER_CACHE_SIZE      = int(os.getenv("ANSWER_CACHE_SIZE", "5000"))
+ANSWER_CACHE_TTL       = float(os.getenv("ANSWER_CACHE_TTL", "86400"))       # seconds
+
+# (target HMOs, tier, age, gender, language, KB version, retrieved chunk rows)
+BucketKey = Tuple[FrozenSet[str], str, int, str, str, str, Hashable]
+_VERSION = 5
+
+
+class SemanticAnswerCache:
+    """
+    QA answer cache: exact match on the bucket key, then cosine similarity of
+    the question embedding against the bucket's entries (>= threshold).
+
+    The retrieved chunk rows are part of the bucket, so a follow-up such as
+    "and for silver?" only matches answers built from the same snippets.
+    Age and gender are too (the KB has age cutoffs); cached answers come from
+    prompts without the name, so nothing else in them is personal.
+    Entries of an older KB version are dropped as soon as a new version is seen.
+    """
+
+    def __init__(self,
+                 threshold: float = ANSWER_CACHE_THRESHOLD,
+                 max_size: int = ANSWER_CACHE_SIZE,
+                 ttl: float = ANSWER_CACHE_TTL):
+        self.threshold = threshold
+        self.max_size  = max_size
+        self.ttl       = ttl
+        self.kb_version: str | None = None
+        self._lock = threading.Lock()
+        self._ids = itertools.count()
+        # entry id → (bucket, vec, answer, ts), in LRU order
+        self._entries: "OrderedDict[int, Tuple[BucketKey, np.ndarray, str, float]]" = OrderedDict()
+        self._buckets: Dict[BucketKey, Dict[int, np.ndarray]] = {}
+        self.hits = self.misses = self.evictions = self.invalidations = 0
+
+    @staticmethod
+    def bucket(hmos, tier: str, age: int, gender: str, lang: str, kb_version: str,
+               rows) -> BucketKey:
+        return (frozenset(hmos), (tier or "").lower(), int(age), (gender or "").lower(), lang,
+                kb_version, tuple(sorted(rows)))
+
+    # ────────────────── internals (lock held) ──────────────────
+    def _check_version(self, kb_version: str):
+        if kb_version != self.kb_version:
+            if self._entries:
+                logger.info("KB version %s → %s, dropping %d cached answers",
+                            self.kb_version, kb_version, len(self._entries))
+                self.invalidations += len(self._entries)
+            self._entries.clear()
+            self._buckets.clear()
+            self.kb_version = kb_version
+
+    def _drop(self, entry_id: int):
+        bucket = self._entries.pop(entry_id)[0]
+        members = self._buckets.get(bucket)
+        if members is not None:
+            members.pop(entry_id, None)
+            if not members:
+                del self._buckets[bucket]
+
+    # ────────────────── public API ──────────────────
+    def get(self, bucket: BucketKey, q_vec: np.ndarray) -> str | None:
+        now = time.time()
+        with self._lock:
+            self._check_version(bucket[_VERSION])
+            members = self._buckets.get(bucket)
+            if members:
+                for entry_id in [i for i in members if now - self._entries[i][3] > self.ttl]:
+                    self._drop(entry_id)
+                members = self._buckets.get(bucket)
+            if not members:
+                self.misses += 1
+                return None
+
+            ids = list(members)
+            scores = np.stack([members[i] for i in ids]) @ q_vec
+            best = int(np.argmax(scores))
+            if scores[best] < self.threshold:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._entries.move_to_end(ids[best])
+            logger.info("Answer cache hit (cos=%.3f)", scores[best])
+            return self._entries[ids[best]][2]
+
+    def put(self, bucket: BucketKey, q_vec: np.ndarray, answer: str):
+        with self._lock:
+            self._check_version(bucket[_VERSION])
+            entry_id = next(self._ids)
+            vec = np.asarray(q_vec, dtype=np.float32)
+            self._entries[entry_id] = (bucket, vec, answer, time.time())
+            self._buckets.setdefault(bucket, {})[entry_id] = vec
+            while len(self._entries) > self.max_size:
+                self._drop(next(iter(self._entries)))
+                self.evictions += 1
+
+    def stats(self) -> Dict[str, float]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size":          len(self._entries),
+                "buckets":       len(self._buckets),
+                "hits":          self.hits,
+                "misses":        self.misses,
+                "evictions":     self.evictions,
+                "invalidations": self.invalidations,
+                "hit_rate":      self.hits / lookups if lookups else 0.0,
+            }
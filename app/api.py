@@ -1,27 +1,63 @@
-from typing import Dict, List, Tuple
-from fastapi import APIRouter, HTTPException
-from models import ChatRequest, ChatResponse, UserInfo
-from openai_client import AzureOpenAIClient
-from kb_search import Retriever
-from data_loader import ChunkedKnowledgeBase
+import asyncio, contextlib, hmac, json, os, time
+import numpy as np
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+from fastapi import APIRouter, Depends, Header, HTTPException, Response
+from fastapi.responses import PlainTextResponse, StreamingResponse
+from models import BatchRequest, ChatRequest, ChatResponse, Session, UserInfo
+from components import Components
+from kb_reload import KB_ADMIN_TOKEN
 from pathlib import Path
-from logger import init_logger
-from utils import detect_lang, detect_hmos
-from prompts import get_system_prompt
-from validators import validate_profile
+from logger import bind_context, init_logger, stats as logging_stats
+from utils import detect_lang, query_hmos, query_tiers
+from prompts import get_system_prompt, profile_prompt
+from validators import validate_profile, valid_fields
 from utils import HE_2_EN, EN_2_HE
-from profile_extractor import extract_profile
+from profile_extractor import aextract_profile, aextract_profile_incremental
+from session_store import SESSION_PURGE_INTERVAL, session_store_from_env
+from query_cache import QUERY_CACHE_DB, QUERY_CACHE_PURGE_INTERVAL
+from answer_cache import ANSWER_CACHE, BucketKey, SemanticAnswerCache
+from conversation_retrieval import ConversationRetrieval
+from batch import BATCH_CONCURRENCY, BATCH_ITEM_TIMEOUT, BATCH_MAX_ITEMS, answer_batch, prepare_batch
+from prompt_builder import Prompt, PromptBuilder
+import admission
+import metrics
+import slot_filler
 
 
 # ────────────────────────── API Router ────────────────────────────────
 router = APIRouter()
 logger = init_logger(name="chatbot.api", level="DEBUG", filename="api.log")
-kb = ChunkedKnowledgeBase(Path("phase2_data"))
-openai = AzureOpenAIClient()
-retriever = Retriever(kb, openai)
 
+# overlap profile extraction with the reply during info_collection
+PARALLEL_EXTRACTION = os.getenv("CHAT_PARALLEL_EXTRACTION", "1") == "1"
 
-def gather_profile(
+# incremental: send only confirmed fields + last question + new message
+# full:        send the whole conversation on every turn
+EXTRACTOR_MODE = os.getenv("EXTRACTOR_MODE", "incremental")
+
+# fill unambiguous slots (IDs, age, HMO, tier, gender) locally, no LLM call
+SLOT_FILLER = os.getenv("SLOT_FILLER", "1") == "1"
+
+# clients + KB index, built after the port is bound (see GET /ready)
+components = Components(Path("phase2_data"))
+sessions = session_store_from_env()
+components.every(SESSION_PURGE_INTERVAL, sessions.purge, "session purge")
+if QUERY_CACHE_DB:
+    components.every(QUERY_CACHE_PURGE_INTERVAL,
+                     lambda: components.kb_manager.retriever.emb.query_cache.purge(),
+                     "query cache purge")
+answer_cache = SemanticAnswerCache()
+conversation_retrieval = ConversationRetrieval()
+prompt_builder = PromptBuilder(
+    summarize=lambda msgs: components.aopenai.chat(msgs, temperature=0))
+
+
+def _require_ready():
+    if not components.ready:
+        raise HTTPException(503, "Backend is starting up.", headers={"Retry-After": "1"})
+
+
+async def gather_profile(
     phase: str,
     history: List[Dict[str, str]],
     user_text: str,
@@ -36,11 +72,33 @@ def gather_profile(
     profile = dict(existing or {})
 
     if phase == "info_collection":
-        logger.info("Phase is info_collection, extracting profile.")
-        extracted = extract_profile(history + [{"role": "user",
-                                                "content": user_text}],
-                                    client=openai)
-        profile.update({k: v for k, v in extracted.items() if v})
+        # incremental needs the confirmed fields; a stateless client that does
+        # not round-trip partial_info mid-conversation falls back to full mode
+        if EXTRACTOR_MODE == "incremental" and (existing is not None or not history):
+            logger.info("Phase is info_collection, extracting profile incrementally.")
+            confirmed = valid_fields(profile)
+            last_question = next((m["content"] for m in reversed(history)
+                                  if m.get("role") == "assistant"), None)
+            extracted = (slot_filler.fill_slots(last_question, user_text, confirmed)
+                         if SLOT_FILLER else None)
+            if extracted is not None:
+                logger.info("Slot filler resolved %s locally.", list(extracted))
+                slot_filler.stats.record_hit(len(extracted))
+            else:
+                t0 = time.perf_counter()
+                with admission.call("extractor"):
+                    extracted = await aextract_profile_incremental(
+                        confirmed, last_question, user_text, client=components.aopenai)
+                slot_filler.stats.record_llm((time.perf_counter() - t0) * 1000)
+            profile = {**confirmed, **{k: v for k, v in extracted.items()
+                                       if v and k not in confirmed}}
+        else:
+            logger.info("Phase is info_collection, extracting profile.")
+            with admission.call("extractor"):
+                extracted = await aextract_profile(history + [{"role": "user",
+                                                               "content": user_text}],
+                                                   client=components.aopenai)
+            profile.update({k: v for k, v in extracted.items() if v})
 
     try:
         user_obj = UserInfo(**profile) 
@@ -54,100 +112,518 @@ def gather_profile(
     return profile, ok
 
 
-def add_kb_and_profile(
-    messages: List[Dict[str, str]],
+async def add_kb_and_profile(
+    prompt: Prompt,
     profile: UserInfo,
     user_text: str,
     lang: str,
     history: List[Dict[str, str]],
-):
-    """Insert profile + KB context into the system messages list (in place)."""
-    profile_txt = (
-        f"User profile:\n"
-        f"Full name: {profile.first_name} {profile.last_name}\n"
-        f"HMO: {profile.hmo}\n"
-        f"Tier: {profile.tier}\n"
-        f"Age: {profile.age}\n"
-        f"Gender: {profile.gender}\n"
-    )
-    messages.insert(1, {"role": "system", "content": profile_txt})
-
-    # build KB context
-    hmo_names = [h.lower() for h in detect_hmos(user_text)]
-    profile_hmo_lower = profile.hmo.lower() if profile.hmo else ""
-
-    # Add both Hebrew and English variants if missing
-    he_name = EN_2_HE.get(profile_hmo_lower, profile_hmo_lower)
-    en_name = HE_2_EN.get(profile_hmo_lower, profile_hmo_lower)
-
-    if profile_hmo_lower not in hmo_names:
-        hmo_names.append(profile_hmo_lower)
-    if he_name not in hmo_names:
-        hmo_names.append(he_name)
-    if en_name not in hmo_names:
-        hmo_names.append(en_name)
-
-    # Build context from the last 2 messages + user input
+    cacheable: bool = False,
+) -> Tuple[Optional[BucketKey], Optional[np.ndarray]]:
+    """
+    Insert profile + KB context into the prompt (in place, each within its budget).
+    Returns the answer-cache bucket and the question embedding for this turn.
+    The bucket is None unless *cacheable*, and when the reply could depend on
+    more than the question (name in the conversation, context pulled in by
+    history); the embedding is None when retrieval ran without embeddings or
+    was reused / skipped. Only a turn whose reply will be cached gets the
+    profile without the name.
+    """
+    # build KB context from the last 2 messages + user input
+    hmo_names = query_hmos(profile.hmo, user_text)
     extra_context = ""
     if len(history) >= 2:
         extra_context = history[-2]["content"] + "\n" + history[-1]["content"] + "\n"
     query_text = extra_context + user_text
-    ctx = retriever.build_context(hmo_names, query_text)
-    # ctx = retriever.build_context(hmo_names, user_text)
-    messages.insert(2, {"role": "system", "content": f"Knowledge Base:\n{ctx}"})
+    # only the user's tier plus any tier the question asks about
+    tiers = query_tiers(profile.tier, user_text)
+    retriever = components.kb_manager.retriever     # one KB version for the whole turn
+    ctx, rows, question_vec, _ = await conversation_retrieval.retrieve(
+        retriever, profile.id_number, history, user_text, query_text, hmo_names, tiers or None)
 
+    bucket = None
+    if cacheable and question_vec is not None and not _names_user(prompt.messages, profile):
+        # the key holds the snippets found for the question alone; an answer
+        # built from other snippets (pulled in by the history) is not shared
+        question_rows = rows if query_text == user_text else \
+            retriever.rank(hmo_names, user_text, question_vec)
+        if sorted(question_rows) == sorted(rows):
+            # answer-cache key: target HMOs (canonical Hebrew), tier, age, gender,
+            # language, KB, snippets
+            targets = {EN_2_HE.get(h, h) for h in hmo_names if EN_2_HE.get(h, h) in HE_2_EN}
+            bucket = answer_cache.bucket(targets, "|".join(tiers) or profile.tier, profile.age,
+                                         profile.gender, lang, retriever.emb.kb_version,
+                                         question_rows)
 
+    prompt.insert(1, "profile",
+                  {"role": "system", "content": prompt_builder.fit(
+                      "profile", profile_prompt(profile, anonymous=bucket is not None))})
+    if ctx is not None:                             # None → small talk, no KB lookup
+        prompt.insert(2, "kb", {"role": "system",
+                                "content": prompt_builder.fit("kb", f"Knowledge Base:\n{ctx}")})
+    return bucket, question_vec
 
-# ─────────────────────────── Endpoint ────────────────────────────
-@router.post("/chat", response_model=ChatResponse)
-async def chat(req: ChatRequest):
+
+def _names_user(messages: List[Dict[str, str]], profile: UserInfo) -> bool:
+    """True when the user's first or last name appears anywhere in *messages*."""
+    names = [n.strip().lower() for n in (profile.first_name, profile.last_name)
+             if n and len(n.strip()) > 1]
+    return any(n in str(m.get("content") or "").lower() for m in messages for n in names)
+
+
+
+# ─────────────────────────── Timing ──────────────────────────────
+async def _timed(awaitable: Awaitable, stage: str):
+    """Await *awaitable* as request stage *stage* (turn timings + histogram)."""
+    with metrics.timed(stage):
+        return await awaitable
+
+
+async def _returns(value):
+    return value
+
+
+async def _yields(value):
+    yield value
+
+
+async def _discard(task: asyncio.Task):
+    """Cancel a speculative task and wait until it has really stopped."""
+    task.cancel()
+    try:
+        await task
+    except BaseException:
+        pass
+
+
+async def _prepare_turn(
+    req: ChatRequest,
+    prompt: Prompt,
+    lang: str,
+    timings: Dict[str, float],
+    start_reply: Callable[..., asyncio.Task],
+) -> Tuple[Dict, bool, asyncio.Task, bool]:
+    """
+    Resolve the profile, add profile + KB context when in QA and return the
+    task producing the assistant reply (started by ``start_reply(messages,
+    cached=None)``) and whether the reply came from the answer cache.
+    Logs the prompt tokens per section of the final prompt.
+
+    With PARALLEL_EXTRACTION the info-collection reply is started before the
+    extractor returns – its prompt does not depend on the extraction result.
+    If extraction shows the profile just became complete, the speculative
+    reply is dropped and regenerated with the profile + KB context (QA switch).
+    """
+    started_in_qa = req.phase == "qa"
+    speculative = None
+    if req.phase == "info_collection" and PARALLEL_EXTRACTION:
+        speculative = start_reply(prompt.messages)
+
+    # collect / validate the profile
     try:
-        if req.phase not in {"info_collection", "qa"}:
-            raise HTTPException(400, "Phase must be 'info_collection' or 'qa'.")
-
-        # language + base system prompt
-        lang = detect_lang(req.message, req.history)
-        system_msg = {"role": "system", "content": get_system_prompt(req.phase, lang)}
-        messages = [system_msg, *req.history, {"role": "user", "content": req.message}]
-
-        # collect / validate the profile
-        profile_dict, ok = gather_profile(
-            req.phase, req.history, req.message, lang, req.user_info
-        )
-
-        # if finished collecting → switch to QA
-        if req.phase == "info_collection" and ok:
-            logger.info("Profile is complete and valid, switching to QA phase.")
-            req.phase = "qa"
-
-        # If we’re in QA, we must have a complete profile
-        if req.phase == "qa":
-            if not ok:
-                raise HTTPException(400, "Incomplete or invalid profile for QA phase.")
-
-            profile_obj = UserInfo(**profile_dict)
-            add_kb_and_profile(messages, profile_obj, req.message, lang, req.history)
-
-        # ask the assistant
-        reply = openai.chat(messages)
-
-        # build response
-        history = req.history + [
-            {"role": "user", "content": req.message},
-            {"role": "assistant", "content": reply},
-        ]
-        resp_data = {
-            "reply":    reply,
-            "history":  history,
-            "full_info": ok,
-        }
+        existing = req.user_info if req.user_info is not None else req.partial_info
+        profile_dict, ok = await _timed(gather_profile(
+            req.phase, req.history, req.message, lang, existing
+        ), "extract_profile")
+    except BaseException:
+        if speculative:
+            await _discard(speculative)
+        raise
+
+    # if finished collecting → switch to QA
+    if req.phase == "info_collection" and ok:
+        logger.info("Profile is complete and valid, switching to QA phase.")
+        req.phase = "qa"
+        if speculative:
+            await _discard(speculative)
+            timings.pop("completion", None)
+            timings["speculative_discarded"] = 1.0
+            speculative = None
+
+    # If we’re in QA, we must have a complete profile
+    if req.phase == "qa":
+        if not ok:
+            raise HTTPException(400, "Incomplete or invalid profile for QA phase.")
+
+        profile_obj = UserInfo(**profile_dict)
+        # answers to QA questions only (not the onboarding → QA switch turn)
+        bucket, question_vec = await _timed(add_kb_and_profile(
+            prompt, profile_obj, req.message, lang, req.history,
+            cacheable=ANSWER_CACHE and started_in_qa
+        ), "retrieval")
+
+        logger.info("Prompt tokens: %s", prompt.tokens())
+
+        if bucket is not None:
+            cached = answer_cache.get(bucket, question_vec)
+            if cached is not None:
+                return profile_dict, ok, start_reply(prompt.messages, cached=cached), True
+
+            def remember(task: asyncio.Task):
+                if not task.cancelled() and task.exception() is None:
+                    answer_cache.put(bucket, question_vec, task.result())
+
+            reply_task = start_reply(prompt.messages)
+            reply_task.add_done_callback(remember)
+            return profile_dict, ok, reply_task, False
+    else:
+        logger.info("Prompt tokens: %s", prompt.tokens())
+
+    # ask the assistant
+    return profile_dict, ok, speculative or start_reply(prompt.messages), False
+
+
+def _check_phase(req: ChatRequest):
+    if req.phase not in {"info_collection", "qa"}:
+        raise HTTPException(400, "Phase must be 'info_collection' or 'qa'.")
+
+
+def _start_turn(req: ChatRequest, session: Session | None = None) -> Tuple[str, Prompt]:
+    _check_phase(req)
+    metrics.PHASE.set(req.phase)
+    # users already in QA first; turn away what cannot even be queued
+    priority = _priority(req.phase)
+    admission.begin(priority)
+    admission.check(priority)
+
+    # language (sticky per session) + base system prompt + history window
+    with metrics.timed("detect_lang"):
+        lang = detect_lang(req.message, req.history, session.lang if session else None)
+    if session is not None:
+        session.lang = lang                 # persisted with the turn
+    with metrics.timed("prompt_build"):
+        return lang, prompt_builder.build(get_system_prompt(req.phase, lang),
+                                          req.history, req.message)
+
+
+def _priority(phase: str | None) -> int:
+    return admission.QA if phase == "qa" else admission.ONBOARDING
+
+
+def _overloaded(exc: admission.Overloaded) -> HTTPException:
+    return HTTPException(exc.status, exc.detail, headers={"Retry-After": str(exc.retry_after)})
+
+
+def _count_turn(endpoint: str, status: str):
+    metrics.TURNS.inc(endpoint=endpoint, phase=metrics.PHASE.get(), status=status)
+
+
+# ─────────────────────────── Sessions ────────────────────────────
+def _turn_lock(req: ChatRequest):
+    """Serialize turns of one session; stateless requests need no lock."""
+    return sessions.lock(req.session_id) if req.session_id else contextlib.nullcontext()
+
+
+async def _open_session(req: ChatRequest) -> Session | None:
+    """Session mode: fill phase/history/profile on *req* from the store."""
+    if req.session_id is None:
+        return None
+    bind_context(session_id=req.session_id)
+    session = await sessions.aget(req.session_id)
+    if session is None:
+        raise HTTPException(404, "Unknown or expired session.")
+    req.phase = session.phase
+    req.history = list(session.history)
+    req.user_info = UserInfo(**session.user_info) if session.user_info else None
+    req.partial_info = dict(session.partial_info)
+    return session
+
+
+async def _response_data(req: ChatRequest, reply: str, profile_dict: Dict, ok: bool,
+                   timings: Dict[str, float], session: Session | None = None,
+                   cached: bool = False) -> Dict:
+    history = req.history + [
+        {"role": "user", "content": req.message},
+        {"role": "assistant", "content": reply},
+    ]
+    resp_data = {
+        "reply":    reply,
+        "full_info": ok,
+        "timings":  timings,
+        "phase":    req.phase,
+        "cached":   cached,
+    }
+
+    partial = {} if ok else valid_fields(profile_dict)
+    if session is None:                 # stateless: echo the full state back
+        resp_data["history"] = history
         if ok:
             resp_data["user_info"] = profile_dict
+        else:
+            resp_data["partial_info"] = partial
+        return resp_data
+
+    # session mode: persist, and only send what changed
+    changed = ok and profile_dict != session.user_info
+    session.history = history
+    session.phase = req.phase
+    session.partial_info = partial
+    if ok:
+        session.user_info = profile_dict
+    await sessions.aput(session)
+
+    resp_data["session_id"] = session.session_id
+    if changed:
+        resp_data["user_info"] = profile_dict
+    return resp_data
+
+
+@router.get("/ready")
+async def ready():
+    """Readiness (clients + KB index built); ``/`` only reports liveness."""
+    if not components.ready:
+        detail = {"ready": False, "error": components.error}
+        raise HTTPException(503, detail, headers={"Retry-After": "1"})
+    return {"ready": True, "kb_version": components.kb_manager.version,
+            "startup_ms": components.startup}
+
+
+@router.get("/stats", dependencies=[Depends(_require_ready)])
+async def stats():
+    """Cache / shortcut counters of the request-path components."""
+    kb_manager = components.kb_manager
+    return {
+        "kb": kb_manager.info(),
+        "retrieval": kb_manager.retriever.stats(),
+        "query_cache": kb_manager.retriever.emb.query_cache.stats(),
+        "answer_cache": answer_cache.stats(),
+        "conversation_retrieval": conversation_retrieval.stats(),
+        "single_flight": components.aopenai.flight_stats(),
+        "single_flight_sync": components.openai.flight_stats(),
+        "admission": admission.stats(),
+        "slot_filler": slot_filler.stats.stats(),
+        "prompt_builder": prompt_builder.stats(),
+        "logging": logging_stats(),
+    }
+
+
+@router.get("/metrics", response_class=PlainTextResponse)
+async def prometheus_metrics():
+    """Prometheus exposition: stage / upstream histograms, token and error counters, cache gauges."""
+    gauges = {
+        "admission": admission.stats(),
+        "answer_cache": answer_cache.stats(),
+        "conversation_retrieval": conversation_retrieval.stats(),
+        "slot_filler": slot_filler.stats.stats(),
+        "prompt_builder": prompt_builder.stats(),
+        "logging": logging_stats(),
+    }
+    if components.ready:
+        kb_manager = components.kb_manager
+        gauges.update(kb=kb_manager.info(), retrieval=kb_manager.retriever.stats(),
+                      query_cache=kb_manager.retriever.emb.query_cache.stats(),
+                      single_flight=components.aopenai.flight_stats(),
+                      single_flight_sync=components.openai.flight_stats())
+    return PlainTextResponse(metrics.render(gauges),
+                             media_type="text/plain; version=0.0.4; charset=utf-8")
+
+
+@router.get("/kb", dependencies=[Depends(_require_ready)])
+async def kb_info():
+    """Current KB version (the answer cache is keyed on it) and size."""
+    return components.kb_manager.info()
+
+
+@router.post("/kb/reload", dependencies=[Depends(_require_ready)])
+async def kb_reload(x_admin_token: str | None = Header(default=None)):
+    """Re-parse changed pages, re-embed changed texts and swap the index in."""
+    if not KB_ADMIN_TOKEN:
+        raise HTTPException(404, "KB reload is disabled (no KB_ADMIN_TOKEN set).")
+    if not hmac.compare_digest((x_admin_token or "").encode(), KB_ADMIN_TOKEN.encode()):
+        raise HTTPException(403, "Invalid admin token.")
+    try:
+        return await components.kb_manager.reload()
+    except Exception as exc:
+        logger.exception("KB reload failed")
+        raise HTTPException(500, f"KB reload failed: {exc}")
+
+
+@router.post("/sessions")
+async def create_session():
+    return {"session_id": (await sessions.acreate()).session_id}
+
+
+@router.get("/sessions/{session_id}", response_model=Session)
+async def get_session(session_id: str):
+    session = await sessions.aget(session_id)
+    if session is None:
+        raise HTTPException(404, "Unknown or expired session.")
+    return session
+
+
+@router.delete("/sessions/{session_id}")
+async def delete_session(session_id: str):
+    await sessions.adelete(session_id)
+    return {"deleted": session_id}
+
+
+# ─────────────────────────── Endpoint ────────────────────────────
+@router.post("/chat", response_model=ChatResponse, dependencies=[Depends(_require_ready)])
+async def chat(req: ChatRequest, response: Response):
+    t_start = time.perf_counter()
+    timings: Dict[str, float] = {}
+    metrics.bind_request(timings)
+    try:
+        async with _turn_lock(req):
+            session = await _open_session(req)
+            lang, prompt = _start_turn(req, session)
+
+            def start_reply(msgs, cached=None):
+                reply = _returns(cached) if cached is not None else components.aopenai.chat(msgs)
+                return asyncio.create_task(_timed(reply, "completion"))
 
-        return ChatResponse(**resp_data)
+            profile_dict, ok, reply_task, cached = await _prepare_turn(
+                req, prompt, lang, timings, start_reply)
+            reply = await reply_task
 
-    except HTTPException:
+            metrics.record("total", time.perf_counter() - t_start)
+            logger.info("Turn timings (ms): %s", timings)
+            _count_turn("chat", "ok")
+            if metrics.SERVER_TIMING:
+                response.headers["Server-Timing"] = metrics.server_timing(timings)
+
+            # build response
+            return ChatResponse(**await _response_data(
+                req, reply, profile_dict, ok, timings, session, cached))
+
+    except HTTPException as exc:
+        _count_turn("chat", str(exc.status_code))
         raise
+    except admission.Overloaded as exc:
+        _count_turn("chat", str(exc.status))
+        raise _overloaded(exc)
     except Exception as exc:
+        _count_turn("chat", "500")
         logger.exception("Chat failed")
-        raise HTTPException(500, str(exc))
\ No newline at end of file
+        raise HTTPException(500, str(exc))
+
+
+def _sse(event: Dict) -> str:
+    return f"data: {json.dumps(event, ensure_ascii=False)}\n\n"
+
+
+@router.post("/chat/stream", dependencies=[Depends(_require_ready)])
+async def chat_stream(req: ChatRequest):
+    """
+    Same contract as /chat, streamed as Server-Sent Events:
+      data: {"type": "delta", "content": "..."}     – one per completion delta
+      data: {"type": "done",  ...ChatResponse...}   – final state
+      data: {"type": "error", "detail": "..."}      – on failure
+    """
+    t_start = time.perf_counter()
+    timings: Dict[str, float] = {}
+
+    # fail fast with a real status code before the stream starts
+    if req.session_id is None:
+        _check_phase(req)
+        phase = req.phase
+    else:
+        session = await sessions.aget(req.session_id)
+        if session is None:
+            raise HTTPException(404, "Unknown or expired session.")
+        phase = session.phase
+    try:
+        admission.check(_priority(phase))
+    except admission.Overloaded as exc:
+        _count_turn("chat_stream", str(exc.status))
+        raise _overloaded(exc)
+
+    # deltas are pumped into a per-reply queue so a speculative reply can be
+    # buffered while the extractor is still running, and dropped if discarded
+    async def pump(msgs, queue: asyncio.Queue, cached: str | None) -> str:
+        parts = []
+        deltas = _yields(cached) if cached is not None else components.aopenai.chat_stream(msgs)
+        with metrics.timed("completion"):
+            async for delta in deltas:
+                parts.append(delta)
+                await queue.put(delta)
+        await queue.put(None)
+        return "".join(parts)
+
+    def start_reply(msgs, cached=None):
+        queue: asyncio.Queue = asyncio.Queue()
+        task = asyncio.create_task(pump(msgs, queue, cached))
+        task.queue = queue
+        return task
+
+    async def events():
+        reply_task = None
+        metrics.bind_request(timings)
+        try:
+            async with _turn_lock(req):
+                session = await _open_session(req)
+                lang, prompt = _start_turn(req, session)
+                profile_dict, ok, reply_task, cached = await _prepare_turn(
+                    req, prompt, lang, timings, start_reply)
+
+                while True:
+                    getter = asyncio.create_task(reply_task.queue.get())
+                    done, _ = await asyncio.wait({getter, reply_task},
+                                                 return_when=asyncio.FIRST_COMPLETED)
+                    if getter not in done and reply_task.exception() is not None:
+                        getter.cancel()             # upstream failed mid-stream
+                        raise reply_task.exception()
+                    delta = await getter
+                    if delta is None:
+                        break
+                    if "ttft" not in timings:
+                        metrics.record("ttft", time.perf_counter() - t_start)
+                    yield _sse({"type": "delta", "content": delta})
+
+                reply = await reply_task
+                metrics.record("total", time.perf_counter() - t_start)
+                _count_turn("chat_stream", "ok")
+                logger.info("Stream turn: ttft=%s ms total=%s ms timings=%s",
+                            timings.get("ttft"), timings["total"], timings)
+                resp = ChatResponse(**await _response_data(
+                    req, reply, profile_dict, ok, timings, session, cached))
+                yield _sse({"type": "done", **resp.model_dump()})
+
+        except HTTPException as exc:
+            _count_turn("chat_stream", str(exc.status_code))
+            yield _sse({"type": "error", "status": exc.status_code, "detail": exc.detail})
+        except admission.Overloaded as exc:
+            _count_turn("chat_stream", str(exc.status))
+            yield _sse({"type": "error", "status": exc.status, "detail": exc.detail,
+                        "retry_after": exc.retry_after})
+        except Exception as exc:
+            _count_turn("chat_stream", "500")
+            logger.exception("Chat stream failed")
+            yield _sse({"type": "error", "status": 500, "detail": str(exc)})
+        finally:
+            if reply_task is not None and not reply_task.done():
+                reply_task.cancel()             # client went away
+
+    return StreamingResponse(events(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache",
+                                      "X-Accel-Buffering": "no"})
+
+
+@router.post("/chat/batch", dependencies=[Depends(_require_ready)])
+async def chat_batch(req: BatchRequest):
+    """
+    Stateless QA answers for many (profile, question) items, streamed as
+    JSONL in completion order – one line per item with ``index``, ``id``,
+    ``status`` (ok | timeout | error), ``reply``, latency and token usage.
+    """
+    if not req.items:
+        raise HTTPException(400, "No items.")
+    if len(req.items) > BATCH_MAX_ITEMS:
+        raise HTTPException(413, f"At most {BATCH_MAX_ITEMS} items per batch.")
+    try:
+        admission.check(admission.BATCH)
+        batch = await prepare_batch(req.items, components.kb_manager.retriever, prompt_builder)
+    except admission.Overloaded as exc:
+        raise _overloaded(exc)
+    except Exception as exc:
+        logger.exception("Batch retrieval failed")
+        raise HTTPException(502, f"Retrieval failed: {exc}")
+
+    concurrency = min(req.concurrency or BATCH_CONCURRENCY, BATCH_CONCURRENCY)
+    timeout = req.timeout or BATCH_ITEM_TIMEOUT
+
+    async def lines():
+        async for result in answer_batch(batch, components.aopenai, concurrency, timeout):
+            yield json.dumps(result, ensure_ascii=False) + "\n"
+
+    return StreamingResponse(lines(), media_type="application/x-ndjson")
@@ -0,0 +1,172 @@
+"""
+Bulk QA over (profile, question) items – ``POST /chat/batch`` and the
+offline evaluation runner (run from the repo root):
+
+    python app/batch.py eval.jsonl --out results.jsonl
+
+Every question of a batch goes out in one embedding request and is ranked
+in one (questions × rows) matrix product; the completions then run
+``concurrency`` at a time, each under its own timeout. Results come out as
+they finish, one JSON object per item with its latency and token usage.
+"""
+from __future__ import annotations
+from pathlib import Path
+from typing import AsyncIterator, Dict, List, Tuple
+import argparse, asyncio, json, os, sys, time
+from models import BatchItem
+from prompt_builder import PromptBuilder
+from prompts import get_system_prompt, profile_prompt
+from utils import detect_lang, query_hmos, query_tiers
+from logger import init_logger
+import admission
+import metrics
+
+logger = init_logger(name="chatbot.batch", level="DEBUG", filename="batch.log")
+
+BATCH_MAX_ITEMS    = int(os.getenv("BATCH_MAX_ITEMS", "256"))       # per request (one embedding call)
+BATCH_CONCURRENCY  = int(os.getenv("BATCH_CONCURRENCY", "8"))       # completions in flight
+BATCH_ITEM_TIMEOUT = float(os.getenv("BATCH_ITEM_TIMEOUT", "60"))   # seconds per completion
+
+
+def _ms(t0: float) -> float:
+    return round((time.perf_counter() - t0) * 1000, 1)
+
+
+class PreparedBatch:
+    """Prompts of a batch, ready for completion."""
+
+    __slots__ = ("items", "messages", "langs", "rows", "retrieval_ms", "t0")
+
+    def __init__(self, items: List[BatchItem], messages: List[List[Dict]], langs: List[str],
+                 rows: List[List[int]], retrieval_ms: float, t0: float):
+        self.items, self.messages, self.langs, self.rows = items, messages, langs, rows
+        self.retrieval_ms, self.t0 = retrieval_ms, t0
+
+
+async def prepare_batch(items: List[BatchItem], retriever, builder: PromptBuilder) -> PreparedBatch:
+    """Retrieve KB context for every item at once and build the QA prompts."""
+    t0 = time.perf_counter()
+    metrics.PHASE.set("qa")
+    admission.begin(admission.BATCH, wait=None)     # after interactive turns, no deadline
+    with metrics.timed("batch_retrieval"):
+        retrieved = await retriever.aretrieve_many(
+            [query_hmos(it.user_info.hmo, it.question) for it in items],
+            [it.question for it in items],
+            [query_tiers(it.user_info.tier, it.question) or None for it in items])
+
+    messages, langs = [], []
+    for item, (ctx, _) in zip(items, retrieved):
+        lang = item.lang or detect_lang(item.question, [])
+        prompt = builder.build(get_system_prompt("qa", lang), [], item.question)
+        prompt.insert(1, "profile", {"role": "system",
+                                     "content": builder.fit("profile", profile_prompt(item.user_info))})
+        prompt.insert(2, "kb", {"role": "system",
+                                "content": builder.fit("kb", f"Knowledge Base:\n{ctx}")})
+        messages.append(prompt.messages)
+        langs.append(lang)
+    return PreparedBatch(items, messages, langs, [rows for _, rows in retrieved], _ms(t0), t0)
+
+
+async def _answer(batch: PreparedBatch, n: int, client, sem: asyncio.Semaphore,
+                  timeout: float) -> Dict:
+    usage: Dict[str, int] = {}
+    metrics.bind_usage(usage)                   # this task's tokens only
+    admission.begin(admission.BATCH, wait=None)   # bounded by the item timeout instead
+    item = batch.items[n]
+    result = {"index": n, "id": item.id, "status": "ok", "reply": None,
+              "lang": batch.langs[n], "kb_rows": batch.rows[n]}
+    async with sem:
+        t1 = time.perf_counter()
+        try:
+            result["reply"] = await asyncio.wait_for(client.chat(batch.messages[n]), timeout)
+        except asyncio.TimeoutError:
+            result["status"] = "timeout"
+        except Exception as exc:
+            result["status"] = "error"
+            result["error"] = f"{type(exc).__name__}: {exc}"
+        result["completion_ms"] = _ms(t1)
+    result.update(retrieval_ms=batch.retrieval_ms, latency_ms=_ms(batch.t0),
+                  prompt_tokens=usage.get("prompt_tokens", 0),
+                  completion_tokens=usage.get("completion_tokens", 0))
+    metrics.TURNS.inc(endpoint="batch", phase="qa", status=result["status"])
+    return result
+
+
+async def answer_batch(batch: PreparedBatch, client, concurrency: int = BATCH_CONCURRENCY,
+                       timeout: float = BATCH_ITEM_TIMEOUT) -> AsyncIterator[Dict]:
+    """
+    Yield one result per item in completion order (``index`` is the item's
+    position). Closing the iterator early cancels the pending completions.
+    """
+    sem = asyncio.Semaphore(max(1, concurrency))
+    tasks = [asyncio.create_task(_answer(batch, n, client, sem, timeout))
+             for n in range(len(batch.items))]
+    status: Dict[str, int] = {}
+    try:
+        for done in asyncio.as_completed(tasks):
+            result = await done
+            status[result["status"]] = status.get(result["status"], 0) + 1
+            yield result
+    finally:
+        for task in tasks:
+            task.cancel()
+        logger.info("Batch of %d items (concurrency %d, timeout %.0f s): %s in %.0f ms",
+                    len(tasks), concurrency, timeout, status, _ms(batch.t0))
+
+
+# ─────────────────────────── CLI ──────────────────────────────
+def _read_items(path: str) -> List[BatchItem]:
+    lines = sys.stdin if path == "-" else open(path, encoding="utf-8")
+    with lines:
+        return [BatchItem.model_validate_json(line) for line in lines if line.strip()]
+
+
+async def _run(items: List[BatchItem], args) -> Tuple[Dict[str, int], Dict[str, int]]:
+    from components import Components
+
+    components = Components(Path(args.data_dir))
+    await asyncio.to_thread(components.init)
+    builder = PromptBuilder()
+    status: Dict[str, int] = {}
+    tokens = {"prompt_tokens": 0, "completion_tokens": 0}
+    out = sys.stdout if args.out == "-" else open(args.out, "w", encoding="utf-8")
+    try:
+        for start in range(0, len(items), BATCH_MAX_ITEMS):
+            batch = await prepare_batch(items[start:start + BATCH_MAX_ITEMS],
+                                        components.kb_manager.retriever, builder)
+            async for result in answer_batch(batch, components.aopenai,
+                                             args.concurrency, args.timeout):
+                result["index"] += start
+                out.write(json.dumps(result, ensure_ascii=False) + "\n")
+                out.flush()
+                status[result["status"]] = status.get(result["status"], 0) + 1
+                for k in tokens:
+                    tokens[k] += result[k]
+    finally:
+        if out is not sys.stdout:
+            out.close()
+        await components.aopenai.aclose()
+    return status, tokens
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline QA evaluation over (profile, question) items.")
+    parser.add_argument("items", help='JSONL, one {"user_info": {...}, "question": "...", '
+                                      '"id"?, "lang"?} per line ("-" → stdin)')
+    parser.add_argument("--out", default="-", help="results JSONL (default stdout)")
+    parser.add_argument("--concurrency", type=int, default=BATCH_CONCURRENCY)
+    parser.add_argument("--timeout", type=float, default=BATCH_ITEM_TIMEOUT,
+                        help="seconds per completion")
+    parser.add_argument("--data-dir", default="phase2_data")
+    args = parser.parse_args()
+
+    items = _read_items(args.items)
+    t0 = time.perf_counter()
+    status, tokens = asyncio.run(_run(items, args))
+    print(f"{len(items)} items in {time.perf_counter() - t0:.1f} s: {status}, "
+          f"{tokens['prompt_tokens']} prompt / {tokens['completion_tokens']} completion tokens",
+          file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
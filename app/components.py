@@ -0,0 +1,133 @@
+"""
+Backend components (Azure clients, KB + retriever) built off the import path.
+
+The API process binds its port first; :meth:`Components.start` then builds
+everything in a worker thread, starts the background jobs (KB watcher,
+periodic jobs registered with :meth:`Components.every`) and ``GET /ready``
+turns 200 once it is done.
+Scripts that import ``api`` without a server get the same objects lazily on
+first attribute access.
+"""
+from __future__ import annotations
+from pathlib import Path
+from typing import Callable, Dict, List, Tuple
+import asyncio, threading, time
+from kb_reload import KnowledgeBaseManager
+from kb_snapshot import KB_SNAPSHOT, restore
+from logger import init_logger
+import openai_client
+
+logger = init_logger(name="chatbot.components", level="DEBUG", filename="components.log")
+
+
+class Components:
+    def __init__(self, data_dir: Path, snapshot: Path | None = KB_SNAPSHOT):
+        self.data_dir = Path(data_dir)
+        self.snapshot = Path(snapshot) if snapshot else None
+        self._lock = threading.Lock()
+        self._ready = threading.Event()
+        self._openai = self._aopenai = self._kb_manager = None
+        self.error: str | None = None
+        self.startup: Dict[str, float] = {}     # stage → ms
+        self._task: asyncio.Task | None = None
+        self._jobs: List[Tuple[str, float, Callable[[], object]]] = []
+        self._job_tasks: List[asyncio.Task] = []
+
+    @property
+    def ready(self) -> bool:
+        return self._ready.is_set()
+
+    # ────────────────── build ──────────────────
+    def init(self):
+        """Build every component once (thread-safe, idempotent)."""
+        if self._ready.is_set():
+            return
+        with self._lock:
+            if self._ready.is_set():
+                return
+            t0 = time.perf_counter()
+            # sync client builds the KB index (startup / reload); async one serves requests
+            self._openai = openai_client.AzureOpenAIClient()
+            self._aopenai = openai_client.AsyncAzureOpenAIClient()
+            self.startup["clients"] = round((time.perf_counter() - t0) * 1000, 1)
+
+            t1 = time.perf_counter()
+            snapshot_kb = restore(self.snapshot, self.data_dir,
+                                  self._openai.embedding_deployment)
+            self.startup["snapshot"] = round((time.perf_counter() - t1) * 1000, 1)
+
+            t2 = time.perf_counter()
+            self._kb_manager = KnowledgeBaseManager(self.data_dir, self._openai,
+                                                    async_client=self._aopenai,
+                                                    snapshot=snapshot_kb)
+            self.startup["kb_index"] = round((time.perf_counter() - t2) * 1000, 1)
+            self.startup["total"] = round((time.perf_counter() - t0) * 1000, 1)
+            self.startup["from_snapshot"] = float(snapshot_kb is not None)
+            self._ready.set()
+            logger.info("Backend ready: %s", self.startup)
+
+    async def start(self):
+        """Build off the event loop, then start background jobs (KB watcher)."""
+        try:
+            await asyncio.to_thread(self.init)
+        except Exception as exc:
+            self.error = str(exc)
+            logger.exception("Backend initialization failed")
+            return
+        self._kb_manager.start_watcher()
+        loop = asyncio.get_running_loop()
+        self._job_tasks = [loop.create_task(self._repeat(*job)) for job in self._jobs]
+
+    # ────────────────── periodic jobs ──────────────────
+    def every(self, interval: float, job: Callable[[], object], name: str):
+        """Run *job* (blocking, in a worker thread) every *interval* seconds once started."""
+        if interval > 0:
+            self._jobs.append((name, interval, job))
+
+    async def _repeat(self, name: str, interval: float, job: Callable[[], object]):
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                result = await asyncio.to_thread(job)
+                logger.debug("%s: %s", name, result)
+            except Exception:
+                logger.exception("%s failed", name)
+
+    def launch(self):
+        """Schedule :meth:`start` on the running loop (app lifespan in main.py)."""
+        if self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self.start())
+
+    async def stop(self):
+        # shutdown while still starting: stop start(), then let a running init() finish
+        if self._task is not None and not self._task.done():
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+        await asyncio.to_thread(self._wait_init)
+        for task in self._job_tasks:
+            task.cancel()
+        await asyncio.gather(*self._job_tasks, return_exceptions=True)
+        self._job_tasks = []
+        if self.ready:
+            await self._kb_manager.stop_watcher()
+            await self._aopenai.aclose()
+
+    def _wait_init(self):
+        with self._lock:
+            pass
+
+    # ────────────────── accessors (lazy) ──────────────────
+    @property
+    def openai(self) -> "openai_client.AzureOpenAIClient":
+        self.init()
+        return self._openai
+
+    @property
+    def aopenai(self) -> "openai_client.AsyncAzureOpenAIClient":
+        self.init()
+        return self._aopenai
+
+    @property
+    def kb_manager(self) -> KnowledgeBaseManager:
+        self.init()
+        return self._kb_manager
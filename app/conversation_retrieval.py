@@ -0,0 +1,207 @@
+"""
+Per-conversation retrieval state: QA turns that need no fresh search don't
+get one.
+
+Each QA message is classified locally (no model call):
+
+* small talk – "thanks", "ok", "תודה רבה" → no KB context at all
+* follow-up with the same HMOs – "and for silver?", "how much does it cost?"
+  → the previous turn's rows again (tiers are applied when rendering, so a
+  tier change needs no search either)
+* follow-up naming other HMOs – "ומה לגבי כללית?" → the previous query
+  vector ranked over those HMOs' rows (a local search, no embedding call)
+* anything else → a full retrieval, which becomes the new state
+
+State is kept in-process, keyed by the profile and the user messages so far,
+so the same code serves session and stateless requests; a miss (restart,
+other worker, expired entry) just means a full retrieval.
+"""
+from __future__ import annotations
+from collections import OrderedDict
+from typing import Dict, FrozenSet, List, Sequence, Tuple
+import hashlib, os, re, threading, time
+import numpy as np
+from kb_search import Retriever
+from utils import HMO_NAMES_EN, HMO_NAMES_HE, TIER_NAMES_EN, TIER_NAMES_HE
+from logger import init_logger
+import metrics
+
+logger = init_logger(name="chatbot.conversation_retrieval", level="DEBUG",
+                     filename="conversation_retrieval.log")
+
+CONVERSATION_RETRIEVAL = os.getenv("CONVERSATION_RETRIEVAL", "1") == "1"
+FOLLOWUP_MAX_WORDS     = int(os.getenv("FOLLOWUP_MAX_WORDS", "8"))
+RETRIEVAL_STATE_SIZE   = int(os.getenv("RETRIEVAL_STATE_SIZE", "10000"))
+RETRIEVAL_STATE_TTL    = float(os.getenv("RETRIEVAL_STATE_TTL", "7200"))   # idle seconds
+
+DECISIONS = ("full", "reuse", "narrow", "skip")
+
+# ── vocabularies (Hebrew words also match without a one-letter prefix) ──
+_SMALL_TALK = {
+    "thanks", "thank", "thx", "ty", "you", "ok", "okay", "k", "great", "cool", "perfect",
+    "nice", "good", "awesome", "got", "it", "understood", "i", "see", "bye", "goodbye",
+    "hi", "hello", "hey", "yes", "no", "sure", "alright", "appreciate", "much", "very",
+    "so", "that", "helps", "helpful", "wonderful", "excellent", "fine", "a", "lot",
+    "תודה", "רבה", "אוקיי", "אוקי", "בסדר", "מעולה", "סבבה", "יופי", "שלום", "להתראות",
+    "ביי", "הבנתי", "כן", "לא", "אחלה", "מצוין", "נהדר", "היי", "טוב", "מושלם", "עזרת",
+}
+# words a follow-up may consist of besides HMO / tier names
+_FOLLOWUP = {
+    "and", "also", "what", "about", "how", "for", "with", "in", "on", "under", "the",
+    "a", "an", "is", "it", "that", "this", "same", "then", "there", "much", "many",
+    "does", "do", "cost", "costs", "price", "discount", "coverage", "covered", "cover",
+    "tier", "plan", "level", "members", "member", "me", "my", "if", "i", "was", "were",
+    "would", "be", "of", "at", "get", "hmo", "insured", "or",
+    "מה", "כמה", "לגבי", "עם", "של", "גם", "אם", "זה", "זו", "עולה", "עלות", "מחיר",
+    "הנחה", "כיסוי", "מגיע", "רמה", "רמת", "מסלול", "חברי", "אני", "לי", "יש", "היה",
+    "הייתי", "אצל", "קופת", "חולים", "קופה", "בביטוח", "ביטוח", "עבור", "או",
+}
+_NAMES = {*HMO_NAMES_HE, *HMO_NAMES_EN, *TIER_NAMES_HE, *TIER_NAMES_EN}
+_TOKEN = re.compile(r"[\w'֐-׿]+")
+
+
+def _forms(word: str) -> Tuple[str, ...]:
+    # Hebrew one-letter prefixes (ו/ב/ה/ל/מ/ש/כ), also stacked ("ובמכבי")
+    forms = [word]
+    while len(word) > 2 and word[0] in "ובהלמשכ":
+        word = word[1:]
+        forms.append(word)
+    return tuple(forms)
+
+
+def _known(words: List[str], vocab: set) -> bool:
+    return all(any(f in vocab for f in _forms(w)) for w in words)
+
+
+def is_small_talk(message: str) -> bool:
+    """Thanks / acknowledgements / greetings – nothing to look up."""
+    if "?" in message or any(ch.isdigit() for ch in message):
+        return False
+    return _known(_TOKEN.findall(message.lower()), _SMALL_TALK)
+
+
+def is_followup(message: str) -> bool:
+    """A short message made only of connective / question words and HMO / tier names."""
+    words = _TOKEN.findall(message.lower())
+    return 0 < len(words) <= FOLLOWUP_MAX_WORDS and _known(words, _FOLLOWUP | _NAMES | _SMALL_TALK)
+
+
+def conversation_key(profile_id: str, history: Sequence[Dict], message: str | None = None) -> str:
+    """Key of a conversation at a point in time: profile + user messages so far."""
+    h = hashlib.sha256(profile_id.encode("utf-8"))
+    for m in history:
+        if m.get("role") == "user":
+            h.update(b"\0" + m["content"].encode("utf-8"))
+    if message is not None:
+        h.update(b"\0" + message.encode("utf-8"))
+    return h.hexdigest()
+
+
+class RetrievalState:
+    """What the last full / narrowed retrieval of a conversation used."""
+
+    __slots__ = ("kb_version", "query", "q_vec", "hmos", "rows",
+                 "turns", "embeds_avoided", "searches_avoided")
+
+    def __init__(self, kb_version: str, query: str, q_vec: np.ndarray | None,
+                 hmos: FrozenSet[str], rows: List[int]):
+        self.kb_version, self.query, self.q_vec = kb_version, query, q_vec
+        self.hmos, self.rows = hmos, rows
+        self.turns = self.embeds_avoided = self.searches_avoided = 0
+
+
+class ConversationRetrieval:
+    """Bounded LRU + idle-TTL map of conversation key → :class:`RetrievalState`."""
+
+    def __init__(self, max_size: int = RETRIEVAL_STATE_SIZE, ttl: float = RETRIEVAL_STATE_TTL,
+                 enabled: bool = CONVERSATION_RETRIEVAL):
+        self.max_size, self.ttl, self.enabled = max_size, ttl, enabled
+        self._data: "OrderedDict[str, Tuple[float, RetrievalState]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.decisions = dict.fromkeys(DECISIONS, 0)
+        self.conversations = self.embeds_avoided = self.searches_avoided = 0
+
+    def _pop(self, key: str) -> RetrievalState | None:
+        with self._lock:
+            entry = self._data.pop(key, None)
+        if entry is None or time.time() - entry[0] > self.ttl:
+            return None
+        return entry[1]
+
+    def _put(self, key: str, state: RetrievalState):
+        with self._lock:
+            self._data[key] = (time.time(), state)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+
+    def plan(self, state: RetrievalState | None, message: str,
+             hmos: FrozenSet[str], kb_version: str) -> str:
+        """One of :data:`DECISIONS` for *message* given the conversation's state."""
+        if not self.enabled:
+            return "full"
+        if is_small_talk(message):
+            return "skip"
+        if state is None or state.kb_version != kb_version or not is_followup(message):
+            return "full"
+        return "reuse" if hmos == state.hmos else "narrow"
+
+    async def retrieve(self, retriever: Retriever, profile_id: str, history: Sequence[Dict],
+                       message: str, query: str, hmos: List[str], tiers: List[str] | None
+                       ) -> Tuple[str | None, List[int], np.ndarray | None, str]:
+        """
+        (KB context or None for small talk, rows used, normalized embedding of
+        *message* or None when none was made, decision) for this QA turn.
+        """
+        kb_version = retriever.emb.kb_version
+        hmo_set = frozenset(hmos)
+        state = self._pop(conversation_key(profile_id, history))
+        decision = self.plan(state, message, hmo_set, kb_version)
+
+        ctx, rows, key_vec = None, [], None
+        embeds = searches = 1                       # avoided by this turn
+        if decision == "full":
+            ctx, rows, q_vec, key_vec = await retriever.aretrieve(hmos, query, message, tiers)
+            previous, state = state, RetrievalState(kb_version, query, q_vec, hmo_set, rows)
+            if previous is not None:
+                state.turns, state.embeds_avoided, state.searches_avoided = \
+                    previous.turns, previous.embeds_avoided, previous.searches_avoided
+            else:
+                self.conversations += 1
+            embeds = searches = 0
+        elif decision == "reuse":
+            rows = state.rows
+            ctx = retriever.context(rows, tiers)
+        elif decision == "narrow":
+            rows = retriever.rank(hmos, state.query, state.q_vec)
+            ctx = retriever.context(rows, tiers)
+            state.hmos, state.rows = hmo_set, rows
+            searches = 0
+
+        self.decisions[decision] += 1
+        self.embeds_avoided += embeds
+        self.searches_avoided += searches
+        metrics.RETRIEVAL_DECISIONS.inc(decision=decision)
+        if state is not None:
+            state.turns += 1
+            state.embeds_avoided += embeds
+            state.searches_avoided += searches
+            self._put(conversation_key(profile_id, history, message), state)
+            logger.info("Retrieval %s (conversation: %d QA turns, %d embedding / %d search "
+                        "calls avoided)", decision, state.turns, state.embeds_avoided,
+                        state.searches_avoided)
+        return ctx, rows, key_vec, decision
+
+    def stats(self) -> Dict[str, float]:
+        with self._lock:
+            size = len(self._data)
+        return {
+            "size":             size,
+            **{f"{d}_turns": n for d, n in self.decisions.items()},
+            "conversations":    self.conversations,
+            "embeds_avoided":   self.embeds_avoided,
+            "searches_avoided": self.searches_avoided,
+            "embeds_avoided_per_conversation":
+                self.embeds_avoided / self.conversations if self.conversations else 0.0,
+            "searches_avoided_per_conversation":
+                self.searches_avoided / self.conversations if self.conversations else 0.0,
+        }
@@ -1,7 +1,7 @@
 from __future__ import annotations
 from pathlib import Path
-from typing import List, Dict
-import re
+from typing import Dict, Iterable, List, Tuple
+import hashlib, re
 from bs4 import BeautifulSoup, Tag
 from logger import init_logger
 
@@ -9,13 +9,49 @@ from logger import init_logger
 logger = init_logger(name="chatbot.rag", level="DEBUG", filename="rag.log")
 
 HMO_NAMES = ["מכבי", "מאוחדת", "כללית"]
+TIER_NAMES = ["זהב", "כסף", "ארד"]
 
 class ChunkedKnowledgeBase:
-    """Parses the HTML knowledge base into ready-to-embed text chunks."""
+    """
+    Parses the HTML knowledge base into ready-to-embed text chunks (one per
+    page × HMO) and row-level records (one per page × HMO × treatment, with
+    the benefit of every tier kept apart).
 
-    def __init__(self, data_dir: Path):
+    With *previous* given, pages whose file content is unchanged are reused
+    from it instead of being parsed again (``changed_files`` lists the rest).
+    """
+
+    def __init__(self, data_dir: Path, previous: "ChunkedKnowledgeBase | None" = None):
+        self.data_dir = Path(data_dir)
         self.chunks: List[Dict] = []
-        self._load(data_dir)
+        self.records: List[Dict] = []
+        # file name → (content sha256, chunks, records)
+        self.files: Dict[str, Tuple[str, List[Dict], List[Dict]]] = {}
+        self.changed_files: List[str] = []
+        self._load(self.data_dir, previous)
+        self.version = self.content_version(self.chunks)
+
+    @classmethod
+    def from_files(cls, data_dir: Path,
+                   files: Dict[str, Tuple[str, List[Dict], List[Dict]]]) -> "ChunkedKnowledgeBase":
+        """Rebuild a KB from already-parsed pages (e.g. a snapshot) without touching the HTML."""
+        kb = cls.__new__(cls)
+        kb.data_dir = Path(data_dir)
+        kb.files = dict(files)
+        kb.changed_files = []
+        kb.chunks = [c for _, chunks, _ in kb.files.values() for c in chunks]
+        kb.records = [r for _, _, records in kb.files.values() for r in records]
+        kb.version = cls.content_version(kb.chunks)
+        return kb
+
+    @staticmethod
+    def content_version(chunks: List[Dict]) -> str:
+        """Short content hash of all chunks – changes whenever any chunk text does."""
+        h = hashlib.sha256()
+        for c in chunks:
+            h.update(c["text"].encode("utf-8"))
+            h.update(b"\0")
+        return h.hexdigest()[:12]
 
     # ────────────────────────────────────────────────────────────────
     # Helpers
@@ -30,77 +66,136 @@ class ChunkedKnowledgeBase:
         """Return the column index inside <table> for the wanted HMO."""
         return {"מכבי": 1, "מאוחדת": 2, "כללית": 3}[hmo]
 
+    @staticmethod
+    def _tier_benefits(cell: str) -> Dict[str, str]:
+        """'זהב: … כסף: … ארד: …' → {tier: benefit}."""
+        parts = re.split(rf"({'|'.join(TIER_NAMES)}):", cell)
+        return {parts[i]: parts[i + 1].strip() for i in range(1, len(parts) - 1, 2)}
+
+    @staticmethod
+    def render_records(records: Iterable[Dict], tiers: List[str] | None = None) -> str:
+        """
+        Context text for *records*: grouped by (topic, HMO) in rank order, only
+        the benefits of *tiers* (all tiers when None), phone / URL once per group.
+        """
+        groups: Dict[tuple, List[Dict]] = {}
+        for r in records:
+            groups.setdefault((r["topic"], r["hmo"]), []).append(r)
+
+        blocks = []
+        for (topic, hmo), rows in groups.items():
+            lines = [f"{topic} | {hmo}"]
+            for r in rows:
+                benefits = " ".join(f"{t}: {b}" for t, b in r["benefits"].items()
+                                    if tiers is None or t in tiers)
+                lines.append(f"• {r['treatment']} – {benefits}")
+            if rows[0]["phone"]:
+                lines.append(f"טלפון להזמנת טיפולים: {rows[0]['phone']}")
+            if rows[0]["url"]:
+                lines.append(f"מידע נוסף: {rows[0]['url']}")
+            blocks.append("\n".join(lines))
+        return "\n\n".join(blocks)
+
     # ────────────────────────────────────────────────────────────────
     # Loader
     # ────────────────────────────────────────────────────────────────
-    def _load(self, data_dir: Path):
+    def _load(self, data_dir: Path, previous: "ChunkedKnowledgeBase | None" = None):
         logger.info("Initializing ChunkedKnowledgeBase with %s", data_dir)
-        for html_path in data_dir.glob("*.html"):
-            soup  = BeautifulSoup(html_path.read_text("utf-8"), "html.parser")
-            topic = self._clean(soup.h2.get_text())
-
-            # full-page description = every <p> before the first <table>
-            first_table = soup.find("table")
-            desc_parts  = []
-            for elem in first_table.find_previous_siblings():
-                if isinstance(elem, Tag) and elem.name == "p":
-                    desc_parts.insert(0, self._clean(elem.get_text()))
-            page_desc = " ".join(desc_parts)
-
-            # treatment table → dict[hmo] = list[str]
-            treatments_per_hmo: Dict[str, List[str]] = {h: [] for h in HMO_NAMES}
-            rows = first_table.find_all("tr")[1:]       # skip header
-            for row in rows:
-                cells = [self._clean(td.get_text(" ", strip=True))
-                         for td in row.find_all("td")]
-                treatment = cells[0]
-                for hmo in HMO_NAMES:
-                    benefit = cells[self._hmo_index(hmo)]
-                    treatments_per_hmo[hmo].append(f"{treatment} – {benefit}")
-
-            # phone numbers section (under the <h3> containing 'מספרי טלפון')
-            phone_map = {h: "" for h in HMO_NAMES}
-            phone_h3  = soup.find("h3",
-                                  string=lambda t: t and "מספרי טלפון" in t)
-            if phone_h3:
-                for li in phone_h3.find_next("ul").find_all("li"):
-                    txt = self._clean(li.get_text())
-                    for hmo in HMO_NAMES:
-                        if txt.startswith(hmo):
-                            phone_map[hmo] = txt.split(":", 1)[1].strip()
-
-            # “לפרטים נוספים” → extra phone/url
-            url_map   = {h: "" for h in HMO_NAMES}
-            details_h3 = soup.find("h3",
-                                   string=lambda t: t and "לפרטים נוספים" in t)
-            if details_h3:
-                for li in details_h3.find_next("ul").find_all("li"):
-                    hmo_name = next((h for h in HMO_NAMES if li.text.strip().startswith(h)), None)
-                    if not hmo_name:
-                        continue
-                    link = li.find("a")
-                    if link:
-                        url_map[hmo_name] = link["href"]
-
-            # build final chunk per HMO
+        old = previous.files if previous is not None else {}
+        for html_path in sorted(data_dir.glob("*.html")):
+            raw = html_path.read_bytes()
+            digest = hashlib.sha256(raw).hexdigest()
+            if html_path.name in old and old[html_path.name][0] == digest:
+                _, chunks, records = old[html_path.name]
+            else:
+                chunks, records = self._parse_page(raw.decode("utf-8"))
+                self.changed_files.append(html_path.name)
+            self.files[html_path.name] = (digest, chunks, records)
+            self.chunks.extend(chunks)
+            self.records.extend(records)
+
+        logger.info("Loaded %d chunks, %d records (%d files parsed, %d reused)",
+                    len(self.chunks), len(self.records),
+                    len(self.changed_files), len(self.files) - len(self.changed_files))
+
+    def _parse_page(self, html: str) -> Tuple[List[Dict], List[Dict]]:
+        """One HTML page → (chunks, records) for every HMO."""
+        chunks: List[Dict] = []
+        records: List[Dict] = []
+        soup  = BeautifulSoup(html, "html.parser")
+        topic = self._clean(soup.h2.get_text())
+
+        # full-page description = every <p> before the first <table>
+        first_table = soup.find("table")
+        desc_parts  = []
+        for elem in first_table.find_previous_siblings():
+            if isinstance(elem, Tag) and elem.name == "p":
+                desc_parts.insert(0, self._clean(elem.get_text()))
+        page_desc = " ".join(desc_parts)
+
+        # treatment table → dict[hmo] = list[str]
+        treatments_per_hmo: Dict[str, List[str]] = {h: [] for h in HMO_NAMES}
+        records_per_hmo: Dict[str, List[Dict]] = {h: [] for h in HMO_NAMES}
+        rows = first_table.find_all("tr")[1:]       # skip header
+        for row in rows:
+            cells = [self._clean(td.get_text(" ", strip=True))
+                     for td in row.find_all("td")]
+            treatment = cells[0]
             for hmo in HMO_NAMES:
-                chunk_lines = [
-                    f"{topic} | {hmo}",
-                    page_desc,
-                    "",
-                    "טיפולים והטבות",
-                    *[f"• {line}" for line in treatments_per_hmo[hmo]],
-                ]
-                if phone_map[hmo]:
-                    chunk_lines += ["", f"טלפון להזמנת טיפולים: {phone_map[hmo]}"]
-                if url_map[hmo]:
-                    chunk_lines += [f"מידע נוסף: {url_map[hmo]}"]
-
-                chunk_text = "\n".join(chunk_lines)
-                self.chunks.append({"hmo": hmo, "topic": topic, "text": chunk_text})
-
-                # debug log
-                logger.info("Chunk built: %s | %s (%d chars)",
-                          hmo, topic, len(chunk_text))
-
-        logger.info("Loaded %d chunks", len(self.chunks))
\ No newline at end of file
+                benefit = cells[self._hmo_index(hmo)]
+                treatments_per_hmo[hmo].append(f"{treatment} – {benefit}")
+                records_per_hmo[hmo].append({
+                    "hmo": hmo, "topic": topic, "treatment": treatment,
+                    "benefits": self._tier_benefits(benefit),
+                    "text": f"{topic} | {hmo} | {treatment} – {benefit}",
+                })
+
+        # phone numbers section (under the <h3> containing 'מספרי טלפון')
+        phone_map = {h: "" for h in HMO_NAMES}
+        phone_h3  = soup.find("h3",
+                              string=lambda t: t and "מספרי טלפון" in t)
+        if phone_h3:
+            for li in phone_h3.find_next("ul").find_all("li"):
+                txt = self._clean(li.get_text())
+                for hmo in HMO_NAMES:
+                    if txt.startswith(hmo):
+                        phone_map[hmo] = txt.split(":", 1)[1].strip()
+
+        # “לפרטים נוספים” → extra phone/url
+        url_map   = {h: "" for h in HMO_NAMES}
+        details_h3 = soup.find("h3",
+                               string=lambda t: t and "לפרטים נוספים" in t)
+        if details_h3:
+            for li in details_h3.find_next("ul").find_all("li"):
+                hmo_name = next((h for h in HMO_NAMES if li.text.strip().startswith(h)), None)
+                if not hmo_name:
+                    continue
+                link = li.find("a")
+                if link:
+                    url_map[hmo_name] = link["href"]
+
+        # build final chunk per HMO
+        for hmo in HMO_NAMES:
+            chunk_lines = [
+                f"{topic} | {hmo}",
+                page_desc,
+                "",
+                "טיפולים והטבות",
+                *[f"• {line}" for line in treatments_per_hmo[hmo]],
+            ]
+            if phone_map[hmo]:
+                chunk_lines += ["", f"טלפון להזמנת טיפולים: {phone_map[hmo]}"]
+            if url_map[hmo]:
+                chunk_lines += [f"מידע נוסף: {url_map[hmo]}"]
+
+            chunk_text = "\n".join(chunk_lines)
+            chunks.append({"hmo": hmo, "topic": topic, "text": chunk_text})
+            for record in records_per_hmo[hmo]:
+                record.update(phone=phone_map[hmo], url=url_map[hmo])
+                records.append(record)
+
+            # debug log
+            logger.debug("Chunk built: %s | %s (%d chars)",
+                         hmo, topic, len(chunk_text))
+
+        return chunks, records
@@ -0,0 +1,275 @@
+from __future__ import annotations
+from pathlib import Path
+from typing import Callable, Dict, List, Sequence, Tuple
+import argparse, hashlib, inspect, json, os, struct, sys
+import numpy as np
+from logger import init_logger
+
+logger = init_logger(name="chatbot.embedding_store", level="DEBUG", filename="embedding_store.log")
+
+CACHE_DIR = Path(os.getenv("EMBED_CACHE_DIR", Path(__file__).parent / "embed_cache"))
+# serve.py workers: the supervisor owns the store, a missing vector is an error
+READ_ONLY = os.getenv("EMBED_STORE_READONLY", "0") == "1"
+
+VECTORS_NAME  = "vectors.f32"
+FORMAT_VERSION = 2
+MAGIC = b"EMBSTORE"
+HEADER_ALIGN = 64         # rows start on an aligned offset
+
+
+def text_key(text: str) -> str:
+    """Content address of a chunk (sha256 of its UTF-8 text)."""
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def _normalize(mat: np.ndarray) -> np.ndarray:
+    mat = np.asarray(mat, dtype=np.float32)
+    return mat / (np.linalg.norm(mat, axis=1, keepdims=True) + 1e-8)
+
+
+class EmbeddingStore:
+    """
+    On-disk, content-addressed embedding cache.
+
+    One file per embedding deployment, ``<deployment>/vectors.f32``:
+      * header – MAGIC, uint32 length, then the JSON manifest
+        {"version", "deployment", "dim", "keys": [sha256, ...]} padded to 64 bytes
+      * rows   – row-major float32 matrix (len(keys) × dim), L2-normalized
+
+    Key order and vectors live in the same file, so a rewrite is a single
+    ``os.replace`` and a reader can never pair one version's keys with
+    another version's rows.
+
+    The matrix is opened with ``np.memmap`` so a warm start costs no copy and
+    no network round trip; only new/changed chunk texts are sent to the model.
+    """
+
+    def __init__(self, deployment: str, root: Path = CACHE_DIR, read_only: bool = READ_ONLY):
+        self.deployment = deployment or "default"
+        self.dir = Path(root) / self.deployment.replace("/", "_")
+        self.read_only = read_only
+        self.keys: List[str] = []
+        self.dim: int = 0
+        self.vectors: np.ndarray = np.zeros((0, 0), dtype=np.float32)
+        self._row: Dict[str, int] = {}
+        self._load()
+
+    # ────────────────────────────────────────────────────────────────
+    # Disk I/O
+    # ────────────────────────────────────────────────────────────────
+    @property
+    def vectors_path(self) -> Path:
+        return self.dir / VECTORS_NAME
+
+    def _load(self):
+        try:
+            with open(self.vectors_path, "rb") as f:
+                head = f.read(len(MAGIC) + 4)
+                if len(head) < len(MAGIC) + 4 or head[:len(MAGIC)] != MAGIC:
+                    raise ValueError("no header")
+                (size,) = struct.unpack("<I", head[len(MAGIC):])
+                manifest = json.loads(f.read(size).decode("utf-8"))
+                offset = f.tell()
+                total = os.fstat(f.fileno()).st_size
+        except FileNotFoundError:
+            logger.info("No embedding store at %s", self.dir)
+            return
+        except (OSError, ValueError, struct.error):
+            logger.warning("Unreadable header in %s, ignoring store", self.vectors_path)
+            return
+        if (manifest.get("version") != FORMAT_VERSION
+                or manifest.get("deployment") != self.deployment):
+            logger.warning("Embedding store %s does not match deployment %s, ignoring",
+                           self.dir, self.deployment)
+            return
+
+        keys, dim = manifest["keys"], int(manifest["dim"])
+        if total != offset + len(keys) * dim * 4:
+            logger.warning("Embedding store %s is truncated, ignoring", self.dir)
+            return
+
+        self.keys, self.dim = keys, dim
+        self.vectors = (np.memmap(self.vectors_path, dtype=np.float32, mode="r",
+                                  offset=offset, shape=(len(keys), dim))
+                        if keys else np.zeros((0, dim), dtype=np.float32))
+        self._row = {k: i for i, k in enumerate(keys)}
+        logger.info("Loaded %d cached embeddings (dim=%d) from %s",
+                    len(keys), dim, self.dir)
+
+    def _write(self, keys: List[str], vectors: np.ndarray):
+        """Atomically replace the store with the given rows (header + rows, one rename)."""
+        self.dir.mkdir(parents=True, exist_ok=True)
+        vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+        manifest = json.dumps({
+            "version": FORMAT_VERSION,
+            "deployment": self.deployment,
+            "dim": int(vectors.shape[1]),
+            "keys": keys,
+        }).encode("utf-8")
+        pad = -(len(MAGIC) + 4 + len(manifest)) % HEADER_ALIGN
+        manifest += b" " * pad
+        tmp = self.vectors_path.with_suffix(".tmp")
+        with open(tmp, "wb") as f:
+            f.write(MAGIC + struct.pack("<I", len(manifest)) + manifest)
+            vectors.tofile(f)
+        os.replace(tmp, self.vectors_path)
+        self._load()
+
+    # ────────────────────────────────────────────────────────────────
+    # Public API
+    # ────────────────────────────────────────────────────────────────
+    def missing(self, texts: Sequence[str]) -> List[int]:
+        """Indices of texts that have no cached vector."""
+        return [i for i, t in enumerate(texts) if text_key(t) not in self._row]
+
+    def cached(self, texts: Sequence[str]) -> Tuple[List[str], np.ndarray]:
+        """(keys, vectors) of the texts that have a cached vector, duplicates dropped."""
+        keys = [k for k in dict.fromkeys(text_key(t) for t in texts) if k in self._row]
+        if not keys:
+            return [], np.zeros((0, self.dim), dtype=np.float32)
+        return keys, np.asarray(self.vectors[[self._row[k] for k in keys]])
+
+    def ensure(self,
+               texts: Sequence[str],
+               embed: Callable[[List[str]], List[List[float]]]) -> np.ndarray:
+        """
+        Return normalized vectors for *texts* (one row per text, same order),
+        embedding only the texts not already in the store.
+
+        When the store already holds exactly these texts as its leading rows
+        the returned matrix is a read-only view on the memmap (no copy).
+        """
+        keys = [text_key(t) for t in texts]
+        todo = [i for i, k in enumerate(keys) if k not in self._row]
+
+        if todo and self.read_only:
+            raise RuntimeError(f"{len(todo)}/{len(texts)} texts have no vector in the "
+                               f"read-only embedding store {self.dir}")
+        if todo:
+            logger.info("Embedding %d/%d new or changed chunks", len(todo), len(texts))
+            new_rows = self._embed_rows([texts[i] for i in todo], [keys[i] for i in todo], embed)
+
+            # wanted rows first (in request order) so the next start is zero-copy,
+            # then everything else we already had
+            order = list(dict.fromkeys(keys))
+            wanted = set(order)
+            order += [k for k in self.keys if k not in wanted]
+            mat = np.stack([new_rows[k] if k in new_rows else self.vectors[self._row[k]]
+                            for k in order])
+            self._write(order, mat)
+        else:
+            logger.info("All %d chunk embeddings served from cache", len(texts))
+
+        if self.keys[:len(keys)] == keys:
+            return self.vectors[:len(keys)]
+        return np.asarray(self.vectors[[self._row[k] for k in keys]])
+
+    def arrange(self, texts: Sequence[str]):
+        """
+        Move the cached rows of *texts* to the front (in order), so that
+        :meth:`ensure` returns a view on the memmap for them.
+        """
+        keys = [k for k in dict.fromkeys(text_key(t) for t in texts) if k in self._row]
+        if self.keys[:len(keys)] == keys:
+            return
+        wanted = set(keys)
+        order = keys + [k for k in self.keys if k not in wanted]
+        self._write(order, np.asarray(self.vectors[[self._row[k] for k in order]]))
+
+    def _embed_rows(self, texts: List[str], keys: List[str],
+                    embed: Callable[..., List[List[float]]]) -> Dict[str, np.ndarray]:
+        """
+        key → normalized vector for *texts*. Embedders taking ``on_batch``
+        stream batches in as they arrive; if one batch finally fails the rows
+        already received are kept in the store before the error is raised.
+        """
+        if "on_batch" not in inspect.signature(embed).parameters:
+            return dict(zip(keys, _normalize(embed(texts))))
+
+        rows: Dict[str, np.ndarray] = {}
+
+        def on_batch(start: int, vectors: List[List[float]]):
+            rows.update(zip(keys[start:start + len(vectors)], _normalize(vectors)))
+
+        try:
+            embed(texts, on_batch=on_batch)
+        except Exception:
+            if rows:
+                logger.warning("Embedding failed after %d/%d texts; keeping those",
+                               len(rows), len(texts))
+                kept = [k for k in self.keys if k not in rows]
+                self._write(list(rows) + kept,
+                            np.stack([*rows.values(), *(self.vectors[self._row[k]] for k in kept)]))
+            raise
+        return rows
+
+    def check(self, texts: Sequence[str]) -> List[str]:
+        """Return a list of problems with the store for the given texts (empty = OK)."""
+        problems = []
+        if not self.keys:
+            return [f"no embedding store at {self.dir}"]
+        miss = self.missing(texts)
+        if miss:
+            problems.append(f"{len(miss)}/{len(texts)} chunks have no cached embedding")
+        if not np.all(np.isfinite(self.vectors)):
+            problems.append("store contains non-finite values")
+        norms = np.linalg.norm(self.vectors, axis=1)
+        if len(norms) and np.abs(norms - 1).max() > 1e-3:
+            problems.append("store contains non-normalized vectors")
+        return problems
+
+    def stale(self, texts: Sequence[str]) -> int:
+        """Number of cached vectors whose text is no longer in *texts*."""
+        return len(set(self.keys) - {text_key(t) for t in texts})
+
+    def prune(self, texts: Sequence[str]):
+        """Drop every vector whose text is not in *texts*."""
+        keys = [k for k in dict.fromkeys(text_key(t) for t in texts) if k in self._row]
+        if not keys:
+            return
+        self._write(keys, np.asarray(self.vectors[[self._row[k] for k in keys]]))
+
+
+# ─────────────────────────── CLI ────────────────────────────────────
+def main(argv: List[str] | None = None) -> int:
+    from data_loader import ChunkedKnowledgeBase
+
+    parser = argparse.ArgumentParser(description="Pre-build or check the KB embedding store.")
+    parser.add_argument("command", choices=["build", "check"])
+    parser.add_argument("--data-dir", type=Path, default=Path("phase2_data"))
+    parser.add_argument("--cache-dir", type=Path, default=CACHE_DIR)
+    parser.add_argument("--deployment", default=os.getenv("AZURE_OPENAI_EMBEDDING"))
+    parser.add_argument("--prune", action="store_true",
+                        help="drop vectors for chunks no longer in the KB (build only)")
+    args = parser.parse_args(argv)
+
+    # records first: they are the default retrieval unit, so their rows lead (zero-copy)
+    kb = ChunkedKnowledgeBase(args.data_dir)
+    texts = [c["text"] for c in kb.records + kb.chunks]
+    store = EmbeddingStore(args.deployment, args.cache_dir)
+
+    if args.command == "build":
+        from openai_client import AzureOpenAIClient
+        client = AzureOpenAIClient()
+        store.ensure(texts, client.embed)
+        if args.prune:
+            store.prune(texts)
+        print(f"OK: {len(texts)} texts cached in {store.dir}")
+        if client.last_bulk:
+            b = client.last_bulk
+            print(f"    embedded {b['texts']} texts in {b['batches']} batches, {b['seconds']} s "
+                  f"({b['texts_per_s']} texts/s, {b['tokens_per_s']} tokens/s, {b['retries']} retries)")
+        return 0
+
+    problems = store.check(texts)
+    for p in problems:
+        print(f"FAIL: {p}")
+    if not problems:
+        print(f"OK: {len(texts)} texts cached in {store.dir} (dim={store.dim})")
+    if store.stale(texts):
+        print(f"NOTE: {store.stale(texts)} stale vectors (run build --prune)")
+    return 1 if problems else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
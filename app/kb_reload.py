@@ -0,0 +1,137 @@
+"""
+KB hot reload: re-parse changed HTML pages, embed only changed texts, build
+the new index off the request path and swap it in atomically.
+
+Requests take ``manager.retriever`` once per turn, so a turn in flight keeps
+the KB version it started with.
+
+Under ``serve.py`` (several workers) the supervisor is the only process that
+parses and embeds: a worker's reload request is forwarded to it (SIGHUP), and
+workers reload from the snapshot it publishes.
+"""
+from __future__ import annotations
+from pathlib import Path
+from typing import Dict, Tuple
+import asyncio, os, signal, time
+from data_loader import ChunkedKnowledgeBase
+from kb_search import Retriever
+from kb_snapshot import load_snapshot
+from logger import init_logger
+
+logger = init_logger(name="chatbot.kb_reload", level="DEBUG", filename="kb_reload.log")
+
+KB_WATCH_INTERVAL = float(os.getenv("KB_WATCH_INTERVAL", "0"))   # seconds, 0 → no watcher
+KB_ADMIN_TOKEN    = os.getenv("KB_ADMIN_TOKEN", "")              # "" → /kb/reload is disabled
+KB_PUBLISHER_PID  = int(os.getenv("KB_PUBLISHER_PID", "0"))      # set by serve.py for its workers
+
+
+def file_signature(data_dir: Path) -> Dict[str, Tuple[int, int]]:
+    """Cheap change check: file name → (mtime_ns, size) of every page."""
+    return {p.name: (p.stat().st_mtime_ns, p.stat().st_size)
+            for p in sorted(Path(data_dir).glob("*.html"))}
+
+
+class KnowledgeBaseManager:
+    """Owns the current (kb, retriever) pair and replaces it on reload."""
+
+    def __init__(self, data_dir: Path, client, async_client=None,
+                 snapshot: ChunkedKnowledgeBase | None = None):
+        self.data_dir = Path(data_dir)
+        self.client = client
+        self.async_client = async_client
+        self._signature = file_signature(self.data_dir)
+        # a compiled snapshot only saves parsing – changed pages are still re-parsed
+        self.kb = ChunkedKnowledgeBase(self.data_dir, previous=snapshot)
+        self.retriever = Retriever(self.kb, client, async_client=async_client)
+        self.loaded_at = time.time()
+        self.reloads = 0
+        self._lock = asyncio.Lock()
+        self._watcher: asyncio.Task | None = None
+
+    @property
+    def version(self) -> str:
+        return self.kb.version
+
+    def changed(self) -> bool:
+        return file_signature(self.data_dir) != self._signature
+
+    def _build(self, snapshot: Path | None = None
+               ) -> Tuple[ChunkedKnowledgeBase, Retriever | None, Dict[str, Tuple[int, int]]]:
+        """
+        New kb + retriever (None when the content did not change), starting
+        from the published *snapshot* if given. Runs in a worker thread.
+        """
+        signature = file_signature(self.data_dir)
+        previous = self.kb if snapshot is None else load_snapshot(snapshot, self.data_dir)[0]
+        kb = ChunkedKnowledgeBase(self.data_dir, previous=previous)
+        if snapshot is not None:
+            kb.changed_files = sorted(name for name, (digest, _, _) in kb.files.items()
+                                      if self.kb.files.get(name, ("",))[0] != digest)
+        if kb.version == self.kb.version:
+            return kb, None, signature
+        old = self.retriever
+        retriever = Retriever(kb, self.client, async_client=self.async_client,
+                              mode=old.mode, deadline_ms=old.deadline_ms, unit=old.unit,
+                              query_cache=old.emb.query_cache)
+        return kb, retriever, signature
+
+    async def reload(self, snapshot: Path | None = None) -> Dict:
+        """Re-parse / re-embed what changed and swap the index in; returns a summary."""
+        if KB_PUBLISHER_PID and snapshot is None:
+            os.kill(KB_PUBLISHER_PID, signal.SIGHUP)
+            logger.info("KB reload requested from the supervisor (pid %d)", KB_PUBLISHER_PID)
+            return {"version": self.version, "requested": True}
+        async with self._lock:
+            t0 = time.perf_counter()
+            old_version = self.version
+            kb, retriever, signature = await asyncio.to_thread(self._build, snapshot)
+            self._signature = signature
+            if retriever is not None:
+                # one assignment each – readers see either the old or the new pair
+                self.kb, self.retriever = kb, retriever
+                self.loaded_at = time.time()
+                self.reloads += 1
+            result = {
+                "version":       self.version,
+                "previous":      old_version,
+                "swapped":       retriever is not None,
+                "changed_files": kb.changed_files,
+                "ms":            round((time.perf_counter() - t0) * 1000, 1),
+            }
+            logger.info("KB reload: %s", result)
+            return result
+
+    # ────────────────── polling watcher ──────────────────
+    async def _watch(self, interval: float):
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                if self.changed():
+                    await self.reload()
+            except Exception:
+                logger.exception("KB reload failed; keeping version %s", self.version)
+
+    def start_watcher(self, interval: float = KB_WATCH_INTERVAL):
+        if interval > 0 and self._watcher is None and not KB_PUBLISHER_PID:
+            logger.info("Watching %s every %.1f s", self.data_dir, interval)
+            self._watcher = asyncio.get_running_loop().create_task(self._watch(interval))
+
+    async def stop_watcher(self):
+        if self._watcher is not None:
+            self._watcher.cancel()
+            try:
+                await self._watcher
+            except asyncio.CancelledError:
+                pass
+            self._watcher = None
+
+    def info(self) -> Dict:
+        return {
+            "version":   self.version,
+            "files":     len(self.kb.files),
+            "chunks":    len(self.kb.chunks),
+            "records":   len(self.kb.records),
+            "loaded_at": self.loaded_at,
+            "reloads":   self.reloads,
+            "watching":  self._watcher is not None,
+        }
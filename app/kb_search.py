@@ -1,46 +1,276 @@
 from __future__ import annotations
-from typing import List, Dict
+from typing import Dict, Iterable, List, Sequence, Tuple
+import asyncio, os
 import numpy as np
 from data_loader import ChunkedKnowledgeBase
+from embedding_store import EmbeddingStore
+from lexical_index import LexicalIndex, reciprocal_rank_fusion
+from query_cache import QueryEmbeddingCache
+from logger import init_logger
+from metrics import timed
+
+logger = init_logger(name="chatbot.kb_search", level="DEBUG", filename="kb_search.log")
+
+RETRIEVAL_MODES   = ("embedding", "lexical", "hybrid")
+RETRIEVAL_MODE    = os.getenv("RETRIEVAL_MODE", "embedding")
+EMBED_DEADLINE_MS = float(os.getenv("EMBED_DEADLINE_MS", "0"))   # 0 → no deadline
+RETRIEVAL_UNITS   = ("record", "chunk")
+RETRIEVAL_UNIT    = os.getenv("RETRIEVAL_UNIT", "record")        # table rows | whole pages
+RECORD_TOP_K      = int(os.getenv("RECORD_TOP_K", "6"))
+CHUNK_TOP_K       = 3
+
+
+def _normalize(mat: np.ndarray) -> np.ndarray:
+    mat = np.asarray(mat, dtype=np.float32)
+    return mat / (np.linalg.norm(mat, axis=-1, keepdims=True) + 1e-8)
+
+
+def _group_rows(values: List[str]) -> Dict[str, np.ndarray]:
+    """value -> sorted int array of the row indices holding that value."""
+    groups: Dict[str, List[int]] = {}
+    for i, v in enumerate(values):
+        groups.setdefault(v, []).append(i)
+    return {v: np.asarray(rows, dtype=np.int64) for v, rows in groups.items()}
+
+
+def _top_k(scores: np.ndarray, k: int) -> np.ndarray:
+    """Indices of the k best scores, best first (argpartition + small sort)."""
+    if k >= scores.shape[-1]:
+        return np.argsort(-scores, kind="stable")
+    part = np.argpartition(-scores, k - 1)[:k]
+    return part[np.argsort(-scores[part], kind="stable")]
 
 
 class EmbeddingRetriever:
-    """Vector-based search over per-HMO chunks."""
+    """Vector-based search over per-HMO chunks (or any docs with "text" / "hmo" / "topic")."""
 
-    def __init__(self, kb: ChunkedKnowledgeBase, client, top_k: int = 3):
+    def __init__(self, kb: ChunkedKnowledgeBase, client, top_k: int = CHUNK_TOP_K,
+                 store: EmbeddingStore | None = None,
+                 query_cache: QueryEmbeddingCache | None = None,
+                 async_client=None,
+                 docs: List[Dict] | None = None):
         self.client = client
+        self.async_client = async_client
         self.top_k  = top_k
+        self.store  = store or EmbeddingStore(client.embedding_deployment)
+        self.query_cache = query_cache or QueryEmbeddingCache.from_env()
+
+        # Build index once – vectors come back normalized from the on-disk
+        # store, only new/changed chunks are sent to the embedding model
+        docs = kb.chunks if docs is None else docs
+        self.kb_version: str = kb.version
+        self.texts:  List[str] = [c["text"] for c in docs]
+        self.hmos:   List[str] = [c["hmo"] for c in docs]
+        self.topics: List[str] = [c["topic"] for c in docs]
+
+        # one contiguous (n_docs × dim) float32 matrix, rows L2-normalized
+        self.matrix: np.ndarray = self.store.ensure(self.texts, self.client.embed)
+        self.rows_by_hmo:   Dict[str, np.ndarray] = _group_rows(self.hmos)
+        self.rows_by_topic: Dict[str, np.ndarray] = _group_rows(self.topics)
+
+    # ────────────────── helpers ──────────────────
+    def rows_for(self, allowed_hmos: Iterable[str],
+                 topics: Iterable[str] | None = None) -> np.ndarray:
+        """Row indices whose HMO is in *allowed_hmos* (and topic in *topics*, if given)."""
+        empty = np.zeros(0, dtype=np.int64)
+        rows = np.unique(np.concatenate(
+            [self.rows_by_hmo.get(h, empty) for h in allowed_hmos] or [empty]))
+        if topics is not None:
+            rows = np.intersect1d(rows, np.concatenate(
+                [self.rows_by_topic.get(t, empty) for t in topics] or [empty]))
+        return rows
 
-        # Build index once
-        docs  = [c["text"] for c in kb.chunks]
-        metas = [{"hmo": c["hmo"], "text": c["text"]} for c in kb.chunks]
+    @timed("query_embedding")
+    def embed_queries(self, queries: List[str]) -> np.ndarray:
+        """Embed and normalize queries → (len(queries) × dim) matrix (cached)."""
+        return self.query_cache.embed(
+            queries, lambda texts: _normalize(self.client.embed(texts)))
 
-        embeddings = self.client.embed(docs)
-        self.index: List[Dict] = []
-        for vec, meta in zip(embeddings, metas):
-            v = np.asarray(vec, dtype=np.float32)
-            v = v / (np.linalg.norm(v) + 1e-8)
-            self.index.append({**meta, "vec": v})
+    @timed("query_embedding")
+    async def aembed_queries(self, queries: List[str]) -> np.ndarray:
+        """Non-blocking :meth:`embed_queries` through the async client."""
+        async def _embed(texts: List[str]) -> np.ndarray:
+            return _normalize(await self.async_client.embed(texts))
+        return await self.query_cache.aembed(queries, _embed)
 
     # ────────────────── search ──────────────────
-    def search(self, allowed_hmos: List[str], query: str) -> List[str]:
-        q_vec = np.asarray(self.client.embed([query])[0], dtype=np.float32)
-        q_vec = q_vec / (np.linalg.norm(q_vec) + 1e-8)
-
-        scored = [
-            (item["text"], float(np.dot(q_vec, item["vec"])))
-            for item in self.index
-            if item["hmo"] in allowed_hmos
-        ]
-        scored.sort(key=lambda x: x[1], reverse=True)
-        return [text for text, _ in scored[: self.top_k]]
+    @timed("vector_search")
+    def search_vector_rows(self, allowed_hmos: List[str], q_vec: np.ndarray,
+                           topics: List[str] | None = None,
+                           k: int | None = None) -> List[int]:
+        """Row indices of the top-k chunks for an already-normalized query vector."""
+        rows = self.rows_for(allowed_hmos, topics)
+        if not len(rows):
+            return []
+        scores = self.matrix[rows] @ q_vec
+        return rows[_top_k(scores, k or self.top_k)].tolist()
+
+    def search_vector(self, allowed_hmos: List[str], q_vec: np.ndarray,
+                      topics: List[str] | None = None) -> List[str]:
+        """Top-k chunk texts for an already-normalized query vector."""
+        return [self.texts[i] for i in self.search_vector_rows(allowed_hmos, q_vec, topics)]
+
+    def search(self, allowed_hmos: List[str], query: str,
+               topics: List[str] | None = None) -> List[str]:
+        q_vec = self.embed_queries([query])[0]
+        return self.search_vector(allowed_hmos, q_vec, topics)
+
+    async def asearch(self, allowed_hmos: List[str], query: str,
+                      topics: List[str] | None = None) -> List[str]:
+        q_vec = (await self.aembed_queries([query]))[0]
+        return self.search_vector(allowed_hmos, q_vec, topics)
+
+    def search_many(self, allowed_hmos: Sequence[List[str]],
+                    queries: List[str]) -> List[List[str]]:
+        """
+        Batched search: one embedding call and one (queries × chunks) GEMM.
+        ``allowed_hmos[i]`` is the HMO filter for ``queries[i]``.
+        """
+        if not queries:
+            return []
+        return self.search_many_vectors(allowed_hmos, self.embed_queries(queries))
+
+    async def asearch_many(self, allowed_hmos: Sequence[List[str]],
+                           queries: List[str]) -> List[List[str]]:
+        if not queries:
+            return []
+        return self.search_many_vectors(allowed_hmos, await self.aembed_queries(queries))
+
+    def search_many_vectors(self, allowed_hmos: Sequence[List[str]],
+                            q_vecs: np.ndarray) -> List[List[str]]:
+        return [[self.texts[i] for i in rows]
+                for rows in self.search_many_vector_rows(allowed_hmos, q_vecs)]
+
+    @timed("vector_search")
+    def search_many_vector_rows(self, allowed_hmos: Sequence[List[str]], q_vecs: np.ndarray,
+                                k: int | None = None) -> List[List[int]]:
+        """Top-k row indices per query vector, all scored in one (queries × rows) GEMM."""
+        scores = np.asarray(q_vecs, dtype=np.float32) @ self.matrix.T
+        results = []
+        for allowed, row_scores in zip(allowed_hmos, scores):
+            rows = self.rows_for(allowed)
+            if not len(rows):
+                results.append([])
+                continue
+            results.append(rows[_top_k(row_scores[rows], k or self.top_k)].tolist())
+        return results
 
 # ----------------------------------------------------------------------
 # Helper for the RAG chain
 class Retriever:
-    def __init__(self, kb: ChunkedKnowledgeBase, client):
-        self.emb = EmbeddingRetriever(kb, client)
+    """
+    Context builder over the embedding and the BM25 index.
+
+    ``unit`` is what gets ranked: ``record`` (one table row per treatment,
+    rendered with only the tiers the user has or asks about) or ``chunk``
+    (whole page × HMO, every tier).
+
+    ``mode`` picks the ranking: ``embedding``, ``lexical`` (no network call)
+    or ``hybrid`` (reciprocal-rank fusion of both). With ``deadline_ms`` set,
+    an embedding call that misses the deadline falls back to the lexical
+    ranking; the call still completes in the background and fills the query
+    cache for the next time.
+    """
+
+    def __init__(self, kb: ChunkedKnowledgeBase, client, async_client=None,
+                 mode: str = RETRIEVAL_MODE, deadline_ms: float = EMBED_DEADLINE_MS,
+                 store: EmbeddingStore | None = None, unit: str = RETRIEVAL_UNIT,
+                 query_cache: QueryEmbeddingCache | None = None):
+        if mode not in RETRIEVAL_MODES:
+            raise ValueError(f"RETRIEVAL_MODE must be one of {RETRIEVAL_MODES}, got {mode!r}")
+        if unit not in RETRIEVAL_UNITS:
+            raise ValueError(f"RETRIEVAL_UNIT must be one of {RETRIEVAL_UNITS}, got {unit!r}")
+        self.mode = mode
+        self.deadline_ms = deadline_ms
+        self.unit = unit
+        self.docs = kb.records if unit == "record" else kb.chunks
+        top_k = RECORD_TOP_K if unit == "record" else CHUNK_TOP_K
+        # the sync client builds the index; the async one serves queries
+        self.emb = EmbeddingRetriever(kb, client, top_k=top_k, store=store,
+                                      query_cache=query_cache,
+                                      async_client=async_client, docs=self.docs)
+        self.lex = LexicalIndex(self.docs)
+        self.fallbacks = 0
+
+    @timed("rank")
+    def rank(self, hmos: List[str], user_query: str, q_vec: np.ndarray | None) -> List[int]:
+        """Top-k rows for the configured mode (lexical when *q_vec* is None)."""
+        k = self.emb.top_k
+        if self.mode == "lexical" or q_vec is None:
+            return self.lex.search_rows(hmos, user_query, k)
+        if self.mode == "hybrid":
+            return reciprocal_rank_fusion([self.emb.search_vector_rows(hmos, q_vec, k=2 * k),
+                                           self.lex.search_rows(hmos, user_query, 2 * k)], k)
+        return self.emb.search_vector_rows(hmos, q_vec)
+
+    @timed("context")
+    def context(self, rows: List[int], tiers: List[str] | None) -> str:
+        if self.unit == "record":
+            return ChunkedKnowledgeBase.render_records([self.docs[i] for i in rows], tiers)
+        return "\n\n".join(self.emb.texts[i] for i in rows)
+
+    async def _aembed(self, texts: List[str]) -> np.ndarray | None:
+        """Query vectors, or None in lexical mode / when the deadline is missed."""
+        if self.mode == "lexical":
+            return None
+        if not self.deadline_ms:
+            return await self.emb.aembed_queries(texts)
+        task = asyncio.ensure_future(self.emb.aembed_queries(texts))
+        try:
+            return await asyncio.wait_for(asyncio.shield(task), self.deadline_ms / 1000)
+        except asyncio.TimeoutError:
+            self.fallbacks += 1
+            task.add_done_callback(lambda t: t.cancelled() or t.exception())
+            logger.warning("Query embedding missed its %.0f ms deadline – lexical fallback",
+                           self.deadline_ms)
+            return None
+
+    def build_context(self, hmos: List[str], user_query: str,
+                      tiers: List[str] | None = None) -> str:
+        """*tiers*: Hebrew tier names to keep in record mode (None → all)."""
+        q_vec = None if self.mode == "lexical" else self.emb.embed_queries([user_query])[0]
+        return self.context(self.rank(hmos, user_query, q_vec), tiers)
+
+    async def abuild_context(self, hmos: List[str], user_query: str,
+                             tiers: List[str] | None = None) -> str:
+        vecs = await self._aembed([user_query])
+        return self.context(self.rank(hmos, user_query, None if vecs is None else vecs[0]),
+                             tiers)
+
+    async def aretrieve(self, hmos: List[str], user_query: str, key_text: str,
+                        tiers: List[str] | None = None
+                        ) -> Tuple[str, List[int], np.ndarray | None, np.ndarray | None]:
+        """
+        Context for *user_query* plus the rows used and the normalized
+        embeddings of *user_query* and *key_text* – both texts go out in one
+        embedding request. The embeddings are None when none was available
+        (lexical mode, missed deadline).
+        """
+        vecs = await self._aembed([user_query, key_text])
+        q_vec, key_vec = (None, None) if vecs is None else vecs
+        rows = self.rank(hmos, user_query, q_vec)
+        return self.context(rows, tiers), rows, q_vec, key_vec
+
+    async def aretrieve_many(self, hmos: Sequence[List[str]], queries: List[str],
+                             tiers: Sequence[List[str] | None]) -> List[Tuple[str, List[int]]]:
+        """
+        (context, rows) per query: every query goes out in one embedding
+        request and is scored in one matrix product (batch / evaluation path).
+        """
+        if not queries:
+            return []
+        vecs = await self._aembed(queries)
+        k = self.emb.top_k
+        if vecs is None:
+            ranked = [self.lex.search_rows(h, q, k) for h, q in zip(hmos, queries)]
+        elif self.mode == "hybrid":
+            dense = self.emb.search_many_vector_rows(hmos, vecs, k=2 * k)
+            ranked = [reciprocal_rank_fusion([d, self.lex.search_rows(h, q, 2 * k)], k)
+                      for d, h, q in zip(dense, hmos, queries)]
+        else:
+            ranked = self.emb.search_many_vector_rows(hmos, vecs)
+        return [(self.context(rows, t), rows) for rows, t in zip(ranked, tiers)]
 
-    def build_context(self, hmos: List[str], user_query: str) -> str:
-        snippets = self.emb.search(hmos, user_query)
-        return "\n\n".join(snippets)
\ No newline at end of file
+    def stats(self) -> Dict[str, float]:
+        return {"mode": self.mode, "unit": self.unit, "deadline_ms": self.deadline_ms,
+                "lexical_fallbacks": self.fallbacks}
@@ -0,0 +1,109 @@
+"""
+Compiled KB snapshot: parsed pages (+ optionally their embeddings) in one
+``.npz`` file, so the server starts without BeautifulSoup or embedding calls.
+
+    python app/kb_snapshot.py build                  # pages only
+    python app/kb_snapshot.py build --with-vectors   # + vectors from the embedding store
+
+The snapshot is only a head start: page hashes are checked against
+``phase2_data`` at load time and changed pages are parsed as usual.
+"""
+from __future__ import annotations
+from pathlib import Path
+from typing import Dict, List, Tuple
+import argparse, json, os, sys
+import numpy as np
+from data_loader import ChunkedKnowledgeBase
+from embedding_store import EmbeddingStore, text_key
+from logger import init_logger
+
+logger = init_logger(name="chatbot.kb_snapshot", level="DEBUG", filename="kb_snapshot.log")
+
+SNAPSHOT_VERSION = 1
+KB_SNAPSHOT = Path(os.getenv("KB_SNAPSHOT", Path(__file__).parent / "kb_snapshot.npz"))
+
+
+def save_snapshot(kb: ChunkedKnowledgeBase, path: Path,
+                  store: EmbeddingStore | None = None):
+    """Write *kb* (and the vectors *store* holds for its texts) to *path* atomically."""
+    meta = {"snapshot_version": SNAPSHOT_VERSION, "kb_version": kb.version,
+            "files": kb.files, "deployment": None, "keys": []}
+    arrays = {}
+    if store is not None:
+        keys, arrays["vectors"] = store.cached([d["text"] for d in kb.records + kb.chunks])
+        meta["deployment"], meta["keys"] = store.deployment, keys
+    arrays["meta"] = np.frombuffer(json.dumps(meta, ensure_ascii=False).encode("utf-8"),
+                                   dtype=np.uint8)
+    path = Path(path)
+    tmp = path.with_suffix(".tmp.npz")
+    np.savez(tmp, **arrays)
+    os.replace(tmp, path)
+
+
+def load_snapshot(path: Path, data_dir: Path
+                  ) -> Tuple[ChunkedKnowledgeBase, str | None, Dict[str, np.ndarray]]:
+    """(kb as compiled, embedding deployment, text key → vector)."""
+    with np.load(path) as npz:
+        meta = json.loads(npz["meta"].tobytes().decode("utf-8"))
+        if meta.get("snapshot_version") != SNAPSHOT_VERSION:
+            raise ValueError(f"unsupported snapshot version {meta.get('snapshot_version')}")
+        vectors = npz["vectors"] if "vectors" in npz.files else np.zeros((0, 0), np.float32)
+    files = {name: (digest, chunks, records)
+             for name, (digest, chunks, records) in meta["files"].items()}
+    kb = ChunkedKnowledgeBase.from_files(data_dir, files)
+    logger.info("Loaded snapshot %s: KB %s, %d pages, %d vectors (%s)",
+                path, kb.version, len(files), len(meta["keys"]), meta["deployment"])
+    return kb, meta["deployment"], dict(zip(meta["keys"], vectors))
+
+
+def seed_store(store: EmbeddingStore, texts: List[str], vectors: Dict[str, np.ndarray]):
+    """Copy the snapshot *vectors* of *texts* into *store* (texts without one are skipped)."""
+    texts = [t for t in texts if text_key(t) in vectors]
+    if texts:
+        store.ensure(texts, lambda missing: [vectors[text_key(t)] for t in missing])
+
+
+def restore(path: Path | None, data_dir: Path, deployment: str | None
+            ) -> ChunkedKnowledgeBase | None:
+    """
+    The KB compiled in *path*, its vectors copied into the store of
+    *deployment* when they were made by it; None when there is no usable snapshot.
+    """
+    if path is None or not Path(path).exists():
+        return None
+    try:
+        kb, snap_deployment, vectors = load_snapshot(path, data_dir)
+        if vectors and snap_deployment == deployment:
+            seed_store(EmbeddingStore(deployment),
+                       [d["text"] for d in kb.records + kb.chunks], vectors)
+        return kb
+    except Exception:
+        logger.exception("Unusable KB snapshot %s – parsing the HTML", path)
+        return None
+
+
+# ─────────────────────────── CLI ────────────────────────────────────
+def main(argv: List[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description="Compile phase2_data into a KB snapshot.")
+    parser.add_argument("command", choices=["build"])
+    parser.add_argument("--data-dir", type=Path, default=Path("phase2_data"))
+    parser.add_argument("--out", type=Path, default=KB_SNAPSHOT)
+    parser.add_argument("--with-vectors", action="store_true",
+                        help="include the cached vectors of --deployment (run embedding_store build first)")
+    parser.add_argument("--deployment", default=os.getenv("AZURE_OPENAI_EMBEDDING"))
+    args = parser.parse_args(argv)
+
+    kb = ChunkedKnowledgeBase(args.data_dir)
+    store = EmbeddingStore(args.deployment) if args.with_vectors else None
+    save_snapshot(kb, args.out, store)
+    vectors = ""
+    if store is not None:
+        keys, _ = store.cached([d["text"] for d in kb.records + kb.chunks])
+        vectors = f" + {len(keys)} vectors"
+    print(f"OK: {len(kb.files)} pages, {len(kb.chunks)} chunks, {len(kb.records)} records"
+          f"{vectors} → {args.out} ({args.out.stat().st_size / 1024:.0f} KiB)")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
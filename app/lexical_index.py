@@ -0,0 +1,126 @@
+"""
+Local BM25 lexical index over KB chunks or records – no network, sub-millisecond.
+
+Used on its own (``RETRIEVAL_MODE=lexical``), fused with the embedding
+ranking (``hybrid``), or as the fallback when the query embedding misses
+its latency budget.
+"""
+from __future__ import annotations
+from collections import Counter
+from typing import Dict, Iterable, List, Sequence, Tuple
+import math, re
+import numpy as np
+from metrics import timed
+
+_TOKEN = re.compile(r"[a-z]+|[֐-׿]+|\d+")
+_HE_PREFIXES = "והבלמשכ"
+
+_STOPWORDS = {
+    "the", "a", "an", "and", "or", "of", "in", "on", "for", "to", "is", "are", "do",
+    "does", "what", "how", "much", "my", "i", "me", "with", "at", "it", "be", "can",
+    "של", "את", "על", "עם", "זה", "מה", "כמה", "אני", "יש", "לי", "גם", "או", "הם", "הוא", "היא",
+}
+
+# English query words → Hebrew KB vocabulary (the KB is Hebrew-only)
+EN_HE_TERMS: Dict[str, List[str]] = {
+    "dental": ["שיניים"], "dentist": ["שיניים"], "teeth": ["שיניים"], "tooth": ["שיניים"],
+    "cleaning": ["ניקוי"], "filling": ["סתימות"], "fillings": ["סתימות"],
+    "root": ["שורש"], "canal": ["שורש"], "crown": ["כתרים"], "crowns": ["כתרים"],
+    "implant": ["שתלים"], "implants": ["שתלים"], "orthodontics": ["יישור"],
+    "braces": ["יישור"], "whitening": ["הלבנת"],
+    "optometry": ["אופטומטריה"], "eye": ["עיניים", "ראייה"], "eyes": ["עיניים", "ראייה"],
+    "vision": ["ראייה"], "glasses": ["משקפי", "משקפיים"], "lenses": ["עדשות"],
+    "contact": ["מגע"], "laser": ["לייזר"],
+    "pregnancy": ["הריון"], "pregnant": ["הריון"], "ultrasound": ["אולטרסאונד"],
+    "birth": ["לידה"], "prenatal": ["הריון"],
+    "workshop": ["סדנאות", "סדנה"], "workshops": ["סדנאות", "סדנה"],
+    "smoking": ["עישון"], "nutrition": ["תזונה"], "dietitian": ["דיאטנית"],
+    "stress": ["מתח"], "diabetes": ["סוכרת"], "fitness": ["כושר"], "exercise": ["כושר"],
+    "genetic": ["גנטיות", "גנטי"],
+    "alternative": ["משלימה", "אלטרנטיבית"], "complementary": ["משלימה"],
+    "acupuncture": ["דיקור", "אקופונקטורה"], "reflexology": ["רפלקסולוגיה"], "naturopathy": ["נטורופתיה"],
+    "chiropractic": ["כירופרקטיקה"], "shiatsu": ["שיאצו"],
+    "speech": ["דיבור", "תקשורת"], "communication": ["תקשורת"], "stuttering": ["גמגום"],
+    "swallowing": ["בליעה"], "voice": ["קול"], "language": ["שפה"],
+    "phone": ["טלפון"], "price": ["הנחה"], "discount": ["הנחה"], "free": ["חינם"],
+    "gold": ["זהב"], "silver": ["כסף"], "bronze": ["ארד"],
+    "maccabi": ["מכבי"], "meuhedet": ["מאוחדת"], "clalit": ["כללית"],
+}
+
+
+def tokenize(text: str) -> List[str]:
+    """
+    Lower-case Hebrew/English/number tokens without stopwords. Hebrew words
+    longer than 3 letters also emit their form without a one-letter prefix
+    (ב/ה/ו/ל/מ/ש/כ); English words also emit their Hebrew KB terms.
+    """
+    out: List[str] = []
+    for tok in _TOKEN.findall(text.lower()):
+        if tok in _STOPWORDS:
+            continue
+        out.append(tok)
+        if len(tok) > 3 and tok[0] in _HE_PREFIXES:
+            out.append(tok[1:])
+        out.extend(EN_HE_TERMS.get(tok, ()))
+    return out
+
+
+class LexicalIndex:
+    """Inverted index with BM25 scoring and per-HMO row filters over docs with "text" / "hmo"."""
+
+    def __init__(self, docs: Sequence[Dict], k1: float = 1.5, b: float = 0.75):
+        self.k1, self.b = k1, b
+        self.texts: List[str] = [c["text"] for c in docs]
+        self.rows_by_hmo: Dict[str, np.ndarray] = {}
+        for i, c in enumerate(docs):
+            self.rows_by_hmo.setdefault(c["hmo"], []).append(i)
+        self.rows_by_hmo = {h: np.asarray(r, dtype=np.int64) for h, r in self.rows_by_hmo.items()}
+
+        n = len(self.texts)
+        doc_tfs = [Counter(tokenize(t)) for t in self.texts]
+        self.doc_len = np.asarray([sum(tf.values()) for tf in doc_tfs], dtype=np.float32)
+        self.avg_len = float(self.doc_len.mean()) if n else 0.0
+
+        # term → (rows, term frequencies)
+        postings: Dict[str, Tuple[List[int], List[int]]] = {}
+        for row, tf in enumerate(doc_tfs):
+            for term, freq in tf.items():
+                rows, freqs = postings.setdefault(term, ([], []))
+                rows.append(row)
+                freqs.append(freq)
+        self.postings = {t: (np.asarray(r, dtype=np.int64), np.asarray(f, dtype=np.float32))
+                         for t, (r, f) in postings.items()}
+        self.idf = {t: math.log(1 + (n - len(r) + 0.5) / (len(r) + 0.5))
+                    for t, (r, _) in self.postings.items()}
+
+    def scores(self, query: str) -> np.ndarray:
+        """BM25 score of every chunk for *query*."""
+        scores = np.zeros(len(self.texts), dtype=np.float32)
+        norm = self.k1 * (1 - self.b + self.b * self.doc_len / (self.avg_len or 1.0))
+        for term, q_tf in Counter(tokenize(query)).items():
+            if term not in self.postings:
+                continue
+            rows, tf = self.postings[term]
+            scores[rows] += q_tf * self.idf[term] * tf * (self.k1 + 1) / (tf + norm[rows])
+        return scores
+
+    @timed("lexical_search")
+    def search_rows(self, allowed_hmos: Iterable[str], query: str, k: int = 3) -> List[int]:
+        """Top-k rows among the allowed HMOs (rows with score 0 are dropped)."""
+        empty = np.zeros(0, dtype=np.int64)
+        rows = np.unique(np.concatenate(
+            [self.rows_by_hmo.get(h, empty) for h in allowed_hmos] or [empty]))
+        if not len(rows):
+            return []
+        row_scores = self.scores(query)[rows]
+        order = np.argsort(-row_scores, kind="stable")[:k]
+        return [int(rows[i]) for i in order if row_scores[i] > 0]
+
+
+def reciprocal_rank_fusion(rankings: List[List[int]], k: int = 3, c: int = 60) -> List[int]:
+    """Fuse several ranked row lists: score(row) = Σ 1 / (c + rank)."""
+    fused: Dict[int, float] = {}
+    for ranking in rankings:
+        for rank, row in enumerate(ranking):
+            fused[row] = fused.get(row, 0.0) + 1.0 / (c + rank + 1)
+    return sorted(fused, key=lambda r: -fused[r])[:k]
@@ -1,58 +1,239 @@
-import logging, os, sys
+"""
+Logging for all ``chatbot.*`` modules.
+
+Loggers only put records on a bounded queue (``QueueHandler``); one
+background ``QueueListener`` thread formats and writes them, so no disk or
+stdout I/O happens on the event loop. Each logger keeps its own rotating
+file under ``logs/`` (JSON lines by default) and shares the console.
+
+Records carry the ``request_id`` / ``session_id`` bound with
+:func:`bind_context` (contextvars, so they follow asyncio tasks). Large
+messages are truncated and chatty loggers can be sampled; both per logger:
+
+    LOG_MAX_CHARS=2000,chatbot.openai_client=500    # default, then overrides
+    LOG_SAMPLE=chatbot.query_cache=0.1              # keep 10 % below WARNING
+"""
+import atexit, json, logging, logging.handlers, os, queue, random, sys, threading, time
+from contextvars import ContextVar
+from datetime import datetime, timezone
 from pathlib import Path
+from typing import Dict, List, Tuple
 
 
-LOG_DIR = Path(__file__).parent / "logs"
+LOG_DIR = Path(os.getenv("LOG_DIR", Path(__file__).parent / "logs"))
 LOG_DIR.mkdir(exist_ok=True)
 
+LOG_LEVEL         = os.getenv("LOG_LEVEL", "")              # "" → the level each module asks for
+LOG_FORMAT        = os.getenv("LOG_FORMAT", "json")         # json | text (log files)
+LOG_CONSOLE       = os.getenv("LOG_CONSOLE", "1") == "1"
+LOG_CONSOLE_LEVEL = os.getenv("LOG_CONSOLE_LEVEL", "INFO")
+LOG_CONSOLE_FORMAT = os.getenv("LOG_CONSOLE_FORMAT", "text")
+LOG_ROTATE_BYTES  = int(os.getenv("LOG_ROTATE_BYTES", str(10 * 1024 * 1024)))
+LOG_ROTATE_WHEN   = os.getenv("LOG_ROTATE_WHEN", "")        # e.g. midnight | H → time-based
+LOG_BACKUPS       = int(os.getenv("LOG_BACKUPS", "5"))
+LOG_QUEUE_SIZE    = int(os.getenv("LOG_QUEUE_SIZE", "10000"))
+LOG_MAX_CHARS     = os.getenv("LOG_MAX_CHARS", "2000,chatbot.openai_client=500")
+LOG_SAMPLE        = os.getenv("LOG_SAMPLE", "")
+
 
 FMT = "%(asctime)s | %(levelname)-8s | %(name)s | %(message)s"
 
+
+REQUEST_ID: ContextVar[str | None] = ContextVar("log_request_id", default=None)
+SESSION_ID: ContextVar[str | None] = ContextVar("log_session_id", default=None)
+
+
+def bind_context(request_id: str | None = None, session_id: str | None = None):
+    """Tag every record logged from the current context (and its tasks)."""
+    if request_id is not None:
+        REQUEST_ID.set(request_id)
+    if session_id is not None:
+        SESSION_ID.set(session_id)
+
+
+def _per_logger(spec: str, cast) -> Tuple[object, Dict[str, object]]:
+    """``"2000,chatbot.x=500"`` → (2000, {"chatbot.x": 500}); default None when absent."""
+    default, overrides = None, {}
+    for part in filter(None, (p.strip() for p in spec.split(","))):
+        name, sep, value = part.rpartition("=")
+        if sep:
+            overrides[name] = cast(value)
+        else:
+            default = cast(value)
+    return default, overrides
+
+
+# ─────────────────────────── formatting ──────────────────────────────
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        out = {
+            "ts":     datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level":  record.levelname,
+            "logger": record.name,
+            "msg":    record.getMessage(),
+        }
+        for key in ("request_id", "session_id"):
+            if getattr(record, key, None):
+                out[key] = getattr(record, key)
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            out["exc"] = record.exc_text
+        return json.dumps(out, ensure_ascii=False)
+
+
+def _formatter(kind: str) -> logging.Formatter:
+    return JsonFormatter() if kind == "json" else logging.Formatter(FMT)
+
+
+class _Logger(logging.Logger):
+    """``chatbot.*`` logger: no format shows the caller, so the stack is not walked for it."""
+
+    def findCaller(self, stack_info=False, stacklevel=1):
+        return "(unknown file)", 0, "(unknown function)", None
+
+
+# ─────────────────────────── queue plumbing ──────────────────────────────
+class _QueueHandler(logging.handlers.QueueHandler):
+    """
+    Caller-side half: sampling, ids, message rendering and truncation, then a
+    non-blocking put – a full queue drops the record (counted).
+    """
+
+    dropped = 0
+
+    def __init__(self, q: queue.Queue, name: str):
+        super().__init__(q)
+        default_chars, chars = _per_logger(LOG_MAX_CHARS, int)
+        default_rate, rates = _per_logger(LOG_SAMPLE, float)
+        self.max_chars = chars.get(name, default_chars)
+        self.sample = rates.get(name, default_rate)
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if (self.sample is not None and record.levelno < logging.WARNING
+                and random.random() >= self.sample):
+            return False
+        return super().filter(record)
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # args are rendered now (they may change later); the traceback is
+        # formatted by the writer thread. The record is ours alone – no copy.
+        message = record.getMessage()
+        if self.max_chars and len(message) > self.max_chars:
+            message = f"{message[:self.max_chars]}… [{len(message)} chars]"
+        record.msg, record.args, record.message = message, None, message
+        record.request_id = REQUEST_ID.get()
+        record.session_id = SESSION_ID.get()
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            _QueueHandler.dropped += 1
+
+
+class _Router(logging.Handler):
+    """Listener-side handler: the logger's own file(s) plus the shared console."""
+
+    def __init__(self):
+        super().__init__()
+        self.routes: Dict[str, List[logging.Handler]] = {}
+        self.console: logging.Handler | None = None
+
+    def handle(self, record: logging.LogRecord):
+        handlers = self.routes.get(record.name, [])
+        if self.console is not None:
+            handlers = handlers + [self.console]
+        for h in handlers:
+            if record.levelno >= h.level:
+                h.handle(record)
+
+    def close(self):
+        for h in [*(h for hs in self.routes.values() for h in hs), self.console]:
+            if h is not None:
+                h.close()
+        super().close()
+
+
+_queue: "queue.Queue[logging.LogRecord]" = queue.Queue(LOG_QUEUE_SIZE)
+_router = _Router()
+_listener: logging.handlers.QueueListener | None = None
+_lock = threading.Lock()
+
+
+def _start():
+    global _listener
+    if _listener is not None:
+        return
+    if LOG_CONSOLE:
+        console = logging.StreamHandler(sys.stdout)
+        console.setLevel(LOG_CONSOLE_LEVEL)
+        console.setFormatter(_formatter(LOG_CONSOLE_FORMAT))
+        _router.console = console
+    _listener = logging.handlers.QueueListener(_queue, _router)
+    _listener.start()
+    atexit.register(shutdown)
+
+
+def shutdown():
+    """Flush the queue and stop the writer thread (idempotent)."""
+    global _listener
+    with _lock:
+        if _listener is None:
+            return
+        for _ in range(100):            # a full queue first has to drain a little
+            try:
+                _listener.stop()
+                break
+            except queue.Full:
+                time.sleep(0.01)
+        _listener = None
+    _router.close()
+
+
+def stats() -> Dict[str, int]:
+    return {"queued": _queue.qsize(), "dropped": _QueueHandler.dropped}
+
+
+def _file_handler(path: Path) -> logging.Handler:
+    if LOG_ROTATE_WHEN:
+        return logging.handlers.TimedRotatingFileHandler(
+            path, when=LOG_ROTATE_WHEN, backupCount=LOG_BACKUPS, encoding="utf-8")
+    return logging.handlers.RotatingFileHandler(
+        path, maxBytes=LOG_ROTATE_BYTES, backupCount=LOG_BACKUPS, encoding="utf-8")
+
+
 def init_logger(name: str,
-                level: int = logging.DEBUG,
+                level: int | str = logging.DEBUG,
                 filename: str | None = None) -> logging.Logger:
     """
-    Create/reuse a logger that logs both to stdout *and* to logs/<name>.log.
+    Create/reuse a logger that logs both to stdout *and* to logs/<name>.log,
+    through the background writer thread.
     """
 
     logger = logging.getLogger(name)
     if logger.handlers:        # already configured → return it
         return logger
+    if type(logger) is logging.Logger:
+        logger.__class__ = _Logger      # only our loggers; process-wide logging flags untouched
 
+    level = LOG_LEVEL or level
     logger.setLevel(level)
 
-    # ── stdout handler ────────────────────────────────────────────────
-    sh = logging.StreamHandler(sys.stdout)
-    sh.setLevel(level)
-    sh.setFormatter(logging.Formatter(FMT))
-    logger.addHandler(sh)
-
-    # ── file handler ─────────────────────────────────────────────────
-    if filename is None:
-        filename = name.replace(".", "_") + ".log"
-    fh_path = LOG_DIR / filename
-    fh = logging.FileHandler(fh_path, encoding="utf-8")
-    fh.setLevel(level)
-    fh.setFormatter(logging.Formatter(FMT))
-    logger.addHandler(fh)
+    with _lock:
+        _start()
+        # ── file handler (written by the listener thread) ─────────────
+        if filename is None:
+            filename = name.replace(".", "_") + ".log"
+        fh = _file_handler(LOG_DIR / filename)
+        fh.setLevel(level)
+        fh.setFormatter(_formatter(LOG_FORMAT))
+        _router.routes.setdefault(name, []).append(fh)
+
+    logger.addHandler(_QueueHandler(_queue, name))
 
     logger.propagate = False   # don’t duplicate under root logger
     return logger
-
-
-
-# def init_logger(logger_name) -> logging.Logger:
-#     path = os.path.join(LOG_PATH, logger_name)
-#     os.makedirs(LOG_PATH, exist_ok=True)
-#     os.makedirs(os.path.dirname(path), exist_ok=True)
-    
-#     fmt = "%(asctime)s | %(levelname)s | %(name)s | %(message)s"
-#     logging.basicConfig(
-#         level=logging.INFO,
-#         format=fmt,
-#         handlers=[
-#             logging.StreamHandler(),
-#             logging.FileHandler(path, encoding="utf-8")
-#         ],
-#     )
-#     return logging.getLogger("chatbot")
\ No newline at end of file
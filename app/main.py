@@ -1,9 +1,21 @@
-from fastapi import FastAPI
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
-from api import router as chat_router
+from api import components, router as chat_router
+from logger import bind_context
+import uuid
 import uvicorn
 
-app = FastAPI(title="Medical Chatbot")
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Build the backend components once the port is bound; stop their jobs on shutdown."""
+    components.launch()
+    yield
+    await components.stop()
+
+
+app = FastAPI(title="Medical Chatbot", lifespan=lifespan)
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],
@@ -12,6 +24,17 @@ app.add_middleware(
 )
 app.include_router(chat_router)
 
+
+@app.middleware("http")
+async def request_id(request: Request, call_next):
+    """Tag the request's log records (and the response) with an X-Request-ID."""
+    rid = request.headers.get("x-request-id") or uuid.uuid4().hex[:16]
+    bind_context(request_id=rid)
+    response = await call_next(request)
+    response.headers["X-Request-ID"] = rid
+    return response
+
+
 @app.get("/")
 def root():
     return {"status": "OK"}
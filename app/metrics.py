@@ -0,0 +1,223 @@
+"""
+In-process metrics: stage timings, LLM token counts and upstream errors,
+rendered in the Prometheus text format on ``GET /metrics``.
+
+``timed(stage)`` works as a context manager and as a (sync or async)
+decorator. It observes ``chatbot_stage_seconds{stage, phase}`` – the phase
+comes from :data:`PHASE`, set once per turn – and, while a request has
+bound its timings dict with :func:`bind_request`, also adds the stage's
+wall time (ms) there – summed when a stage runs more than once in a turn –
+which ends up in the response ``timings`` and the ``Server-Timing`` header.
+:func:`bind_usage` does the same for LLM token counts (per-item usage of
+batch runs).
+"""
+from __future__ import annotations
+from bisect import bisect_left
+from contextvars import ContextVar
+from typing import Dict, Iterable, List, Tuple
+import functools, inspect, math, os, threading, time
+
+# stage timings of /chat responses as a Server-Timing header (1 | 0)
+SERVER_TIMING = os.getenv("METRICS_SERVER_TIMING", "1") == "1"
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+                   1.0, 2.5, 5.0, 10.0, 30.0)
+
+PHASE: ContextVar[str] = ContextVar("metrics_phase", default="none")
+_TIMINGS: ContextVar[Dict[str, float] | None] = ContextVar("metrics_timings", default=None)
+_USAGE: ContextVar[Dict[str, int] | None] = ContextVar("metrics_usage", default=None)
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(names: Tuple[str, ...], values: Tuple[str, ...]) -> str:
+    if not names:
+        return ""
+    return "{" + ",".join(f'{n}="{_escape(v)}"' for n, v in zip(names, values)) + "}"
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, help: str, labels: Iterable[str] = ()):
+        self.name, self.help, self.labels = name, help, tuple(labels)
+        self._lock = threading.Lock()
+        REGISTRY.append(self)
+
+    def _key(self, labels: Dict[str, str]) -> Tuple[str, ...]:
+        return tuple(str(labels.get(n, "")) for n in self.labels)
+
+    def header(self) -> List[str]:
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, help: str, labels: Iterable[str] = ()):
+        super().__init__(name, help, labels)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1.0, **labels: str):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def value(self, **labels: str) -> float:
+        return self._values.get(self._key(labels), 0.0)
+
+    def render(self) -> List[str]:
+        with self._lock:
+            items = sorted(self._values.items())
+        return self.header() + [f"{self.name}{_labels(self.labels, k)} {v:g}" for k, v in items]
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labels: Iterable[str] = (),
+                 buckets: Tuple[float, ...] = LATENCY_BUCKETS):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(sorted(buckets))
+        # label values → (per-bucket counts incl. +Inf, sum)
+        self._values: Dict[Tuple[str, ...], Tuple[List[int], float]] = {}
+
+    def observe(self, value: float, **labels: str):
+        key = self._key(labels)
+        with self._lock:
+            counts, total = self._values.get(key) or ([0] * (len(self.buckets) + 1), 0.0)
+            counts[bisect_left(self.buckets, value)] += 1
+            self._values[key] = (counts, total + value)
+
+    def count(self, **labels: str) -> int:
+        entry = self._values.get(self._key(labels))
+        return sum(entry[0]) if entry else 0
+
+    def render(self) -> List[str]:
+        with self._lock:
+            items = sorted((k, (list(c), s)) for k, (c, s) in self._values.items())
+        lines = self.header()
+        names = self.labels + ("le",)
+        for key, (counts, total) in items:
+            cumulative = 0
+            for bound, n in zip(self.buckets + (math.inf,), counts):
+                cumulative += n
+                le = "+Inf" if bound == math.inf else f"{bound:g}"
+                lines.append(f"{self.name}_bucket{_labels(names, key + (le,))} {cumulative}")
+            lines.append(f"{self.name}_sum{_labels(self.labels, key)} {total:.6f}")
+            lines.append(f"{self.name}_count{_labels(self.labels, key)} {cumulative}")
+        return lines
+
+
+REGISTRY: List[_Metric] = []
+
+STAGE_SECONDS = Histogram("chatbot_stage_seconds",
+                          "Wall time of one request stage", ("stage", "phase"))
+TURNS = Counter("chatbot_turns_total", "Chat turns served", ("endpoint", "phase", "status"))
+UPSTREAM_SECONDS = Histogram("chatbot_upstream_seconds",
+                             "Azure OpenAI request latency", ("op",))
+UPSTREAM_ERRORS = Counter("chatbot_upstream_errors_total",
+                          "Failed Azure OpenAI requests", ("op", "error"))
+UPSTREAM_COALESCED = Counter("chatbot_upstream_coalesced_total",
+                             "Calls served by an identical Azure OpenAI request already in flight",
+                             ("op",))
+LLM_TOKENS = Counter("chatbot_llm_tokens_total",
+                     "Chat completion tokens", ("op", "kind"))
+RETRIEVAL_DECISIONS = Counter("chatbot_retrieval_decisions_total",
+                              "QA turns by retrieval decision (full | reuse | narrow | skip)",
+                              ("decision",))
+ADMISSION_WAIT = Histogram("chatbot_admission_wait_seconds",
+                           "Time upstream calls waited for an admission slot", ("gate",))
+ADMISSION_REJECTED = Counter("chatbot_admission_rejected_total",
+                             "Upstream calls turned away (full | evicted | deadline)",
+                             ("gate", "reason"))
+EXTRACTOR_INVALID = Counter("chatbot_extractor_invalid_json_total",
+                            "Extractor replies that were not valid JSON")
+
+
+# ─────────────────────────── timing ──────────────────────────────
+def bind_request(timings: Dict[str, float]):
+    """Collect the stage timings (ms) of the current request into *timings*."""
+    _TIMINGS.set(timings)
+
+
+class timed:
+    """Time a stage: ``with timed("retrieval"):`` or ``@timed("retrieval")``."""
+
+    def __init__(self, stage: str):
+        self.stage = stage
+        self._t0: List[float] = []
+
+    def __enter__(self):
+        self._t0.append(time.perf_counter())
+        return self
+
+    def __exit__(self, *exc):
+        record(self.stage, time.perf_counter() - self._t0.pop())
+        return False
+
+    def __call__(self, fn):
+        stage = self.stage
+        if inspect.iscoroutinefunction(fn):
+            @functools.wraps(fn)
+            async def wrapper(*args, **kwargs):
+                t0 = time.perf_counter()
+                try:
+                    return await fn(*args, **kwargs)
+                finally:
+                    record(stage, time.perf_counter() - t0)
+        else:
+            @functools.wraps(fn)
+            def wrapper(*args, **kwargs):
+                t0 = time.perf_counter()
+                try:
+                    return fn(*args, **kwargs)
+                finally:
+                    record(stage, time.perf_counter() - t0)
+        return wrapper
+
+
+def record(stage: str, seconds: float):
+    STAGE_SECONDS.observe(seconds, stage=stage, phase=PHASE.get())
+    timings = _TIMINGS.get()
+    if timings is not None:
+        timings[stage] = round(timings.get(stage, 0.0) + seconds * 1000, 1)
+
+
+def bind_usage(usage: Dict[str, int]):
+    """Add the LLM tokens of the current task to *usage* (``prompt_tokens`` / ``completion_tokens``)."""
+    _USAGE.set(usage)
+
+
+def count_tokens(op: str, prompt_tokens: int, completion_tokens: int):
+    LLM_TOKENS.inc(prompt_tokens, op=op, kind="prompt")
+    LLM_TOKENS.inc(completion_tokens, op=op, kind="completion")
+    usage = _USAGE.get()
+    if usage is not None:
+        usage["prompt_tokens"] = usage.get("prompt_tokens", 0) + prompt_tokens
+        usage["completion_tokens"] = usage.get("completion_tokens", 0) + completion_tokens
+
+
+def server_timing(timings: Dict[str, float]) -> str:
+    """``Server-Timing`` header value for a timings dict (ms)."""
+    return ", ".join(f"{stage};dur={ms:g}" for stage, ms in timings.items())
+
+
+# ─────────────────────────── export ──────────────────────────────
+def render(gauges: Dict[str, Dict[str, float]] | None = None) -> str:
+    """
+    Prometheus text exposition of every metric, plus *gauges* – numeric
+    fields of the components' ``stats()`` dicts as ``chatbot_<group>_<field>``.
+    """
+    lines: List[str] = []
+    for metric in REGISTRY:
+        lines += metric.render()
+    for group, values in (gauges or {}).items():
+        for field, value in values.items():
+            if isinstance(value, bool) or not isinstance(value, (int, float)):
+                continue
+            name = f"chatbot_{group}_{field}"
+            lines += [f"# TYPE {name} gauge", f"{name} {value:g}"]
+    return "\n".join(lines) + "\n"
@@ -1,5 +1,5 @@
 from pydantic import BaseModel, Field, constr, conint
-from typing import List, Literal, Optional
+from typing import Any, Dict, List, Literal, Optional
 
 class UserInfo(BaseModel):
     first_name: str
@@ -12,14 +12,44 @@ class UserInfo(BaseModel):
     tier: str  # זהב | כסף | ארד
 
 class ChatRequest(BaseModel):
-    phase: str = Field(..., description="info_collection | qa")
+    # Session mode: send session_id + message only; the server keeps the rest.
+    # Stateless (compatibility) mode: omit session_id and send phase/history/user_info.
+    session_id: Optional[str] = None
+    phase: Optional[str] = Field(None, description="info_collection | qa")
     user_info: Optional[UserInfo] = None  # required for qa
-    history: List[dict]  # [{"role": "user"|"assistant", "content": str}, ...]
+    partial_info: Optional[Dict[str, Any]] = None  # confirmed fields so far (stateless mode)
+    history: List[dict] = []  # [{"role": "user"|"assistant", "content": str}, ...]
     message: str  # user question or answer
 
 class ChatResponse(BaseModel):
     reply: str
-    history: List[dict]
+    history: Optional[List[dict]] = None  # stateless mode only (full transcript)
     user_info: Optional[UserInfo] = None 
+    partial_info: Optional[Dict[str, Any]] = None  # confirmed fields while incomplete
     full_info: bool
-    
\ No newline at end of file
+    timings: Optional[Dict[str, float]] = None  # per-stage wall time (ms)
+    session_id: Optional[str] = None     # session mode only
+    phase: Optional[str] = None          # phase for the next turn
+    cached: bool = False                 # reply served from the QA answer cache
+
+class Session(BaseModel):
+    """Server-side conversation state (session mode)."""
+    session_id: str
+    phase: str = "info_collection"
+    history: List[dict] = []
+    user_info: Optional[Dict[str, Any]] = None
+    partial_info: Dict[str, Any] = {}
+    lang: Optional[str] = None           # sticky conversation language (he | en)
+    updated: float = 0.0
+
+class BatchItem(BaseModel):
+    """One QA item of /chat/batch (or the offline evaluation runner)."""
+    id: Optional[str] = None             # echoed back in the result
+    user_info: UserInfo
+    question: str
+    lang: Optional[str] = None           # he | en, detected from the question when omitted
+
+class BatchRequest(BaseModel):
+    items: List[BatchItem]
+    concurrency: Optional[int] = None    # completions in flight (≤ BATCH_CONCURRENCY)
+    timeout: Optional[float] = None      # seconds per completion (default BATCH_ITEM_TIMEOUT)
@@ -1,42 +1,305 @@
-import os
-from openai import AzureOpenAI
-from typing import List, Dict
+import os, random, time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from contextlib import contextmanager
+import httpx
+from openai import (AzureOpenAI, AsyncAzureOpenAI, APIConnectionError, APIStatusError,
+                    APITimeoutError, RateLimitError)
+from typing import AsyncIterator, Callable, List, Dict, Optional, Tuple
 from dotenv import load_dotenv
 from logger import init_logger
+from tokens import count_message_tokens, count_tokens
+from query_cache import normalize_query
+from single_flight import SingleFlight, message_key
+import admission
+import metrics
 
 logger = init_logger(name="chatbot.openai_client", level="DEBUG", filename="openai_client.log")
 
 
 load_dotenv()
 
+# HTTP pool for the async client (one pool per process, shared by all requests)
+MAX_CONNECTIONS = int(os.getenv("AZURE_OPENAI_MAX_CONNECTIONS", "200"))
+MAX_KEEPALIVE   = int(os.getenv("AZURE_OPENAI_MAX_KEEPALIVE", "50"))
+KEEPALIVE_EXPIRY = float(os.getenv("AZURE_OPENAI_KEEPALIVE_EXPIRY", "30"))
+REQUEST_TIMEOUT = float(os.getenv("AZURE_OPENAI_TIMEOUT", "60"))
+
+# bulk embedding (KB index builds): request bounds, parallelism, retries
+EMBED_BATCH_SIZE   = int(os.getenv("EMBED_BATCH_SIZE", "256"))        # inputs per request
+EMBED_BATCH_TOKENS = int(os.getenv("EMBED_BATCH_TOKENS", "32000"))    # tokens per request
+EMBED_CONCURRENCY  = int(os.getenv("EMBED_CONCURRENCY", "4"))         # requests in flight
+EMBED_MAX_RETRIES  = int(os.getenv("EMBED_MAX_RETRIES", "6"))
+EMBED_BACKOFF_BASE = float(os.getenv("EMBED_BACKOFF_BASE", "0.5"))    # seconds
+EMBED_BACKOFF_MAX  = float(os.getenv("EMBED_BACKOFF_MAX", "30"))
+
+
+def embed_batches(texts: List[str], max_count: int = EMBED_BATCH_SIZE,
+                  max_tokens: int = EMBED_BATCH_TOKENS) -> List[Tuple[int, int]]:
+    """Consecutive (start, end) slices of *texts* within both bounds (an over-long text goes alone)."""
+    batches, start, tokens = [], 0, 0
+    for i, text in enumerate(texts):
+        n = count_tokens(text)
+        if i > start and (i - start >= max_count or tokens + n > max_tokens):
+            batches.append((start, i))
+            start, tokens = i, 0
+        tokens += n
+    if start < len(texts):
+        batches.append((start, len(texts)))
+    return batches
+
+
+def _retryable(exc: Exception) -> bool:
+    if isinstance(exc, (RateLimitError, APIConnectionError, APITimeoutError)):
+        return True
+    return isinstance(exc, APIStatusError) and exc.status_code >= 500
+
+
+def backoff_delay(attempt: int, exc: Exception | None = None) -> float:
+    """Server's Retry-After when given, else full-jitter exponential backoff."""
+    headers = getattr(getattr(exc, "response", None), "headers", None) or {}
+    for name, scale in (("retry-after-ms", 0.001), ("retry-after", 1.0)):
+        try:
+            return min(float(headers[name]) * scale, EMBED_BACKOFF_MAX)
+        except (KeyError, ValueError):
+            continue
+    return random.uniform(0, min(EMBED_BACKOFF_MAX, EMBED_BACKOFF_BASE * 2 ** attempt))
+
+
+@contextmanager
+def _upstream(op: str):
+    """Latency histogram + error counter around one Azure OpenAI request."""
+    t0 = time.perf_counter()
+    try:
+        yield
+    except Exception as exc:
+        metrics.UPSTREAM_ERRORS.inc(op=op, error=type(exc).__name__)
+        raise
+    finally:
+        metrics.UPSTREAM_SECONDS.observe(time.perf_counter() - t0, op=op)
+
+
+def _count_tokens(op: str, prompt_tokens: int, completion_tokens: int):
+    metrics.count_tokens(op, prompt_tokens, completion_tokens)
+    logger.info("LLM tokens prompt=%s  completion=%s", prompt_tokens, completion_tokens)
+
+
+def _embed_keys(deployment: str, texts: List[str]) -> List[Tuple[str, str]]:
+    # same normalization as the query-embedding cache
+    return [(deployment, normalize_query(t)) for t in texts]
+
+
+def _flight_stats(client) -> Dict[str, float]:
+    """Single-flight counters of a client's chat and embedding calls."""
+    return {f"{op}_{k}": v for op, flights in (("chat", client.chat_flights),
+                                               ("embed", client.embed_flights))
+            for k, v in flights.stats().items()}
+
+
+def _azure_kwargs() -> Dict:
+    return dict(
+        api_key=os.getenv("AZURE_OPENAI_KEY"),
+        azure_endpoint=os.getenv("AZURE_OPENAI_ENDPOINT"),
+        api_version=os.getenv("AZURE_OPENAI_API_VERSION"),
+    )
+
+
 class AzureOpenAIClient:
     def __init__(self):
-        self.client = AzureOpenAI(
-            api_key=os.getenv("AZURE_OPENAI_KEY"),
-            azure_endpoint=os.getenv("AZURE_OPENAI_ENDPOINT"),
-            api_version=os.getenv("AZURE_OPENAI_API_VERSION"),
-        )
+        self.client = AzureOpenAI(**_azure_kwargs())
         self.chat_deployment = os.getenv("AZURE_OPENAI_DEPLOYMENT")
         self.embedding_deployment = os.getenv("AZURE_OPENAI_EMBEDDING")
+        # bulk embedding retries are ours (Retry-After aware), not the SDK's
+        self.bulk_client = self.client.with_options(max_retries=0)
+        self.last_bulk: Dict[str, float] = {}
+        # identical concurrent calls (threads) share one request
+        self.chat_flights = SingleFlight("chat")
+        self.embed_flights = SingleFlight("embed")
+
+    def flight_stats(self) -> Dict[str, float]:
+        return _flight_stats(self)
 
     # ── Chat Completion ────────────────────────────────────────────────
     def chat(self, messages: List[Dict], temperature: float = 0.2) -> str:
-        resp = self.client.chat.completions.create(
-            model=self.chat_deployment,
-            messages=messages,
-            temperature=temperature,
-            max_tokens=512,  # Limit response length
-        )
-        logger.info("LLM response: %s", resp.choices[0].message.content)
-        # log.info("LLM tokens prompt=%s  completion=%s",
-        #     resp.usage.prompt_tokens, resp.usage.completion_tokens)
+        return self.chat_flights.do(message_key(self.chat_deployment, messages, temperature),
+                                    lambda: self._chat(messages, temperature))
+
+    def _chat(self, messages: List[Dict], temperature: float) -> str:
+        with _upstream("chat"):
+            resp = self.client.chat.completions.create(
+                model=self.chat_deployment,
+                messages=messages,
+                temperature=temperature,
+                max_tokens=512,  # Limit response length
+            )
+        logger.debug("LLM response: %s", resp.choices[0].message.content)
+        if resp.usage:
+            _count_tokens("chat", resp.usage.prompt_tokens, resp.usage.completion_tokens)
         return resp.choices[0].message.content
-    
+
     # ── Embeddings ─────────────────────────────────────────────────────
-    def embed(self, texts: List[str]) -> List[List[float]]:
-        """Returns list of embedding vectors (length 1536 for ada‑002)."""
-        resp = self.client.embeddings.create(
-            model=self.embedding_deployment,
-            input=texts,
+    def _embed_batch(self, texts: List[str]) -> Tuple[List[List[float]], int]:
+        """One embeddings request with retries → (vectors, retries used)."""
+        for attempt in range(EMBED_MAX_RETRIES + 1):
+            try:
+                with _upstream("embed_bulk"):
+                    resp = self.bulk_client.embeddings.create(
+                        model=self.embedding_deployment,
+                        input=texts,
+                    )
+                return [d.embedding for d in resp.data], attempt
+            except Exception as exc:
+                if attempt == EMBED_MAX_RETRIES or not _retryable(exc):
+                    raise
+                delay = backoff_delay(attempt, exc)
+                logger.warning("Embedding batch of %d failed (%s), retry %d in %.2f s",
+                               len(texts), type(exc).__name__, attempt + 1, delay)
+                time.sleep(delay)
+
+    def embed(self, texts: List[str],
+              on_batch: Optional[Callable[[int, List[List[float]]], None]] = None
+              ) -> List[List[float]]:
+        """
+        Returns list of embedding vectors (length 1536 for ada‑002), in input order.
+
+        Inputs are split into token- and count-bounded batches sent
+        EMBED_CONCURRENCY at a time; ``on_batch(start, vectors)`` receives
+        each batch as soon as it arrives. Throughput lands in ``last_bulk``.
+        Without ``on_batch``, texts already being embedded by another thread
+        are waited for instead of sent again.
+        """
+        if on_batch is not None:
+            return self._embed_many(texts, on_batch)
+        return self.embed_flights.do_many(
+            _embed_keys(self.embedding_deployment, texts),
+            lambda positions: self._embed_many([texts[i] for i in positions]))
+
+    def _embed_many(self, texts: List[str],
+                    on_batch: Optional[Callable[[int, List[List[float]]], None]] = None
+                    ) -> List[List[float]]:
+        t0 = time.perf_counter()
+        batches = embed_batches(texts, EMBED_BATCH_SIZE, EMBED_BATCH_TOKENS)
+        out: List[List[float]] = [None] * len(texts)
+        retries = 0
+        with ThreadPoolExecutor(max_workers=max(1, min(EMBED_CONCURRENCY, len(batches)))) as pool:
+            futures = {pool.submit(self._embed_batch, texts[a:b]): a for a, b in batches}
+            try:
+                for fut in as_completed(futures):
+                    vectors, used = fut.result()
+                    start = futures[fut]
+                    out[start:start + len(vectors)] = vectors
+                    retries += used
+                    if on_batch is not None:
+                        on_batch(start, vectors)
+            except BaseException:
+                for fut in futures:             # queued batches are not worth sending now
+                    fut.cancel()
+                raise
+
+        secs = max(time.perf_counter() - t0, 1e-9)
+        tokens = sum(count_tokens(t) for t in texts)
+        self.last_bulk = {
+            "texts": len(texts), "tokens": tokens, "batches": len(batches),
+            "retries": retries, "seconds": round(secs, 3),
+            "texts_per_s": round(len(texts) / secs, 1), "tokens_per_s": round(tokens / secs, 1),
+        }
+        if len(batches) > 1:
+            logger.info("Bulk embedding: %s", self.last_bulk)
+        return out
+
+
+class AsyncAzureOpenAIClient:
+    """
+    Non-blocking twin of :class:`AzureOpenAIClient` for the request path.
+    All calls share one keep-alive HTTP connection pool.
+    """
+
+    def __init__(self,
+                 max_connections: int = MAX_CONNECTIONS,
+                 max_keepalive: int = MAX_KEEPALIVE,
+                 timeout: float = REQUEST_TIMEOUT):
+        self.http = httpx.AsyncClient(
+            limits=httpx.Limits(
+                max_connections=max_connections,
+                max_keepalive_connections=max_keepalive,
+                keepalive_expiry=KEEPALIVE_EXPIRY,
+            ),
+            timeout=timeout,
         )
-        return [d.embedding for d in resp.data]
\ No newline at end of file
+        self.client = AsyncAzureOpenAI(**_azure_kwargs(), http_client=self.http)
+        self.chat_deployment = os.getenv("AZURE_OPENAI_DEPLOYMENT")
+        self.embedding_deployment = os.getenv("AZURE_OPENAI_EMBEDDING")
+        # identical concurrent calls (same event loop) share one request
+        self.chat_flights = SingleFlight("chat")
+        self.embed_flights = SingleFlight("embed")
+
+    def flight_stats(self) -> Dict[str, float]:
+        return _flight_stats(self)
+
+    # ── Chat Completion ────────────────────────────────────────────────
+    async def chat(self, messages: List[Dict], temperature: float = 0.2) -> str:
+        return await self.chat_flights.ado(
+            message_key(self.chat_deployment, messages, temperature),
+            lambda: self._chat(messages, temperature))
+
+    async def _chat(self, messages: List[Dict], temperature: float) -> str:
+        async with admission.slot():
+            with _upstream("chat"):
+                resp = await self.client.chat.completions.create(
+                    model=self.chat_deployment,
+                    messages=messages,
+                    temperature=temperature,
+                    max_tokens=512,  # Limit response length
+                )
+        logger.debug("LLM response: %s", resp.choices[0].message.content)
+        if resp.usage:
+            _count_tokens("chat", resp.usage.prompt_tokens, resp.usage.completion_tokens)
+        return resp.choices[0].message.content
+
+    async def chat_stream(self, messages: List[Dict],
+                          temperature: float = 0.2) -> AsyncIterator[str]:
+        """Yield completion text deltas as they arrive."""
+        t0 = time.perf_counter()
+        ttft = None
+        parts: List[str] = []
+        async with admission.slot():
+            with _upstream("chat_stream"):
+                stream = await self.client.chat.completions.create(
+                    model=self.chat_deployment,
+                    messages=messages,
+                    temperature=temperature,
+                    max_tokens=512,  # Limit response length
+                    stream=True,
+                )
+                async for chunk in stream:
+                    # Azure sends content-filter chunks with no choices
+                    if not chunk.choices or not chunk.choices[0].delta.content:
+                        continue
+                    if ttft is None:
+                        ttft = time.perf_counter() - t0
+                    parts.append(chunk.choices[0].delta.content)
+                    yield chunk.choices[0].delta.content
+        text = "".join(parts)
+        logger.info("LLM stream: ttft=%.0f ms total=%.0f ms chars=%d",
+                    (ttft or 0) * 1000, (time.perf_counter() - t0) * 1000, len(text))
+        logger.debug("LLM stream response: %s", text)
+        # streamed responses carry no usage – count locally
+        _count_tokens("chat_stream", count_message_tokens(messages), count_tokens(text))
+
+    # ── Embeddings ─────────────────────────────────────────────────────
+    async def embed(self, texts: List[str]) -> List[List[float]]:
+        """Vectors in input order; texts already in flight are joined, not re-sent."""
+        return await self.embed_flights.ado_many(
+            _embed_keys(self.embedding_deployment, texts),
+            lambda positions: self._embed([texts[i] for i in positions]))
+
+    async def _embed(self, texts: List[str]) -> List[List[float]]:
+        async with admission.slot("embedding"):
+            with _upstream("embed"):
+                resp = await self.client.embeddings.create(
+                    model=self.embedding_deployment,
+                    input=texts,
+                )
+        return [d.embedding for d in resp.data]
+
+    async def aclose(self):
+        await self.client.close()
@@ -1,7 +1,8 @@
 from __future__ import annotations
-from typing import Dict, List
+from typing import Dict, List, Tuple
 import json, re
 from logger import init_logger
+from metrics import EXTRACTOR_INVALID, timed
 
 logger = init_logger(name="chatbot.profile_extractor", level="DEBUG", filename="profile_extractor.log")
 
@@ -24,22 +25,42 @@ SYS_PROMPT = (
     + json.dumps(JSON_TEMPLATE, ensure_ascii=False, indent=2)
 )
 
+INCREMENTAL_SYS_PROMPT = (
+    "You are a strict JSON extractor filling a user profile step by step. "
+    "You get the fields already confirmed, the assistant's last question and "
+    "the user's new reply. Return ONLY a JSON object with the still-missing "
+    "fields listed below, filled in when the new reply provides them "
+    "(all others must be null). Never repeat confirmed fields.\n\n"
+    "Missing fields: "
+)
+
 def _format_history(history: List[Dict[str, str]]) -> str:
     """Flatten history to a readable block for the LM."""
     return "\n".join(f"{m['role']}: {m['content']}" for m in history)
 
-def extract_profile(history: List[Dict[str, str]], *, client) -> Dict:
-    """
-    Ask the language model to produce a partial profile JSON
-    based on the *entire* info-collection history.
-    """
-    messages = [
+def _build_messages(history: List[Dict[str, str]]) -> List[Dict[str, str]]:
+    return [
         {"role": "system", "content": SYS_PROMPT},
         {"role": "user",   "content": _format_history(history)},
     ]
 
-    logger.info("Sending %d tokens to extractor model", len(messages))
-    raw_reply = client.chat(messages)          # <-- your wrapper returns str
+def _build_incremental_messages(
+    confirmed: Dict,
+    last_question: str | None,
+    user_text: str,
+) -> Tuple[List[Dict[str, str]], List[str]]:
+    missing = [k for k in JSON_TEMPLATE if k not in confirmed]
+    template = json.dumps({k: None for k in missing}, ensure_ascii=False)
+    turn = [f"Confirmed: {json.dumps(confirmed, ensure_ascii=False)}"]
+    if last_question:
+        turn.append(f"assistant: {last_question}")
+    turn.append(f"user: {user_text}")
+    return [
+        {"role": "system", "content": INCREMENTAL_SYS_PROMPT + template},
+        {"role": "user",   "content": "\n".join(turn)},
+    ], missing
+
+def _parse_reply(raw_reply: str) -> Dict:
     logger.info("Extractor raw reply: %s", raw_reply[:200])
 
     # The model must reply with JSON only; strip markdown fences if any.
@@ -49,5 +70,59 @@ def extract_profile(history: List[Dict[str, str]], *, client) -> Dict:
         # Keep only the exact keys we expect
         return {k: data.get(k) for k in JSON_TEMPLATE}
     except json.JSONDecodeError:
+        EXTRACTOR_INVALID.inc()
         logger.info("Extractor returned invalid JSON")
         return {}
+
+def extract_profile(history: List[Dict[str, str]], *, client) -> Dict:
+    """
+    Ask the language model to produce a partial profile JSON
+    based on the *entire* info-collection history.
+    """
+    messages = _build_messages(history)
+    logger.info("Sending %d tokens to extractor model", len(messages))
+    raw_reply = client.chat(messages)          # <-- your wrapper returns str
+    return _parse_reply(raw_reply)
+
+@timed("extractor_llm")
+async def aextract_profile(history: List[Dict[str, str]], *, client) -> Dict:
+    """Async variant of :func:`extract_profile` for an ``AsyncAzureOpenAIClient``."""
+    messages = _build_messages(history)
+    logger.info("Sending %d tokens to extractor model", len(messages))
+    raw_reply = await client.chat(messages)
+    return _parse_reply(raw_reply)
+
+def extract_profile_incremental(
+    confirmed: Dict,
+    last_question: str | None,
+    user_text: str,
+    *,
+    client,
+) -> Dict:
+    """Sync variant of :func:`aextract_profile_incremental` (scripts, benchmarks)."""
+    messages, missing = _build_incremental_messages(confirmed, last_question, user_text)
+    if not missing:
+        return {}
+    extracted = _parse_reply(client.chat(messages))
+    return {k: v for k, v in extracted.items() if k in missing}
+
+@timed("extractor_llm")
+async def aextract_profile_incremental(
+    confirmed: Dict,
+    last_question: str | None,
+    user_text: str,
+    *,
+    client,
+) -> Dict:
+    """
+    Incremental extraction: send only the confirmed fields, the last assistant
+    question and the new user message, and ask for the missing fields only.
+    Confirmed fields are frozen – the reply can never overwrite them.
+    """
+    messages, missing = _build_incremental_messages(confirmed, last_question, user_text)
+    if not missing:
+        return {}
+    logger.info("Incremental extraction for %d missing fields", len(missing))
+    raw_reply = await client.chat(messages)
+    extracted = _parse_reply(raw_reply)
+    return {k: v for k, v in extracted.items() if k in missing}
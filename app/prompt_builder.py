@@ -0,0 +1,211 @@
+"""
+Token-budgeted chat prompt assembly.
+
+Each section (system, profile, KB, history) has its own token budget. The
+last ``PROMPT_HISTORY_TURNS`` turns are sent verbatim; older turns are
+replaced by a rolling summary cached per history prefix, so it is only
+recomputed when the window moves – and never on the request path: a missing
+summary is extended in the background and picked up by the next turn.
+"""
+from __future__ import annotations
+from collections import OrderedDict
+from typing import Awaitable, Callable, Dict, List, Tuple
+import asyncio, hashlib, os
+from logger import init_logger
+from tokens import MESSAGE_OVERHEAD, count_message_tokens, count_tokens, truncate_tokens
+
+logger = init_logger(name="chatbot.prompt_builder", level="DEBUG", filename="prompt_builder.log")
+
+BUDGETS = {
+    "system":  int(os.getenv("PROMPT_BUDGET_SYSTEM", "1000")),
+    "profile": int(os.getenv("PROMPT_BUDGET_PROFILE", "150")),
+    "kb":      int(os.getenv("PROMPT_BUDGET_KB", "1500")),
+    "history": int(os.getenv("PROMPT_BUDGET_HISTORY", "1500")),   # summary + recent turns
+}
+HISTORY_TURNS   = int(os.getenv("PROMPT_HISTORY_TURNS", "4"))        # user+assistant pairs
+SUMMARY         = os.getenv("PROMPT_SUMMARY", "1") == "1"           # 0 → drop old turns
+SUMMARY_TOKENS  = int(os.getenv("PROMPT_SUMMARY_TOKENS", "250"))
+SUMMARY_CACHE_SIZE = int(os.getenv("PROMPT_SUMMARY_CACHE_SIZE", "4096"))
+
+SUMMARY_PROMPT = (
+    "You maintain a running summary of a conversation between a user and an "
+    "HMO medical-services assistant. Update the summary with the new messages. "
+    "Keep facts the user stated, the questions asked and the answers given; "
+    "at most 6 short bullet points, in the language of the conversation. "
+    "Reply with the summary only."
+)
+SUMMARY_HEADER = "Summary of the earlier conversation:\n"
+
+
+class Prompt:
+    """Chat messages tagged by section, for budgets and per-section token logs."""
+
+    def __init__(self):
+        self.messages: List[Dict[str, str]] = []
+        self.sections: List[str] = []
+
+    def append(self, section: str, message: Dict[str, str]):
+        self.messages.append(message)
+        self.sections.append(section)
+
+    def insert(self, index: int, section: str, message: Dict[str, str]):
+        self.messages.insert(index, message)
+        self.sections.insert(index, section)
+
+    def tokens(self) -> Dict[str, int]:
+        """Prompt tokens per section (message overhead included) and the total."""
+        out: Dict[str, int] = {}
+        for section, m in zip(self.sections, self.messages):
+            out[section] = out.get(section, 0) + count_tokens(m["content"]) + MESSAGE_OVERHEAD
+        out["total"] = count_message_tokens(self.messages)
+        return out
+
+
+def _prefix_hashes(history: List[Dict[str, str]]) -> List[str]:
+    """hashes[i] identifies history[:i]."""
+    hashes = [""]
+    for m in history:
+        h = hashlib.sha256(hashes[-1].encode())
+        h.update(m["role"].encode())
+        h.update(b"\0")
+        h.update(m["content"].encode("utf-8"))
+        hashes.append(h.hexdigest())
+    return hashes
+
+
+class PromptBuilder:
+    """
+    Builds :class:`Prompt` objects within the section budgets.
+
+    ``summarize(messages) -> str`` is the (async) LLM call used to roll the
+    summary forward; without it old turns are simply dropped.
+    """
+
+    def __init__(self,
+                 summarize: Callable[[List[Dict[str, str]]], Awaitable[str]] | None = None,
+                 budgets: Dict[str, int] | None = None,
+                 history_turns: int = HISTORY_TURNS,
+                 summary_tokens: int = SUMMARY_TOKENS,
+                 cache_size: int = SUMMARY_CACHE_SIZE):
+        self.summarize = summarize if SUMMARY else None
+        self.budgets = {**BUDGETS, **(budgets or {})}
+        self.history_turns = history_turns
+        self.summary_tokens = summary_tokens
+        self.cache_size = cache_size
+        # prefix hash → (prefix length, summary), LRU
+        self._summaries: "OrderedDict[str, Tuple[int, str]]" = OrderedDict()
+        self._pending: Dict[str, asyncio.Task] = {}
+        self.summary_calls = self.summary_hits = self.dropped_messages = 0
+
+    # ────────────────── sections ──────────────────
+    def fit(self, section: str, text: str) -> str:
+        """*text* truncated to the section budget (logged when it had to be cut)."""
+        budget = self.budgets[section] - MESSAGE_OVERHEAD
+        out = truncate_tokens(text, budget)
+        if out != text:
+            logger.warning("%s section cut to %d tokens (was %d)",
+                           section, budget, count_tokens(text))
+        return out
+
+    def build(self, system: str, history: List[Dict[str, str]], user_text: str) -> Prompt:
+        """System prompt + (summary) + recent history window + the new user message."""
+        prompt = Prompt()
+        prompt.append("system", {"role": "system", "content": self.fit("system", system)})
+
+        summary, recent = self._window(history)
+        if summary:
+            prompt.append("summary", {"role": "system", "content": SUMMARY_HEADER + summary})
+        for m in recent:
+            prompt.append("history", m)
+        prompt.append("user", {"role": "user", "content": user_text})
+        return prompt
+
+    # ────────────────── history window ──────────────────
+    def _window(self, history: List[Dict[str, str]]) -> Tuple[str, List[Dict[str, str]]]:
+        """(summary of the older part, verbatim recent messages) within the history budget."""
+        split = max(0, len(history) - 2 * self.history_turns)
+        budget = self.budgets["history"]
+        if split and self.summarize:
+            budget -= self.summary_tokens + MESSAGE_OVERHEAD
+
+        # newest messages first until the budget is used up
+        kept, used = [], 0
+        for m in reversed(history[split:]):
+            cost = count_tokens(m["content"]) + MESSAGE_OVERHEAD
+            if used + cost > budget:
+                break
+            kept.append(m)
+            used += cost
+        split = len(history) - len(kept)
+        if not split:
+            return "", history
+
+        if self.summarize is None:
+            self.dropped_messages += split
+            return "", list(reversed(kept))
+
+        hashes = _prefix_hashes(history[:split])
+        covered, summary = self._best_summary(hashes)
+        if covered < split:
+            self._schedule(history[:split], hashes[split], covered, summary)
+            # the not-yet-summarized gap rides along verbatim while it fits
+            gap = history[covered:split]
+            for i, m in enumerate(reversed(gap)):
+                cost = count_tokens(m["content"]) + MESSAGE_OVERHEAD
+                if used + cost > budget:
+                    self.dropped_messages += len(gap) - i
+                    break
+                kept.append(m)
+                used += cost
+        else:
+            self.summary_hits += 1
+        return summary, list(reversed(kept))
+
+    def _best_summary(self, hashes: List[str]) -> Tuple[int, str]:
+        """Longest history prefix with a cached summary → (its length, summary)."""
+        for key in reversed(hashes[1:]):
+            entry = self._summaries.get(key)
+            if entry is not None:
+                self._summaries.move_to_end(key)
+                return entry
+        return 0, ""
+
+    def _schedule(self, older: List[Dict[str, str]], key: str, covered: int, summary: str):
+        """Extend *summary* (covering older[:covered]) to all of *older* in the background."""
+        if key in self._pending or self.summarize is None:
+            return
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:                    # sync caller – no background work
+            return
+        new = "\n".join(f"{m['role']}: {m['content']}" for m in older[covered:])
+        messages = [
+            {"role": "system", "content": SUMMARY_PROMPT},
+            {"role": "user", "content": (f"Current summary:\n{summary}\n\n" if summary else "")
+                                        + f"New messages:\n{new}"},
+        ]
+
+        async def run():
+            try:
+                text = truncate_tokens(await self.summarize(messages), self.summary_tokens)
+                self._summaries[key] = (len(older), text)
+                while len(self._summaries) > self.cache_size:
+                    self._summaries.popitem(last=False)
+                self.summary_calls += 1
+                logger.info("Summary rolled forward to %d messages (%d tokens)",
+                            len(older), count_tokens(text))
+            except Exception:
+                logger.exception("History summary failed")
+            finally:
+                self._pending.pop(key, None)
+
+        self._pending[key] = loop.create_task(run())
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "summaries":        len(self._summaries),
+            "summary_calls":    self.summary_calls,
+            "summary_hits":     self.summary_hits,
+            "pending":          len(self._pending),
+            "dropped_messages": self.dropped_messages,
+        }
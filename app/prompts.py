@@ -47,4 +47,20 @@ PROMPTS = {
 
 def get_system_prompt(phase: str, lang: str) -> str:
     """Return prompt for phase ('info_collection' | 'qa') and language code ('he'|'en')."""
-    return PROMPTS.get(phase, {}).get(lang, PROMPTS[phase]["en"])
\ No newline at end of file
+    return PROMPTS.get(phase, {}).get(lang, PROMPTS[phase]["en"])
+
+def profile_prompt(profile, anonymous: bool = False) -> str:
+    """
+    'User profile' system message for a :class:`models.UserInfo`. *anonymous*
+    leaves out the name – for replies that may be served to other users from
+    the answer cache.
+    """
+    name = "" if anonymous else f"Full name: {profile.first_name} {profile.last_name}\n"
+    return (
+        f"User profile:\n"
+        f"{name}"
+        f"HMO: {profile.hmo}\n"
+        f"Tier: {profile.tier}\n"
+        f"Age: {profile.age}\n"
+        f"Gender: {profile.gender}\n"
+    )
@@ -0,0 +1,225 @@
+from __future__ import annotations
+from collections import OrderedDict
+from pathlib import Path
+from typing import Awaitable, Callable, Dict, List, Sequence, Tuple
+import asyncio, os, re, sqlite3, threading, time
+import numpy as np
+from logger import init_logger
+
+logger = init_logger(name="chatbot.query_cache", level="DEBUG", filename="query_cache.log")
+
+QUERY_CACHE_SIZE = int(os.getenv("QUERY_CACHE_SIZE", "2048"))
+QUERY_CACHE_TTL  = float(os.getenv("QUERY_CACHE_TTL", "86400"))   # seconds
+QUERY_CACHE_DB   = os.getenv("QUERY_CACHE_DB", "")                # "" → no shared backend
+QUERY_CACHE_DB_ROWS       = int(os.getenv("QUERY_CACHE_DB_ROWS", "100000"))
+QUERY_CACHE_PURGE_INTERVAL = float(os.getenv("QUERY_CACHE_PURGE_INTERVAL", "3600"))  # 0 → never
+
+
+def normalize_query(text: str) -> str:
+    """Cache key for a query: case-folded, whitespace collapsed."""
+    return re.sub(r"\s+", " ", text).strip().casefold()
+
+
+class SqliteEmbeddingBackend:
+    """
+    Shared query-embedding store on a local SQLite file (WAL mode), so several
+    uvicorn workers on one host reuse each other's embeddings. Blocking: the
+    async path calls it from a worker thread.
+    """
+
+    def __init__(self, path: Path, max_rows: int = QUERY_CACHE_DB_ROWS):
+        self.path = Path(path)
+        self.max_rows = max_rows
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(self.path, check_same_thread=False, timeout=5)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS query_embeddings ("
+            " key TEXT PRIMARY KEY, ts REAL NOT NULL, vec BLOB NOT NULL)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS query_embeddings_ts ON query_embeddings (ts)")
+        self._db.commit()
+
+    def get_many(self, keys: Sequence[str], ttl: float) -> Dict[str, np.ndarray]:
+        """Unexpired vectors of *keys* that are stored (one query)."""
+        with self._lock:
+            rows = self._db.execute(
+                f"SELECT key, ts, vec FROM query_embeddings WHERE key IN ({','.join('?' * len(keys))})",
+                list(keys),
+            ).fetchall()
+        cutoff = time.time() - ttl
+        return {key: np.frombuffer(vec, dtype=np.float32) for key, ts, vec in rows if ts >= cutoff}
+
+    def get(self, key: str, ttl: float) -> np.ndarray | None:
+        return self.get_many([key], ttl).get(key)
+
+    def put_many(self, items: Sequence[Tuple[str, np.ndarray]]):
+        """Store several vectors in one transaction."""
+        now = time.time()
+        with self._lock:
+            self._db.executemany(
+                "INSERT OR REPLACE INTO query_embeddings (key, ts, vec) VALUES (?, ?, ?)",
+                [(key, now, np.asarray(vec, dtype=np.float32).tobytes()) for key, vec in items],
+            )
+            self._db.commit()
+
+    def put(self, key: str, vec: np.ndarray):
+        self.put_many([(key, vec)])
+
+    def purge(self, ttl: float) -> int:
+        """Delete expired rows, then the oldest beyond ``max_rows``; returns how many were removed."""
+        with self._lock:
+            removed = self._db.execute("DELETE FROM query_embeddings WHERE ts < ?",
+                                       (time.time() - ttl,)).rowcount
+            removed += self._db.execute(
+                "DELETE FROM query_embeddings WHERE key IN (SELECT key FROM query_embeddings"
+                " ORDER BY ts DESC LIMIT -1 OFFSET ?)", (self.max_rows,)).rowcount
+            self._db.commit()
+        if removed:
+            logger.info("Purged %d shared query embeddings", removed)
+        return removed
+
+
+class QueryEmbeddingCache:
+    """
+    Bounded LRU + TTL cache of query embeddings keyed by normalized text,
+    optionally backed by a shared :class:`SqliteEmbeddingBackend`.
+    """
+
+    def __init__(self,
+                 max_size: int = QUERY_CACHE_SIZE,
+                 ttl: float = QUERY_CACHE_TTL,
+                 backend: SqliteEmbeddingBackend | None = None):
+        self.max_size = max_size
+        self.ttl      = ttl
+        self.backend  = backend
+        self._data: "OrderedDict[str, Tuple[float, np.ndarray]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = self.shared_hits = self.misses = 0
+        self.evictions = self.expirations = 0
+
+    @classmethod
+    def from_env(cls) -> "QueryEmbeddingCache":
+        backend = SqliteEmbeddingBackend(Path(QUERY_CACHE_DB)) if QUERY_CACHE_DB else None
+        return cls(backend=backend)
+
+    # ────────────────── primitive ops ──────────────────
+    def _local(self, key: str, now: float) -> np.ndarray | None:
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None:
+                if now - entry[0] <= self.ttl:
+                    self._data.move_to_end(key)
+                    self.hits += 1
+                    return entry[1]
+                del self._data[key]
+                self.expirations += 1
+        return None
+
+    def get(self, text: str) -> np.ndarray | None:
+        out, todo = self._lookup([text])
+        self._shared(out, todo)
+        return out[0]
+
+    def put(self, text: str, vec: np.ndarray):
+        key = normalize_query(text)
+        vec = np.asarray(vec, dtype=np.float32)
+        self._store(key, vec, time.time())
+        if self.backend is not None:
+            self.backend.put(key, vec)
+
+    def _store(self, key: str, vec: np.ndarray, ts: float):
+        with self._lock:
+            self._data[key] = (ts, vec)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def purge(self) -> int:
+        """Trim the shared backend (expired rows, row cap); 0 without one."""
+        return self.backend.purge(self.ttl) if self.backend is not None else 0
+
+    # ────────────────── read-through ──────────────────
+    def _lookup(self, texts: Sequence[str]
+                ) -> Tuple[List[np.ndarray | None], Dict[str, List[int]]]:
+        """In-process vectors (None for misses) + normalized-key → positions to fill."""
+        now = time.time()
+        out: List[np.ndarray | None] = []
+        todo: Dict[str, List[int]] = {}
+        for i, text in enumerate(texts):
+            key = normalize_query(text)
+            out.append(self._local(key, now))
+            if out[-1] is None:
+                todo.setdefault(key, []).append(i)
+        return out, todo
+
+    def _shared(self, out: List[np.ndarray | None], todo: Dict[str, List[int]]):
+        """Fill misses from the shared backend (blocking), in place; counts the rest as misses."""
+        if todo and self.backend is not None:
+            found = self.backend.get_many(list(todo), self.ttl)
+            now = time.time()
+            for key, vec in found.items():
+                self._store(key, vec, now)
+                for i in todo.pop(key):
+                    out[i] = vec
+                with self._lock:
+                    self.shared_hits += 1
+        with self._lock:
+            self.misses += sum(len(idx) for idx in todo.values())
+
+    def _fill(self, texts: Sequence[str], out: List[np.ndarray | None],
+              todo: Dict[str, List[int]], fresh) -> Tuple[np.ndarray, List[Tuple[str, np.ndarray]]]:
+        """Stack the result; returns it + the (key, vector) pairs for the shared backend."""
+        now = time.time()
+        new: List[Tuple[str, np.ndarray]] = []
+        for (key, idx), vec in zip(todo.items(), fresh):
+            vec = np.asarray(vec, dtype=np.float32)
+            self._store(key, vec, now)
+            new.append((key, vec))
+            for i in idx:
+                out[i] = vec
+        return np.stack(out), new
+
+    def embed(self, texts: Sequence[str],
+              embed_fn: Callable[[List[str]], np.ndarray]) -> np.ndarray:
+        """
+        Return one vector per text, calling *embed_fn* once for all misses
+        (duplicates inside the batch are embedded only once).
+        """
+        out, todo = self._lookup(texts)
+        self._shared(out, todo)
+        fresh = embed_fn([texts[idx[0]] for idx in todo.values()]) if todo else []
+        vecs, new = self._fill(texts, out, todo, fresh)
+        if new and self.backend is not None:
+            self.backend.put_many(new)
+        return vecs
+
+    async def aembed(self, texts: Sequence[str],
+                     aembed_fn: Callable[[List[str]], Awaitable[np.ndarray]]) -> np.ndarray:
+        """Async variant of :meth:`embed` (``aembed_fn`` is awaited, SQLite runs in a thread)."""
+        out, todo = self._lookup(texts)
+        if todo and self.backend is not None:
+            await asyncio.to_thread(self._shared, out, todo)
+        else:
+            self._shared(out, todo)
+        fresh = await aembed_fn([texts[idx[0]] for idx in todo.values()]) if todo else []
+        vecs, new = self._fill(texts, out, todo, fresh)
+        if new and self.backend is not None:
+            await asyncio.to_thread(self.backend.put_many, new)
+        return vecs
+
+    def stats(self) -> Dict[str, float]:
+        with self._lock:
+            lookups = self.hits + self.shared_hits + self.misses
+            return {
+                "size":        len(self._data),
+                "hits":        self.hits,
+                "shared_hits": self.shared_hits,
+                "misses":      self.misses,
+                "evictions":   self.evictions,
+                "expirations": self.expirations,
+                "hit_rate":    (self.hits + self.shared_hits) / lookups if lookups else 0.0,
+            }
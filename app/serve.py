@@ -0,0 +1,320 @@
+"""
+Multi-worker serving: one supervisor builds the KB, N uvicorn workers attach
+to it read-only.
+
+    python app/serve.py --workers 4 [--port 8000] [--report startup.json]
+
+The supervisor parses ``phase2_data`` (starting from ``KB_SNAPSHOT`` when
+there is one), embeds what the embedding store is missing and publishes the
+parsed pages as a snapshot (``SERVE_SNAPSHOT``). Workers load that snapshot
+instead of the HTML and open the vector matrix as a read-only memmap of the
+store – one copy in the OS page cache, no embedding call from any worker.
+
+Reload: SIGHUP to the supervisor, ``POST /kb/reload`` on any worker (it is
+forwarded) or the ``KB_WATCH_INTERVAL`` poller re-publishes, then every
+worker swaps to the new version. SIGINT / SIGTERM stop the workers
+gracefully; a worker that dies is started again. Worker ``i`` logs under
+``logs/worker-<i>/``.
+"""
+from __future__ import annotations
+from pathlib import Path
+from typing import Dict, List
+import argparse, asyncio, json, multiprocessing, os, queue, signal, socket, sys, time
+from data_loader import ChunkedKnowledgeBase
+from embedding_store import EmbeddingStore
+from kb_reload import KB_WATCH_INTERVAL, file_signature
+from kb_search import RETRIEVAL_UNIT
+from kb_snapshot import KB_SNAPSHOT, restore, save_snapshot
+from logger import LOG_DIR, init_logger
+import openai_client
+
+logger = init_logger(name="chatbot.serve", level="DEBUG", filename="serve.log")
+
+SERVE_WORKERS       = int(os.getenv("SERVE_WORKERS", "1"))
+SERVE_SNAPSHOT      = Path(os.getenv("SERVE_SNAPSHOT", Path(__file__).parent / "kb_published.npz"))
+SERVE_READY_TIMEOUT = float(os.getenv("SERVE_READY_TIMEOUT", "300"))   # seconds per round
+
+_mp = multiprocessing.get_context("spawn")
+
+
+def memory(pid: int) -> Dict[str, float]:
+    """RSS and PSS (shared pages split between their users) of *pid* in MiB; Linux only."""
+    out = {}
+    for field, name, key in (("rss_mb", "status", "VmRSS:"), ("pss_mb", "smaps_rollup", "Pss:")):
+        try:
+            lines = Path(f"/proc/{pid}/{name}").read_text().splitlines()
+        except OSError:
+            continue
+        for line in lines:
+            if line.startswith(key):
+                out[field] = round(int(line.split()[1]) / 1024, 1)
+                break
+    return out
+
+
+# ─────────────────────────── publishing ──────────────────────────────
+class Publisher:
+    """Supervisor side: parse, embed and publish the KB for the workers."""
+
+    def __init__(self, data_dir: Path, out: Path = SERVE_SNAPSHOT):
+        self.data_dir = Path(data_dir)
+        self.out = Path(out)
+        self.client = openai_client.AzureOpenAIClient()
+        self.kb: ChunkedKnowledgeBase | None = None
+        self.signature: Dict = {}
+
+    @property
+    def version(self) -> str | None:
+        return self.kb.version if self.kb else None
+
+    def changed(self) -> bool:
+        return file_signature(self.data_dir) != self.signature
+
+    def publish(self) -> Dict[str, float]:
+        """Bring the store and the published snapshot up to date; returns stage timings (ms)."""
+        t0 = time.perf_counter()
+        deployment = self.client.embedding_deployment
+        signature = file_signature(self.data_dir)
+        previous = self.kb or restore(KB_SNAPSHOT, self.data_dir, deployment)
+        kb = ChunkedKnowledgeBase(self.data_dir, previous=previous)
+
+        t1 = time.perf_counter()
+        texts = [d["text"] for d in (kb.records if RETRIEVAL_UNIT == "record" else kb.chunks)]
+        store = EmbeddingStore(deployment, read_only=False)
+        store.ensure(texts, self.client.embed)
+        store.arrange(texts)            # index rows lead → workers get views on the memmap
+
+        t2 = time.perf_counter()
+        save_snapshot(kb, self.out)     # pages only, the vectors are shared through the store
+        self.kb, self.signature = kb, signature
+        t3 = time.perf_counter()
+        timings = {"parse": round((t1 - t0) * 1000, 1), "embed": round((t2 - t1) * 1000, 1),
+                   "snapshot": round((t3 - t2) * 1000, 1), "total": round((t3 - t0) * 1000, 1)}
+        logger.info("Published KB %s (%d pages re-parsed): %s",
+                    kb.version, len(kb.changed_files), timings)
+        return timings
+
+
+# ─────────────────────────── worker ──────────────────────────────
+def _worker(index: int, sock: socket.socket, events, log_level: str):
+    """Worker process: serve the app on the shared socket, report to the supervisor."""
+    signal.signal(signal.SIGHUP, signal.SIG_IGN)    # reloads are handled once ready
+    import uvicorn
+    from main import app
+    from api import components
+
+    server = uvicorn.Server(uvicorn.Config(app, log_level=log_level))
+
+    async def reload():
+        try:
+            result = await components.kb_manager.reload(snapshot=components.snapshot)
+        except Exception as exc:
+            result = {"version": components.kb_manager.version, "error": str(exc)}
+        events.put({"event": "reloaded", "worker": index, **result})
+
+    async def serve():
+        serving = asyncio.ensure_future(server.serve(sockets=[sock]))
+        while not (components.ready or components.error or serving.done()):
+            await asyncio.sleep(0.05)
+        events.put({"event": "ready", "worker": index, "pid": os.getpid(),
+                    "error": components.error or (None if components.ready else "server exited"),
+                    "version": components.kb_manager.version if components.ready else None,
+                    "startup_ms": components.startup})
+        asyncio.get_running_loop().add_signal_handler(
+            signal.SIGHUP, lambda: asyncio.ensure_future(reload()))
+        await serving
+
+    asyncio.run(serve())
+
+
+# ─────────────────────────── supervisor ──────────────────────────────
+class Supervisor:
+    def __init__(self, workers: int, host: str, port: int, data_dir: Path,
+                 log_level: str = "info"):
+        self.n = workers
+        self.host, self.port = host, port
+        self.log_level = log_level
+        self.publisher = Publisher(data_dir)
+        self.events = _mp.Queue()
+        self.procs: Dict[int, multiprocessing.Process] = {}
+        self.versions: Dict[int, str | None] = {}
+        self.sock: socket.socket | None = None
+        self._reload = self._stop = False
+
+    def _worker_env(self) -> Dict[str, str]:
+        env = {"EMBED_STORE_READONLY": "1",
+               "KB_SNAPSHOT": str(self.publisher.out),
+               "KB_PUBLISHER_PID": str(os.getpid())}
+        if self.n > 1 and os.getenv("SESSION_STORE", "memory") == "memory":
+            logger.warning("SESSION_STORE=memory with %d workers: a session only lives in the "
+                           "worker that created it – use SESSION_STORE=sqlite", self.n)
+        return env
+
+    def _spawn(self, index: int):
+        log_dir = LOG_DIR / f"worker-{index}"
+        log_dir.mkdir(exist_ok=True)
+        # daemon: never outlives the supervisor
+        proc = _mp.Process(target=_worker, name=f"worker-{index}", daemon=True,
+                           args=(index, self.sock, self.events, self.log_level))
+        os.environ["LOG_DIR"] = str(log_dir)       # the spawned interpreter inherits the env
+        try:
+            proc.start()
+        finally:
+            os.environ["LOG_DIR"] = str(LOG_DIR)
+        self.procs[index] = proc
+        self.versions[index] = None
+
+    def _wait(self, event: str, workers: List[int]) -> Dict[int, Dict]:
+        """Collect *event* from each of *workers* (error when one dies or times out)."""
+        got: Dict[int, Dict] = {}
+        deadline = time.monotonic() + SERVE_READY_TIMEOUT
+        while len(got) < len(workers):
+            if time.monotonic() > deadline:
+                raise TimeoutError(f"workers {sorted(set(workers) - set(got))} did not report {event}")
+            try:
+                msg = self.events.get(timeout=0.2)
+            except queue.Empty:
+                dead = [i for i in workers if i not in got and not self.procs[i].is_alive()]
+                if dead:
+                    raise RuntimeError(f"worker(s) {dead} exited before {event}")
+                continue
+            self._note(msg)
+            if msg["event"] == event and msg["worker"] in workers:
+                if msg.get("error"):
+                    raise RuntimeError(f"worker {msg['worker']}: {msg['error']}")
+                got[msg["worker"]] = msg
+        return got
+
+    def _note(self, msg: Dict):
+        self.versions[msg["worker"]] = msg.get("version")
+        if msg["event"] == "ready" and msg.get("version") not in (None, self.publisher.version):
+            # came up while a reload was being published
+            os.kill(self.procs[msg["worker"]].pid, signal.SIGHUP)
+
+    # ────────────────── lifecycle ──────────────────
+    def start(self) -> Dict:
+        """Publish, bind, start every worker and wait until all are ready; returns a report."""
+        t0 = time.perf_counter()
+        # a worker's /kb/reload may arrive as soon as it serves
+        signal.signal(signal.SIGHUP, self._on_signal)
+        publish = self.publisher.publish()
+        os.environ.update(self._worker_env())
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.sock.bind((self.host, self.port))
+        self.sock.set_inheritable(True)
+
+        t1 = time.perf_counter()
+        for i in range(self.n):
+            self._spawn(i)
+        ready = self._wait("ready", list(range(self.n)))
+        t2 = time.perf_counter()
+        workers = [{"worker": i, "pid": msg["pid"], "startup_ms": msg["startup_ms"],
+                    **memory(msg["pid"])} for i, msg in sorted(ready.items())]
+        report = {
+            "workers":        self.n,
+            "kb_version":     self.publisher.version,
+            "publish_ms":     publish,
+            "spawn_ready_ms": round((t2 - t1) * 1000, 1),
+            "total_ms":       round((t2 - t0) * 1000, 1),
+            "supervisor":     memory(os.getpid()),
+            "per_worker":     workers,
+        }
+        rss = [w.get("rss_mb", 0.0) for w in workers]
+        logger.info("%d worker(s) ready on %s:%d in %.0f ms (publish %.0f ms), "
+                    "RSS per worker %.0f–%.0f MiB", self.n, self.host, self.port,
+                    report["total_ms"], publish["total"], min(rss), max(rss))
+        return report
+
+    def reload(self) -> Dict:
+        """Re-publish; if the KB changed, swap every worker to it and wait for all."""
+        old = self.publisher.version
+        publish = self.publisher.publish()
+        if self.publisher.version == old:
+            logger.info("KB reload: version %s unchanged", old)
+            return {"version": old, "swapped": False}
+        t0 = time.perf_counter()
+        live = [i for i, p in self.procs.items() if p.is_alive() and self.versions[i]]
+        for i in live:
+            os.kill(self.procs[i].pid, signal.SIGHUP)
+        done = self._wait("reloaded", live)
+        result = {"version": self.publisher.version, "previous": old, "swapped": True,
+                  "publish_ms": publish, "workers_ms": round((time.perf_counter() - t0) * 1000, 1),
+                  "worker_swap_ms": [done[i].get("ms") for i in sorted(done)]}
+        logger.info("KB reload: %s", result)
+        return result
+
+    def stop(self, timeout: float = 30.0):
+        for p in self.procs.values():
+            if p.is_alive():
+                p.terminate()                        # SIGTERM → uvicorn graceful shutdown
+        deadline = time.monotonic() + timeout
+        for p in self.procs.values():
+            p.join(max(0.0, deadline - time.monotonic()))
+            if p.is_alive():
+                p.kill()
+        if self.sock is not None:
+            self.sock.close()
+        logger.info("Stopped %d worker(s)", len(self.procs))
+
+    def _on_signal(self, sig: int, frame):
+        if sig == signal.SIGHUP:
+            self._reload = True
+        else:
+            self._stop = True
+
+    def run(self, watch: float = KB_WATCH_INTERVAL):
+        """Supervise until SIGINT / SIGTERM: reloads, KB polling, restarts."""
+        for sig in (signal.SIGHUP, signal.SIGINT, signal.SIGTERM):
+            signal.signal(sig, self._on_signal)
+
+        next_poll = time.monotonic() + watch
+        while not self._stop:
+            try:
+                self._note(self.events.get(timeout=0.5))
+            except queue.Empty:
+                pass
+            if watch > 0 and time.monotonic() >= next_poll:
+                next_poll = time.monotonic() + watch
+                self._reload = self._reload or self.publisher.changed()
+            if self._reload:
+                self._reload = False
+                try:
+                    self.reload()
+                except Exception:
+                    logger.exception("KB reload failed; workers keep version %s",
+                                     sorted(set(self.versions.values()), key=str))
+            for i, p in list(self.procs.items()):
+                if not p.is_alive() and not self._stop:
+                    logger.warning("Worker %d (pid %s) exited with %s – restarting",
+                                   i, p.pid, p.exitcode)
+                    self._spawn(i)
+        self.stop()
+
+
+# ─────────────────────────── CLI ────────────────────────────────────
+def main(argv: List[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description="Serve the API from several worker processes.")
+    parser.add_argument("--workers", type=int, default=SERVE_WORKERS)
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--data-dir", type=Path, default=Path("phase2_data"))
+    parser.add_argument("--log-level", default="info", help="uvicorn log level")
+    parser.add_argument("--report", type=Path, help="write the startup report (JSON) here")
+    args = parser.parse_args(argv)
+
+    supervisor = Supervisor(args.workers, args.host, args.port, args.data_dir, args.log_level)
+    try:
+        report = supervisor.start()
+    except Exception:
+        logger.exception("Startup failed")
+        supervisor.stop()
+        return 1
+    if args.report:
+        args.report.write_text(json.dumps(report, indent=2), encoding="utf-8")
+    supervisor.run()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,170 @@
+from __future__ import annotations
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from pathlib import Path
+import asyncio, os, sqlite3, threading, time, uuid, weakref
+from models import Session
+from logger import init_logger
+
+logger = init_logger(name="chatbot.session_store", level="DEBUG", filename="session_store.log")
+
+SESSION_STORE = os.getenv("SESSION_STORE", "memory")          # memory | sqlite
+SESSION_DB    = os.getenv("SESSION_DB", str(Path(__file__).parent / "sessions.sqlite"))
+SESSION_TTL   = float(os.getenv("SESSION_TTL", "7200"))       # idle seconds
+SESSION_MAX   = int(os.getenv("SESSION_MAX", "10000"))        # memory backend only
+SESSION_PURGE_INTERVAL = float(os.getenv("SESSION_PURGE_INTERVAL", "600"))  # seconds, 0 → never
+
+
+class SessionStore(ABC):
+    """Pluggable store of :class:`Session` objects keyed by session id."""
+
+    def __init__(self, ttl: float = SESSION_TTL):
+        self.ttl = ttl
+        # weak values: a lock lives only while some turn holds or awaits it
+        self._locks: "weakref.WeakValueDictionary[str, asyncio.Lock]" = \
+            weakref.WeakValueDictionary()
+
+    def create(self) -> Session:
+        session = Session(session_id=uuid.uuid4().hex, updated=time.time())
+        self.put(session)
+        return session
+
+    def lock(self, session_id: str) -> asyncio.Lock:
+        """Serializes concurrent turns of one session inside this process."""
+        return self._locks.setdefault(session_id, asyncio.Lock())
+
+    @abstractmethod
+    def get(self, session_id: str) -> Session | None:
+        ...
+
+    @abstractmethod
+    def put(self, session: Session):
+        ...
+
+    @abstractmethod
+    def delete(self, session_id: str):
+        ...
+
+    @abstractmethod
+    def purge(self) -> int:
+        """Delete idle sessions; returns how many were removed."""
+
+    # ── async access for request handlers (blocking stores override these) ──
+    async def acreate(self) -> Session:
+        return self.create()
+
+    async def aget(self, session_id: str) -> Session | None:
+        return self.get(session_id)
+
+    async def aput(self, session: Session):
+        self.put(session)
+
+    async def adelete(self, session_id: str):
+        self.delete(session_id)
+
+
+class MemorySessionStore(SessionStore):
+    """In-process LRU + idle-TTL store (single worker)."""
+
+    def __init__(self, ttl: float = SESSION_TTL, max_size: int = SESSION_MAX):
+        super().__init__(ttl)
+        self.max_size = max_size
+        self._data: "OrderedDict[str, Session]" = OrderedDict()
+
+    def get(self, session_id: str) -> Session | None:
+        session = self._data.get(session_id)
+        if session is None:
+            return None
+        if time.time() - session.updated > self.ttl:
+            self.delete(session_id)
+            return None
+        self._data.move_to_end(session_id)
+        return session
+
+    def put(self, session: Session):
+        session.updated = time.time()
+        self._data[session.session_id] = session
+        self._data.move_to_end(session.session_id)
+        while len(self._data) > self.max_size:
+            self._data.popitem(last=False)
+
+    def delete(self, session_id: str):
+        self._data.pop(session_id, None)
+
+    def purge(self) -> int:
+        cutoff = time.time() - self.ttl
+        removed = 0
+        for sid, session in list(self._data.items()):      # snapshot: turns may run meanwhile
+            if session.updated < cutoff and self._data.pop(sid, None) is not None:
+                removed += 1
+        return removed
+
+
+class SqliteSessionStore(SessionStore):
+    """Local SQLite (WAL) store shared by every worker on the host."""
+
+    def __init__(self, path: Path = Path(SESSION_DB), ttl: float = SESSION_TTL):
+        super().__init__(ttl)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False, timeout=5)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS sessions ("
+            " session_id TEXT PRIMARY KEY, updated REAL NOT NULL, data TEXT NOT NULL)"
+        )
+        self._db.commit()
+
+    def get(self, session_id: str) -> Session | None:
+        with self._lock:
+            row = self._db.execute(
+                "SELECT updated, data FROM sessions WHERE session_id = ?", (session_id,)
+            ).fetchone()
+        if row is None:
+            return None
+        if time.time() - row[0] > self.ttl:
+            self.delete(session_id)
+            return None
+        return Session.model_validate_json(row[1])
+
+    def put(self, session: Session):
+        session.updated = time.time()
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO sessions (session_id, updated, data) VALUES (?, ?, ?)",
+                (session.session_id, session.updated, session.model_dump_json()),
+            )
+            self._db.commit()
+
+    def delete(self, session_id: str):
+        with self._lock:
+            self._db.execute("DELETE FROM sessions WHERE session_id = ?", (session_id,))
+            self._db.commit()
+
+    # SQLite reads / commits hit the disk – keep them off the event loop
+    async def acreate(self) -> Session:
+        return await asyncio.to_thread(self.create)
+
+    async def aget(self, session_id: str) -> Session | None:
+        return await asyncio.to_thread(self.get, session_id)
+
+    async def aput(self, session: Session):
+        await asyncio.to_thread(self.put, session)
+
+    async def adelete(self, session_id: str):
+        await asyncio.to_thread(self.delete, session_id)
+
+    def purge(self) -> int:
+        with self._lock:
+            cur = self._db.execute("DELETE FROM sessions WHERE updated < ?",
+                                   (time.time() - self.ttl,))
+            self._db.commit()
+        return cur.rowcount
+
+
+def session_store_from_env() -> SessionStore:
+    if SESSION_STORE == "sqlite":
+        logger.info("Using SQLite session store at %s", SESSION_DB)
+        return SqliteSessionStore(Path(SESSION_DB))
+    logger.info("Using in-memory session store (max %d sessions)", SESSION_MAX)
+    return MemorySessionStore()
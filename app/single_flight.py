@@ -0,0 +1,208 @@
+"""
+Single-flight coalescing of identical upstream calls.
+
+Concurrent callers asking for the same key share one upstream request: the
+first one starts it, later ones wait for it, and its result – or its
+exception – is handed to every waiter. Calls are keyed per item, so a
+request for several texts joins the ones already in flight and sends only
+the rest.
+
+The sync path (threads) and the async path (one event loop) are coalesced
+separately; nothing is cached once a call has landed. An async call queues
+for admission with the best priority and latest deadline of the turns
+waiting on it (:class:`admission.Ticket`).
+"""
+from __future__ import annotations
+from typing import Awaitable, Callable, Dict, Hashable, List, Sequence, Tuple
+import asyncio, hashlib, json, os, threading
+from logger import init_logger
+import admission
+import metrics
+
+logger = init_logger(name="chatbot.single_flight", level="DEBUG", filename="single_flight.log")
+
+SINGLE_FLIGHT = os.getenv("SINGLE_FLIGHT", "1") == "1"
+
+
+def message_key(deployment: str, messages: List[Dict], temperature: float) -> str:
+    """Chat completion key: deployment, temperature, roles + whitespace-collapsed contents."""
+    body = [(m.get("role"), " ".join(str(m.get("content") or "").split())) for m in messages]
+    raw = json.dumps([deployment, temperature, body], ensure_ascii=False)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+async def _admitted(ticket: admission.Ticket, call: Awaitable):
+    with admission.using(ticket):
+        return await call
+
+
+class _Flight:
+    """One upstream call and the callers waiting on it."""
+
+    __slots__ = ("keys", "task", "done", "result", "error", "waiters", "ticket")
+
+    def __init__(self, keys: List[Hashable]):
+        self.keys = keys
+        self.task: asyncio.Task | None = None          # async path
+        self.done = threading.Event()                   # sync path
+        self.result: List | None = None
+        self.error: BaseException | None = None
+        self.waiters = 0
+        self.ticket: admission.Ticket | None = None     # async path
+
+
+class SingleFlight:
+    """Per-key coalescing of concurrent calls for one upstream operation (*op*)."""
+
+    def __init__(self, op: str, enabled: bool = SINGLE_FLIGHT):
+        self.op, self.enabled = op, enabled
+        self._lock = threading.Lock()
+        self._sync: Dict[Hashable, Tuple[_Flight, int]] = {}
+        self._async: Dict[Tuple[asyncio.AbstractEventLoop, Hashable], Tuple[_Flight, int]] = {}
+        self.calls = self.saved = self.shared_keys = self.shared_errors = 0
+
+    def _plan(self, table: Dict, keys: Sequence[Hashable], scope=None
+              ) -> Tuple[Dict[Hashable, Tuple[_Flight, int]], Dict[Hashable, int]]:
+        """(key → (flight, slot)) of keys in flight + (key → first position) of new keys."""
+        joined: Dict[Hashable, Tuple[_Flight, int]] = {}
+        new: Dict[Hashable, int] = {}
+        for i, key in enumerate(keys):
+            if key in joined or key in new:
+                continue
+            entry = table.get(key if scope is None else (scope, key))
+            if entry is None:
+                new[key] = i
+            else:
+                joined[key] = entry
+        return joined, new
+
+    def _count(self, joined: int, new: int):
+        """Bookkeeping for one caller (under the lock)."""
+        self.shared_keys += joined
+        if new:
+            self.calls += 1
+        elif joined:
+            self.saved += 1
+            metrics.UPSTREAM_COALESCED.inc(op=self.op)
+
+    def _shared_error(self, exc: BaseException):
+        with self._lock:
+            self.shared_errors += 1
+        logger.info("%s: coalesced call failed (%s), error passed to a waiting caller",
+                    self.op, type(exc).__name__)
+
+    # ────────────────── sync ──────────────────
+    def do_many(self, keys: Sequence[Hashable], fetch: Callable[[List[int]], List]) -> List:
+        """
+        One result per key. Keys in flight in other threads are waited for;
+        the rest are fetched here with ``fetch(positions)`` (indices into
+        *keys*, one result each).
+        """
+        if not self.enabled or not keys:
+            return fetch(list(range(len(keys))))
+        with self._lock:
+            joined, new = self._plan(self._sync, keys)
+            self._count(len(joined), len(new))
+            mine = _Flight(list(new)) if new else None
+            for slot, key in enumerate(new):
+                self._sync[key] = joined[key] = (mine, slot)
+
+        if mine is not None:
+            try:
+                mine.result = fetch(list(new.values()))
+            except BaseException as exc:
+                mine.error = exc
+            finally:
+                with self._lock:
+                    for key in mine.keys:
+                        self._sync.pop(key, None)
+                mine.done.set()
+
+        for flight in {id(f): f for f, _ in joined.values()}.values():
+            flight.done.wait()
+            if flight.error is not None:
+                if flight is not mine:
+                    self._shared_error(flight.error)
+                raise flight.error
+        return [joined[k][0].result[joined[k][1]] for k in keys]
+
+    def do(self, key: Hashable, fn: Callable[[], object]):
+        return self.do_many([key], lambda _: [fn()])[0]
+
+    # ────────────────── async ──────────────────
+    def _landed(self, loop: asyncio.AbstractEventLoop, flight: _Flight, task: asyncio.Task):
+        with self._lock:
+            for key in flight.keys:
+                if self._async.get((loop, key), (None,))[0] is flight:
+                    del self._async[(loop, key)]
+        task.cancelled() or task.exception()           # retrieved: no "never retrieved" warning
+
+    def _leave(self, loop: asyncio.AbstractEventLoop, flights: List[_Flight]):
+        """A waiter went away; cancel calls nobody waits for any more."""
+        with self._lock:
+            for flight in flights:
+                flight.waiters -= 1
+                if flight.waiters == 0 and not flight.task.done():
+                    for key in flight.keys:     # later callers start a fresh call
+                        if self._async.get((loop, key), (None,))[0] is flight:
+                            del self._async[(loop, key)]
+                    flight.task.cancel()
+
+    async def ado_many(self, keys: Sequence[Hashable],
+                       fetch: Callable[[List[int]], Awaitable[List]]) -> List:
+        """
+        Async :meth:`do_many`. The upstream call runs as its own task, so a
+        caller that is cancelled (client gone, timeout) does not fail the
+        others; the call is cancelled once no caller waits for it.
+        """
+        if not self.enabled or not keys:
+            return await fetch(list(range(len(keys))))
+        loop = asyncio.get_running_loop()
+        mine = None
+        with self._lock:
+            joined, new = self._plan(self._async, keys, loop)
+            self._count(len(joined), len(new))
+            if new:
+                mine = _Flight(list(new))
+                mine.ticket = admission.ticket()
+                mine.task = loop.create_task(_admitted(mine.ticket, fetch(list(new.values()))))
+                mine.task.add_done_callback(lambda t, f=mine: self._landed(loop, f, t))
+                for slot, key in enumerate(new):
+                    self._async[(loop, key)] = joined[key] = (mine, slot)
+            flights = list({id(f): f for f, _ in joined.values()}.values())
+            for flight in flights:
+                flight.waiters += 1
+                if flight is not mine:
+                    admission.join(flight.ticket)
+
+        try:
+            await asyncio.wait([f.task for f in flights])
+        except asyncio.CancelledError:
+            self._leave(loop, flights)
+            raise
+        self._leave(loop, flights)
+
+        for flight in flights:
+            if flight.task.cancelled() or flight.task.exception() is not None:
+                if flight is not mine:
+                    self._shared_error(flight.task.exception() if not flight.task.cancelled()
+                                       else asyncio.CancelledError())
+                flight.task.result()                    # raises the call's exception
+        return [joined[k][0].task.result()[joined[k][1]] for k in keys]
+
+    async def ado(self, key: Hashable, fn: Callable[[], Awaitable[object]]):
+        async def fetch(_):
+            return [await fn()]
+        return (await self.ado_many([key], fetch))[0]
+
+    def stats(self) -> Dict[str, float]:
+        with self._lock:
+            callers = self.calls + self.saved
+            return {
+                "in_flight":     len(self._sync) + len(self._async),
+                "calls":         self.calls,
+                "saved":         self.saved,
+                "shared_keys":   self.shared_keys,
+                "shared_errors": self.shared_errors,
+                "saved_rate":    self.saved / callers if callers else 0.0,
+            }
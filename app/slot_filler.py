@@ -0,0 +1,202 @@
+"""
+Deterministic, bilingual (he/en) slot filler for onboarding replies.
+
+Fills profile fields straight from the user's message when the answer is
+unambiguous (a 9-digit number, an age, an HMO / tier / gender word) and the
+field the bot just asked for is among them. Anything else – including a
+number or gender word it would not use – returns ``None`` so the caller
+falls back to the extractor LLM.
+"""
+from __future__ import annotations
+from typing import Dict, List, Tuple
+import re, threading
+from utils import HMO_NAMES_HE, HMO_NAMES_EN
+from validators import valid_fields
+
+# ── What did the bot just ask for? The keyword ending nearest the end of the
+# message wins (the actual question usually comes last); ties → list order ──
+_ASKED: List[Tuple[str, Tuple[str, ...]]] = [
+    ("hmo_card",   ("card", "כרטיס", "כרטיס קופה", "כרטיס הקופה")),
+    ("id_number",  ("id", "teudat", "תעודת זהות", "זהות", "ת.ז", "תז")),
+    ("tier",       ("tier", "membership", "gold", "רמת ביטוח", "מסלול", "זהב")),
+    ("hmo",        ("hmo", "maccabi", "clalit", "meuhedet", "insured", "קופת חולים", "קופה", "מכבי")),
+    ("age",        ("age", "how old", "גיל", "בן כמה", "בת כמה")),
+    ("gender",     ("gender", "sex", "מגדר", "מין")),
+    ("first_name", ("name", "שם")),
+]
+_ASKED_RE = [(field, re.compile("|".join(
+                 rf"\b{re.escape(k)}\b" if k.isascii() else re.escape(k)
+                 for k in sorted(keys, key=len, reverse=True))))
+             for field, keys in _ASKED]
+
+_TIER_WORDS = {
+    "gold": "Gold", "silver": "Silver", "bronze": "Bronze",
+    "זהב": "זהב", "כסף": "כסף", "ארד": "ארד",
+}
+_GENDER_WORDS = {
+    "male": "Male", "man": "Male", "m": "Male",
+    "female": "Female", "woman": "Female", "f": "Female",
+    "זכר": "זכר", "גבר": "זכר", "נקבה": "נקבה", "אישה": "נקבה", "אשה": "נקבה",
+}
+# a reply with any of these is not taken at face value
+_NEGATIONS = {"not", "no", "don't", "dont", "never", "isn't", "לא", "אין", "אינני", "איני"}
+# words that carry no slot information; more than _MAX_UNKNOWN other words
+# means the reply is free text and goes to the LLM
+_FILLER = {
+    "i", "i'm", "im", "am", "it", "it's", "its", "is", "my", "the", "a", "an", "and",
+    "think", "sure", "sorry", "ok", "okay", "yes", "yeah", "please", "thanks", "here",
+    "number", "card", "id", "age", "old", "years", "year", "with", "in", "of", "at",
+    "hmo", "tier", "gender", "member", "insured", "plan", "level", "membership",
+    "אני", "שלי", "זה", "זו", "כן", "בן", "בת", "שנים", "שנה", "מספר", "הוא", "היא",
+    "קופה", "קופת", "חולים", "כרטיס", "רמת", "ביטוח", "מסלול", "תודה", "בבקשה", "סליחה",
+}
+_MAX_UNKNOWN = 2
+
+_TOKEN  = re.compile(r"[\w'֐-׿]+")
+_NINE   = re.compile(r"(?<!\d)\d{9}(?!\d)")
+_NUMBER = re.compile(r"(?<!\d)\d{1,3}(?!\d)")
+
+
+def asked_field(question: str | None) -> str | None:
+    """Profile field the assistant's last message asked for (None if unclear)."""
+    if not question:
+        return None
+    q = question.lower()
+    best, best_pos = None, -1
+    for field, pattern in _ASKED_RE:
+        pos = max((m.end() for m in pattern.finditer(q)), default=-1)
+        if pos > best_pos:
+            best, best_pos = field, pos
+    return best
+
+
+def _words(text: str) -> List[str]:
+    # Hebrew one-letter prefixes (ו/ב/ה/ל/מ/ש) are stripped from the head of words
+    words = []
+    for w in _TOKEN.findall(text.lower()):
+        words.append(w)
+        if len(w) > 2 and w[0] in "ובהלמש":
+            words.append(w[1:])
+    return words
+
+
+def fill_slots(last_question: str | None, user_text: str, confirmed: Dict) -> Dict | None:
+    """
+    Return the fields unambiguously present in *user_text*, or ``None`` when the
+    LLM extractor is needed (field asked for not found, conflicting values,
+    negations, free text such as names).
+    """
+    asked = asked_field(last_question)
+    if asked is None or asked in ("first_name", "last_name"):
+        return None
+
+    words = _words(user_text)
+    if _NEGATIONS & set(words):
+        return None
+    tokens = _TOKEN.findall(user_text.lower())
+
+    found: Dict = {}
+
+    # 9-digit numbers → the asked one of id_number / hmo_card
+    nines = _NINE.findall(user_text)
+    if len(nines) > 1:
+        return None
+    if nines:
+        if asked in ("id_number", "hmo_card"):
+            found[asked] = nines[0]
+        else:
+            open_ids = [f for f in ("id_number", "hmo_card") if f not in confirmed]
+            if len(open_ids) != 1:
+                return None
+            found[open_ids[0]] = nines[0]
+
+    # HMO – exactly one distinct HMO mentioned
+    hmos = {en for he, en in zip(HMO_NAMES_HE, HMO_NAMES_EN) if he in words or en in words}
+    if len(hmos) > 1:
+        return None
+    if hmos:
+        en = hmos.pop()
+        he = HMO_NAMES_HE[HMO_NAMES_EN.index(en)]
+        found["hmo"] = he if he in words else en.capitalize()
+
+    # tier – exactly one tier word
+    tiers = {_TIER_WORDS[w] for w in words if w in _TIER_WORDS}
+    if len(tiers) > 1:
+        return None
+    if tiers and (asked == "tier" or "tier" not in confirmed):
+        found["tier"] = tiers.pop()
+
+    # gender – only when asked (single letters are too weak otherwise)
+    if asked == "gender":
+        genders = {_GENDER_WORDS[w] for w in words if w in _GENDER_WORDS}
+        if len(genders) != 1:
+            return None
+        found["gender"] = genders.pop()
+
+    # age – only when asked, a single small number
+    if asked == "age" and not nines:
+        numbers = _NUMBER.findall(user_text)
+        if len(numbers) != 1:
+            return None
+        found["age"] = int(numbers[0])
+
+    if asked not in found:
+        return None
+
+    # a value the filler did not take (an age next to an ID, a gender word
+    # when the age was asked) would be lost – the LLM reads the whole reply
+    rest = _NINE.sub(" ", user_text)
+    if asked != "age" and any(ch.isdigit() for ch in rest):
+        return None
+    if asked != "gender" and set(words) & set(_GENDER_WORDS):
+        return None
+
+    # anything beyond a few unexplained words is free text (e.g. a name too)
+    explained = _FILLER | set(_TIER_WORDS) | set(HMO_NAMES_EN) | set(HMO_NAMES_HE)
+    if asked == "gender":
+        explained |= set(_GENDER_WORDS)
+    unknown = [t for t in tokens
+               if not t.isdigit() and t not in explained and t[1:] not in explained]
+    if len(unknown) > _MAX_UNKNOWN:
+        return None
+
+    found = valid_fields(found)
+    return found if asked in found else None
+
+
+class SlotFillerStats:
+    """Hit rate and estimated extractor latency saved."""
+
+    def __init__(self, alpha: float = 0.1):
+        self._lock = threading.Lock()
+        self.alpha = alpha
+        self.hits = self.misses = self.fields_filled = 0
+        self.llm_ms_ewma = 0.0            # moving average of real extractor calls
+        self.saved_ms = 0.0
+
+    def record_hit(self, n_fields: int):
+        with self._lock:
+            self.hits += 1
+            self.fields_filled += n_fields
+            self.saved_ms += self.llm_ms_ewma
+
+    def record_llm(self, ms: float):
+        with self._lock:
+            self.misses += 1
+            self.llm_ms_ewma = (ms if not self.llm_ms_ewma
+                                else self.alpha * ms + (1 - self.alpha) * self.llm_ms_ewma)
+
+    def stats(self) -> Dict[str, float]:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "hits":          self.hits,
+                "misses":        self.misses,
+                "fields_filled": self.fields_filled,
+                "hit_rate":      self.hits / total if total else 0.0,
+                "llm_ms_avg":    round(self.llm_ms_ewma, 1),
+                "saved_ms":      round(self.saved_ms, 1),
+            }
+
+
+stats = SlotFillerStats()
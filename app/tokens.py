@@ -0,0 +1,67 @@
+"""Local token counting (no network) for prompt-size budgets and reports."""
+from __future__ import annotations
+from typing import Dict, List
+import re
+
+try:                                    # exact counts when tiktoken is installed
+    import tiktoken
+    _ENC = tiktoken.get_encoding("cl100k_base")
+except Exception:                       # ImportError, or no cached BPE file offline
+    _ENC = None
+
+# Fallback estimate calibrated on cl100k: ~4 chars per Latin token, Hebrew
+# letters are split much finer (~1.5 chars per token), digits ~3 per token.
+_HEBREW = re.compile(r"[֐-׿]")
+_DIGIT  = re.compile(r"\d")
+
+# chat format overhead per message (role + separators)
+MESSAGE_OVERHEAD = 4
+
+
+def count_tokens(text: str) -> int:
+    """Number of tokens in *text* (exact with tiktoken, estimated otherwise)."""
+    if not text:
+        return 0
+    if _ENC is not None:
+        return len(_ENC.encode(text))
+    he = len(_HEBREW.findall(text))
+    digits = len(_DIGIT.findall(text))
+    other = len(text) - he - digits
+    return max(1, round(he / 1.5 + digits / 3 + other / 4))
+
+
+def count_message_tokens(messages: List[Dict[str, str]]) -> int:
+    """Prompt tokens of a chat message list, including per-message overhead."""
+    return sum(count_tokens(m.get("content") or "") + MESSAGE_OVERHEAD for m in messages) + 2
+
+
+def truncate_tokens(text: str, budget: int) -> str:
+    """
+    Longest prefix of *text* within *budget* tokens, cut at a line break when
+    possible (KB rows and history lines stay whole).
+    """
+    if count_tokens(text) <= budget:
+        return text
+    if budget <= 0:
+        return ""
+    kept: List[str] = []
+    used = 0
+    for line in text.split("\n"):
+        cost = count_tokens(line) + (1 if kept else 0)
+        if used + cost > budget:
+            break
+        kept.append(line)
+        used += cost
+    if kept:
+        return "\n".join(kept)
+    # a single over-long first line: cut inside it
+    if _ENC is not None:
+        return _ENC.decode(_ENC.encode(text)[:budget])
+    lo, hi = 0, len(text)
+    while lo < hi:
+        mid = (lo + hi + 1) // 2
+        if count_tokens(text[:mid]) <= budget:
+            lo = mid
+        else:
+            hi = mid - 1
+    return text[:lo]
@@ -1,5 +1,5 @@
-from langdetect import detect, LangDetectException
-from typing import List, Dict
+from typing import List, Dict, Tuple
+import re
 # from googletrans import Translator
 
 HMO_NAMES_HE = ["מכבי", "מאוחדת", "כללית"]
@@ -12,20 +12,63 @@ HE_2_EN = {
 }
 EN_2_HE = {v: k for k, v in HE_2_EN.items()}
 
-# Simple language detection: tries langdetect, otherwise heuristic fallback.
-def detect_lang(message: str, history: List[Dict]) -> str:
-    """Return 'he' (Hebrew) or 'en' (English)."""
-    try:
-        code = detect(message)
-        return "he" if code == "he" else "en"
-    except LangDetectException:
-        # Fallback: check previous user messages for Hebrew chars
-        for m in reversed(history):
+TIER_NAMES_HE = ["זהב", "כסף", "ארד"]
+TIER_NAMES_EN = ["gold", "silver", "bronze"]
+TIER_HE = {**dict(zip(TIER_NAMES_EN, TIER_NAMES_HE)), **{t: t for t in TIER_NAMES_HE}}
+
+# ── Language detection (Unicode script of each word) ────────────────
+_WORD   = re.compile(r"[^\W\d_]+")
+_HEBREW = re.compile(r"[\u0590-\u05FF\uFB1D-\uFB4F]")
+_LATIN  = re.compile(r"[A-Za-z\u00C0-\u024F]")
+
+# a conversation's language only flips on a message with at least this many
+# words, this share of them in the other script
+LANG_SWITCH_WORDS = 3
+LANG_SWITCH_SHARE = 0.8
+
+
+def script_words(text: str) -> Tuple[int, int]:
+    """(Hebrew words, Latin words) in *text*; digits, punctuation and other scripts ignored."""
+    he = en = 0
+    for word in _WORD.findall(text):
+        if _HEBREW.search(word):
+            he += 1
+        elif _LATIN.search(word):
+            en += 1
+    return he, en
+
+
+def next_lang(current: str | None, message: str) -> str | None:
+    """
+    Conversation language after *message*. Without a current language any
+    letters decide (majority of words, ties → Hebrew); with one, only a
+    long, clearly single-script message switches it – "ok", "gold", "כן"
+    or an ID number never do.
+    """
+    he, en = script_words(message)
+    if not he and not en:
+        return current
+    lang = "he" if he >= en else "en"
+    if current is None or lang == current:
+        return lang
+    words = max(he, en)
+    if words >= LANG_SWITCH_WORDS and words / (he + en) >= LANG_SWITCH_SHARE:
+        return lang
+    return current
+
+
+def detect_lang(message: str, history: List[Dict], sticky: str | None = None) -> str:
+    """
+    Return 'he' (Hebrew) or 'en' (English) – deterministic, no model.
+    *sticky* is the conversation language so far; without it the user
+    messages in *history* are replayed.
+    """
+    lang = sticky
+    if lang is None:
+        for m in history:
             if m.get("role") == "user":
-                if any("֐" <= ch <= "ת" for ch in m["content"]):
-                    return "he"
-                break
-        return "en"
+                lang = next_lang(lang, m["content"])
+    return next_lang(lang, message) or "en"
     
 # ── HMO mention detection ────────────────────────────────────────────
 def detect_hmos(text: str) -> List[str]:
@@ -38,6 +81,53 @@ def detect_hmos(text: str) -> List[str]:
             found.append(en)
     return found
 
+# ── Tier mention detection ───────────────────────────────────────────
+_TIER_TOKEN = re.compile(r"[\w'\u0590-\u05FF]+")
+# "כסף" is also plain "money" – it names the tier only next to one of these
+_TIER_CUES = {"מסלול", "רמת", "רמה", "tier", "level", "plan"}
+_TIER_CUE_SPAN = 2      # words either side
+
+
+def _word_forms(word: str) -> Tuple[str, ...]:
+    # Hebrew one-letter prefixes (ו/ב/ה/ל/מ/ש), also stacked ("ובזהב")
+    forms = [word]
+    while len(word) > 2 and word[0] in "ובהלמש":
+        word = word[1:]
+        forms.append(word)
+    return tuple(forms)
+
+
+def detect_tiers(text: str) -> List[str]:
+    """Return the Hebrew names of the tiers mentioned in text (whole words, Hebrew or English)."""
+    words = [_word_forms(w) for w in _TIER_TOKEN.findall(text.lower())]
+    found = []
+    for i, forms in enumerate(words):
+        for he, en in zip(TIER_NAMES_HE, TIER_NAMES_EN):
+            if he in found or (he not in forms and en not in forms):
+                continue
+            if he == "כסף" and en not in forms:
+                near = words[max(0, i - _TIER_CUE_SPAN):i + _TIER_CUE_SPAN + 1]
+                if not any(f in _TIER_CUES for w in near for f in w):
+                    continue
+            found.append(he)
+    return [he for he in TIER_NAMES_HE if he in found]
+
+# ── QA retrieval filters ─────────────────────────────────────────────
+def query_hmos(profile_hmo: str, text: str) -> List[str]:
+    """HMO names (lower-case, Hebrew and English) a question is about: mentioned ones + the user's own."""
+    names = [h.lower() for h in detect_hmos(text)]
+    own = (profile_hmo or "").lower()
+    for name in (own, EN_2_HE.get(own, own), HE_2_EN.get(own, own)):
+        if name not in names:
+            names.append(name)
+    return names
+
+
+def query_tiers(profile_tier: str, text: str) -> List[str]:
+    """Hebrew tier names to show: the user's tier plus any tier the question asks about."""
+    tiers = [TIER_HE[t] for t in [(profile_tier or "").lower()] if t in TIER_HE]
+    return tiers + [t for t in detect_tiers(text) if t not in tiers]
+
 # # ── ENG2HEB Language translation ───────────────────────────────────────────
 # def translate_to_he(text: str) -> str:
 #     """Translate English text to Hebrew using Google Translate."""
@@ -1,5 +1,6 @@
 from models import UserInfo
-from typing import Tuple, List
+from typing import Annotated, Dict, Tuple, List
+from pydantic import TypeAdapter, ValidationError
 
 HMOs = ["מכבי", "מאוחדת", "כללית", "maccabi", "meuhedet", "clalit", "Maccabi", "Meuhedet", "Clalit"]
 Tiers = ["זהב", "כסף", "ארד", "gold", "silver", "bronze", "Gold", "Silver", "Bronze"]
@@ -45,3 +46,25 @@ def validate_profile(p: UserInfo, lang: str = "en") -> Tuple[bool, List[str]]:
             if not p.first_name or not p.last_name:
                 errs.append("First and last name cannot be empty")
     return (len(errs) == 0, errs)
+
+# per-field validators built from the UserInfo annotations (pattern, range …)
+_FIELD_ADAPTERS = {name: TypeAdapter(Annotated[(f.annotation, *f.metadata)])
+                   if f.metadata else TypeAdapter(f.annotation)
+                   for name, f in UserInfo.model_fields.items()}
+
+def valid_fields(profile: Dict) -> Dict:
+    """Return only the fields of a (partial) profile whose values are valid on their own."""
+    ok = {}
+    for name, value in profile.items():
+        if name not in _FIELD_ADAPTERS or value in (None, ""):
+            continue
+        try:
+            value = _FIELD_ADAPTERS[name].validate_python(value)
+        except ValidationError:
+            continue
+        if name == "hmo" and value not in HMOs:
+            continue
+        if name == "tier" and value not in Tiers:
+            continue
+        ok[name] = value
+    return ok
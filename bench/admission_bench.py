@@ -0,0 +1,122 @@
+"""
+Burst behaviour of ``/chat`` with admission control on and off, against a
+mock Azure deployment that serves a limited number of chat calls at once.
+
+A burst of stateless turns – half QA questions, half first onboarding
+messages – arrives at once. Every client gives up ``--client-timeout``
+seconds after it started (``frontend/ui.py`` uses 60 s; the default here is
+scaled down with the burst) and, when turned away with 429 / 503, retries
+after ``Retry-After`` while it has time left. Reports answered / timed-out /
+finally rejected turns, latency of the answered ones, how fast rejections
+come back, and QA vs onboarding success.
+
+    python bench/admission_bench.py
+    python bench/admission_bench.py --burst 400 --capacity 8
+"""
+from __future__ import annotations
+from types import SimpleNamespace
+from typing import Dict, List
+import argparse, asyncio, time
+
+import httpx
+
+from load_test import percentile, servers
+from retrieval_bench import QUESTIONS
+
+
+def turn(i: int) -> Dict:
+    if i % 2:
+        question, hmo, _ = QUESTIONS[i % len(QUESTIONS)]
+        profile = {"first_name": "Dana", "last_name": f"Levi{i}", "id_number": f"{100000000 + i}",
+                   "gender": "Female", "age": 30, "hmo": hmo,
+                   "hmo_card": f"{200000000 + i}", "tier": "זהב"}
+        return {"phase": "qa", "user_info": profile, "history": [], "message": question}
+    return {"phase": "info_collection", "history": [], "message": f"Hi, I am user number {i}"}
+
+
+async def burst(api: str, n: int, client_timeout: float) -> List[Dict]:
+    async def one(http: httpx.AsyncClient, i: int) -> Dict:
+        body = turn(i)
+        t0 = time.perf_counter()
+        end = t0 + client_timeout
+        attempts, reject_ms = 0, []
+        while True:
+            attempts += 1
+            t1 = time.perf_counter()
+            try:
+                r = await http.post(f"{api}/chat", json=body, timeout=end - t1)
+                status = r.status_code
+            except httpx.TimeoutException:
+                status = "timeout"
+                break
+            if status not in (429, 503):
+                break
+            reject_ms.append((time.perf_counter() - t1) * 1000)
+            wait = float(r.headers.get("Retry-After", "1"))
+            if time.perf_counter() + wait >= end:
+                break
+            await asyncio.sleep(wait)
+        return {"phase": body["phase"], "status": status, "attempts": attempts,
+                "reject_ms": reject_ms, "ms": (time.perf_counter() - t0) * 1000}
+
+    limits = httpx.Limits(max_connections=n, max_keepalive_connections=n)
+    async with httpx.AsyncClient(limits=limits) as http:
+        return await asyncio.gather(*(one(http, i) for i in range(n)))
+
+
+def summarize(label: str, results: List[Dict]) -> Dict:
+    ok = [r for r in results if r["status"] == 200]
+    reject_ms = [ms for r in results for ms in r["reject_ms"]]
+    by_phase = {p: [r for r in results if r["phase"] == p] for p in ("qa", "info_collection")}
+    return {"label": label, "ok": len(ok), "timeout": sum(r["status"] == "timeout" for r in results),
+            "429": sum(r["status"] == 429 for r in results),
+            "503": sum(r["status"] == 503 for r in results),
+            "other": sum(r["status"] not in (200, 429, 503, "timeout") for r in results),
+            "ok_p50": percentile([r["ms"] for r in ok], 50) if ok else 0.0,
+            "ok_p95": percentile([r["ms"] for r in ok], 95) if ok else 0.0,
+            "reject_p50": percentile(reject_ms, 50) if reject_ms else 0.0,
+            "attempts": sum(r["attempts"] for r in results) / len(results),
+            **{f"{p}_ok": sum(r["status"] == 200 for r in rs) / len(rs) for p, rs in by_phase.items()}}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--burst", type=int, default=300, help="turns arriving at once")
+    parser.add_argument("--capacity", type=int, default=8, help="mock chat calls served at once")
+    parser.add_argument("--client-timeout", type=float, default=15.0)
+    parser.add_argument("--chat-latency", default="lognormal:400,0.35")
+    args = parser.parse_args()
+
+    # the deployment's capacity for replies, a quarter of it more for the extractor
+    extractor = max(1, args.capacity // 4)
+    admitted = [("ADMIT_COMPLETION", str(args.capacity)),
+                ("ADMIT_EXTRACTOR", str(extractor)),
+                ("ADMIT_QUEUE", str(args.burst // 4)),
+                ("ADMIT_WAIT", str(args.client_timeout / 3))]
+    rows = []
+    for label, env in (("no admission", [("ADMISSION", "0")]),
+                       ("admission control", [("ADMISSION", "1"), *admitted])):
+        server_args = SimpleNamespace(chat_latency=args.chat_latency, token_ms=8.0,
+                                      embed_latency="lognormal:40,0.3", seed=0,
+                                      chat_capacity=args.capacity,
+                                      env=[("ANSWER_CACHE", "0"), *env])
+        with servers(server_args) as (api, mock):
+            results = asyncio.run(burst(api, args.burst, args.client_timeout))
+            peak = httpx.get(f"{mock}/mock/stats").json()["peak_in_flight"]
+        rows.append({**summarize(label, results), "peak": peak})
+
+    print(f"burst of {args.burst} turns (half QA), mock capacity {args.capacity} chat calls, "
+          f"client timeout {args.client_timeout:.0f} s")
+    print(f"{'':>18} | {'ok':>4} | {'timeout':>7} | {'429':>4} | {'503':>4} | {'tries':>5} | "
+          f"{'ok p50':>7} | {'ok p95':>7} | {'reject p50':>10} | {'QA ok':>5} | {'onb ok':>6} | "
+          f"{'upstream peak':>13}")
+    print("-" * 124)
+    for r in rows:
+        print(f"{r['label']:>18} | {r['ok']:>4} | {r['timeout']:>7} | {r['429']:>4} | {r['503']:>4} | "
+              f"{r['attempts']:>5.2f} | {r['ok_p50']:>7.0f} | {r['ok_p95']:>7.0f} | "
+              f"{r['reject_p50']:>7.0f} ms | {r['qa_ok']:>5.0%} | {r['info_collection_ok']:>6.0%} | "
+              f"{r['peak']:>13}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+"""
+Bulk evaluation: N (profile, question) items answered one ``/chat`` request
+at a time vs one ``/chat/batch`` request, against the mock Azure server.
+
+Reports wall time, items/s, p50/p95 per-item latency, the embedding
+requests sent upstream and the per-item token usage the batch reports.
+
+    python bench/batch_bench.py
+    python bench/batch_bench.py --items 240 --concurrency 16
+"""
+from __future__ import annotations
+from types import SimpleNamespace
+from typing import Dict, List
+import argparse, asyncio, json, time
+
+import httpx
+
+from load_test import percentile, servers
+from retrieval_bench import QUESTIONS
+
+TIERS = ("זהב", "כסף", "ארד")
+
+
+def items(n: int) -> List[Dict]:
+    out = []
+    for i in range(n):
+        question, hmo, _ = QUESTIONS[i % len(QUESTIONS)]
+        profile = {"first_name": "Dana", "last_name": "Levi", "id_number": f"{100000000 + i}",
+                   "gender": "Female", "age": 20 + i % 60, "hmo": hmo,
+                   "hmo_card": f"{200000000 + i}", "tier": TIERS[i // len(QUESTIONS) % 3]}
+        out.append({"id": f"q{i}", "user_info": profile, "question": question})
+    return out
+
+
+async def serial(api: str, batch: List[Dict]) -> Dict:
+    latencies = []
+    async with httpx.AsyncClient(timeout=120) as http:
+        t0 = time.perf_counter()
+        for item in batch:
+            t1 = time.perf_counter()
+            r = await http.post(f"{api}/chat", json={"phase": "qa", "user_info": item["user_info"],
+                                                     "history": [], "message": item["question"]})
+            r.raise_for_status()
+            latencies.append((time.perf_counter() - t1) * 1000)
+        return {"wall_s": time.perf_counter() - t0, "latency_ms": latencies, "ok": len(latencies)}
+
+
+async def batched(api: str, batch: List[Dict], concurrency: int, timeout: float) -> Dict:
+    results = []
+    async with httpx.AsyncClient(timeout=600) as http:
+        t0 = time.perf_counter()
+        async with http.stream("POST", f"{api}/chat/batch",
+                               json={"items": batch, "concurrency": concurrency,
+                                     "timeout": timeout}) as r:
+            r.raise_for_status()
+            async for line in r.aiter_lines():
+                if line.strip():
+                    results.append(json.loads(line))
+        wall = time.perf_counter() - t0
+    return {"wall_s": wall, "latency_ms": [r["latency_ms"] for r in results],
+            "ok": sum(r["status"] == "ok" for r in results),
+            "tokens": sum(r["prompt_tokens"] + r["completion_tokens"] for r in results) / len(results)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--items", type=int, default=120)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--timeout", type=float, default=30.0, help="seconds per completion")
+    parser.add_argument("--chat-latency", default="lognormal:400,0.35")
+    parser.add_argument("--embed-latency", default="lognormal:40,0.3")
+    args = parser.parse_args()
+
+    server_args = SimpleNamespace(chat_latency=args.chat_latency, token_ms=8.0,
+                                  embed_latency=args.embed_latency, seed=0, chat_capacity=0,
+                                  env=[("ANSWER_CACHE", "0"),
+                                       ("BATCH_CONCURRENCY", str(args.concurrency))])
+    batch = items(args.items)
+    rows = []
+    with servers(server_args) as (api, mock):
+        # batch first: the serial run would leave every question in the query cache
+        for label, run in ((f"/chat/batch ×{args.concurrency}",
+                            lambda: batched(api, batch, args.concurrency, args.timeout)),
+                           ("serial /chat", lambda: serial(api, batch))):
+            httpx.post(f"{mock}/mock/reset")
+            r = asyncio.run(run())
+            r["label"] = label
+            r["embed_calls"] = httpx.get(f"{mock}/mock/stats").json()["calls"].get("embed", 0)
+            rows.append(r)
+
+    print(f"{args.items} items, mock chat latency {args.chat_latency}")
+    print(f"{'mode':>16} | {'wall s':>6} | {'items/s':>7} | {'p50 ms':>7} | {'p95 ms':>7} | "
+          f"{'ok':>4} | {'embed req':>9}")
+    print("-" * 76)
+    for r in rows:
+        print(f"{r['label']:>16} | {r['wall_s']:>6.1f} | {len(batch) / r['wall_s']:>7.1f} | "
+              f"{percentile(r['latency_ms'], 50):>7.0f} | {percentile(r['latency_ms'], 95):>7.0f} | "
+              f"{r['ok']:>4} | {r['embed_calls']:>9}")
+    print(f"latency = request start → item result; batch tokens per item "
+          f"(prompt + completion): {rows[0]['tokens']:.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,132 @@
+"""
+Single-flight coalescing: N concurrent identical embedding / chat calls
+through the real Azure clients against the mock server, with coalescing
+on and off – upstream requests sent, wall time, and what every caller got
+when the upstream call fails.
+
+    python bench/coalesce_bench.py
+    python bench/coalesce_bench.py --callers 200
+"""
+from __future__ import annotations
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List
+import argparse, asyncio, os, subprocess, sys, time
+
+import httpx
+
+os.environ["LOG_CONSOLE"] = "0"
+from fakes import APP_DIR  # noqa: E402
+from load_test import BENCH_DIR, free_port, wait_for  # noqa: E402
+
+QUESTION = "How much discount do I get on dental fillings?"
+MESSAGES = [{"role": "system", "content": "You are a medical-services chatbot."},
+            {"role": "user", "content": QUESTION}]
+
+
+def upstream(mock: str) -> Dict[str, int]:
+    return httpx.get(f"{mock}/mock/stats").json()["calls"]
+
+
+async def run_async(client, n: int, kind: str) -> List:
+    # a few spellings of the same question: the key is normalized
+    variants = [QUESTION, QUESTION.upper(), f"  {QUESTION}  "]
+    if kind == "embed":
+        calls = [client.embed([variants[i % 3]]) for i in range(n)]
+    else:
+        calls = [client.chat(MESSAGES) for _ in range(n)]
+    return await asyncio.gather(*calls, return_exceptions=True)
+
+
+def run_sync(client, n: int, kind: str) -> List:
+    def call(i: int):
+        try:
+            return client.embed([QUESTION]) if kind == "embed" else client.chat(MESSAGES)
+        except Exception as exc:
+            return exc
+    with ThreadPoolExecutor(max_workers=n) as pool:
+        return list(pool.map(call, range(n)))
+
+
+def measure(label: str, mock: str, fn: Callable[[], List]) -> Dict:
+    httpx.post(f"{mock}/mock/reset")
+    t0 = time.perf_counter()
+    results = fn()
+    wall = time.perf_counter() - t0
+    calls = upstream(mock)
+    errors = {type(r).__name__ for r in results if isinstance(r, Exception)}
+    return {"label": label, "wall_ms": wall * 1000,
+            "requests": calls.get("embed", 0) + sum(v for k, v in calls.items()
+                                                     if k not in ("embed", "embed_texts")),
+            "ok": sum(not isinstance(r, Exception) for r in results),
+            "errors": ",".join(sorted(errors)) or "-"}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--callers", type=int, default=50)
+    args = parser.parse_args()
+
+    mock_port = free_port()
+    mock = f"http://127.0.0.1:{mock_port}"
+    os.environ.update({"AZURE_OPENAI_ENDPOINT": mock, "AZURE_OPENAI_KEY": "mock",
+                       "AZURE_OPENAI_API_VERSION": "2024-02-15-preview",
+                       "AZURE_OPENAI_DEPLOYMENT": "mock-chat",
+                       "AZURE_OPENAI_EMBEDDING": "mock-embedding"})
+    proc = subprocess.Popen([sys.executable, str(BENCH_DIR / "mock_azure.py"), "--port", str(mock_port)],
+                            cwd=APP_DIR.parent, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    from openai_client import AsyncAzureOpenAIClient, AzureOpenAIClient
+
+    rows = []
+    n = args.callers
+    try:
+        wait_for(f"{mock}/mock/stats")
+        for enabled in (False, True):
+            tag = "single-flight" if enabled else "direct"
+            for kind in ("embed", "chat"):
+                async def go():
+                    client = AsyncAzureOpenAIClient()
+                    client.chat_flights.enabled = client.embed_flights.enabled = enabled
+                    try:
+                        return await run_async(client, n, kind)
+                    finally:
+                        await client.aclose()
+                rows.append(measure(f"async {kind} {tag}", mock, lambda: asyncio.run(go())))
+
+                client = AzureOpenAIClient()
+                client.chat_flights.enabled = client.embed_flights.enabled = enabled
+                rows.append(measure(f"sync {kind} {tag}", mock, lambda: run_sync(client, n, kind)))
+
+        # unreachable upstream: one failing call, every caller gets its error
+        sent = []
+
+        async def failing():
+            os.environ["AZURE_OPENAI_ENDPOINT"] = f"http://127.0.0.1:{free_port()}"
+            client = AsyncAzureOpenAIClient()
+            client.client = client.client.with_options(max_retries=0)
+            chat = client._chat
+
+            async def counted(*a):
+                sent.append(1)
+                return await chat(*a)
+            client._chat = counted
+            try:
+                return await run_async(client, n, "chat")
+            finally:
+                os.environ["AZURE_OPENAI_ENDPOINT"] = mock
+                await client.aclose()
+        rows.append(measure("async chat, upstream down", mock, lambda: asyncio.run(failing())))
+        rows[-1]["requests"] = len(sent)
+    finally:
+        proc.terminate()
+        proc.wait(timeout=10)
+
+    print(f"{n} concurrent identical calls")
+    print(f"{'calls':>28} | {'upstream req':>12} | {'wall ms':>7} | {'ok':>4} | errors")
+    print("-" * 72)
+    for r in rows:
+        print(f"{r['label']:>28} | {r['requests']:>12} | {r['wall_ms']:>7.0f} | {r['ok']:>4} | "
+              f"{r['errors']}")
+
+
+if __name__ == "__main__":
+    main()
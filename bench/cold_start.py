@@ -0,0 +1,92 @@
+"""
+Cold-start time of the API: HTML parse path vs compiled KB snapshot.
+
+Each scenario runs in a fresh interpreter and reports the time to import
+``api`` (the port can bind after this) and the time until the backend is
+ready (clients + KB index), plus the embedding requests made on the way.
+
+    python bench/cold_start.py              # fake clients
+    python bench/cold_start.py --live       # real Azure deployment (needs .env)
+"""
+from __future__ import annotations
+from pathlib import Path
+import argparse, json, os, statistics, subprocess, sys, tempfile
+
+BENCH_DIR = Path(__file__).resolve().parent
+ROOT = BENCH_DIR.parent
+
+CHILD = r"""
+import json, sys, time
+t0 = time.perf_counter()
+sys.path.insert(0, {bench!r})
+import fakes, openai_client
+calls = []
+if not {live!r}:
+    class Sync(fakes.FakeAzureClient):
+        def __init__(self): super().__init__(); self.calls = calls
+    class Async(fakes.AsyncFakeAzureClient):
+        def __init__(self): super().__init__(); self.calls = calls
+    openai_client.AzureOpenAIClient, openai_client.AsyncAzureOpenAIClient = Sync, Async
+t_imp = time.perf_counter()
+import api
+t_api = time.perf_counter()
+api.components.init()
+t_ready = time.perf_counter()
+print(json.dumps({{
+    "import_ms": (t_api - t_imp) * 1000,
+    "ready_ms": (t_ready - t_imp) * 1000,
+    "embed_calls": sum(1 for c in calls if c["kind"] == "embed"),
+    "startup": api.components.startup,
+}}))
+"""
+
+
+def run_child(env: dict, live: bool) -> dict:
+    out = subprocess.run([sys.executable, "-c", CHILD.format(bench=str(BENCH_DIR), live=live)],
+                         cwd=ROOT, env=env, capture_output=True, text=True, check=True)
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--live", action="store_true", help="call the real Azure deployment")
+    parser.add_argument("--runs", type=int, default=3)
+    args = parser.parse_args()
+
+    tmp = Path(tempfile.mkdtemp())
+    base = {**os.environ, "PYTHONPATH": str(ROOT / "app")}
+    if not args.live:
+        base["AZURE_OPENAI_EMBEDDING"] = "fake-embedding"
+    snapshot = tmp / "kb_snapshot.npz"
+    vec_snapshot = tmp / "kb_snapshot_vectors.npz"
+
+    # warm store + both snapshots
+    warm = {**base, "EMBED_CACHE_DIR": str(tmp / "warm"), "KB_SNAPSHOT": str(tmp / "none")}
+    run_child(warm, args.live)
+    for out, extra in ((snapshot, []), (vec_snapshot, ["--with-vectors"])):
+        subprocess.run([sys.executable, "app/kb_snapshot.py", "build", "--out", str(out),
+                        "--deployment", base.get("AZURE_OPENAI_EMBEDDING", ""), *extra],
+                       cwd=ROOT, env=warm, capture_output=True, check=True)
+
+    scenarios = [
+        ("parse, cold store",      {"KB_SNAPSHOT": str(tmp / "none")}, True),
+        ("parse, warm store",      {"KB_SNAPSHOT": str(tmp / "none")}, False),
+        ("snapshot, warm store",   {"KB_SNAPSHOT": str(snapshot)}, False),
+        ("snapshot+vec, no store", {"KB_SNAPSHOT": str(vec_snapshot)}, True),
+    ]
+    print(f"{'scenario':>24} | {'import ms':>9} | {'ready ms':>8} | {'kb ms':>7} | {'embeds':>6}")
+    print("-" * 66)
+    for label, extra, cold in scenarios:
+        results = []
+        for i in range(args.runs):
+            store = tmp / f"cold-{label}-{i}" if cold else tmp / "warm"
+            results.append(run_child({**base, **extra, "EMBED_CACHE_DIR": str(store)}, args.live))
+        med = lambda key: statistics.median(r[key] for r in results)
+        kb_ms = statistics.median(r["startup"]["snapshot"] + r["startup"]["kb_index"]
+                                  for r in results)
+        print(f"{label:>24} | {med('import_ms'):>9.0f} | {med('ready_ms'):>8.0f} | "
+              f"{kb_ms:>7.1f} | {results[0]['embed_calls']:>6}")
+
+
+if __name__ == "__main__":
+    main()
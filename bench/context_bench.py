@@ -0,0 +1,86 @@
+"""
+QA prompt size & latency: whole page × HMO chunks vs tier-filtered table rows.
+
+    python bench/context_bench.py                   # fake client, modelled latency
+    python bench/context_bench.py --mode embedding  # ranking mode (lexical by default offline)
+    python bench/context_bench.py --live            # real Azure deployment (needs .env)
+"""
+from __future__ import annotations
+from pathlib import Path
+import argparse, asyncio, statistics, tempfile, time
+
+from fakes import FakeAzureClient, AsyncFakeAzureClient
+from retrieval_bench import DATA_DIR, QUESTIONS
+from data_loader import ChunkedKnowledgeBase, TIER_NAMES
+from embedding_store import EmbeddingStore
+from kb_search import RETRIEVAL_MODES, RETRIEVAL_UNITS, Retriever
+from prompts import get_system_prompt
+from tokens import count_message_tokens, count_tokens
+
+REPLY = "Members on your plan get a 50% discount on this treatment, up to 10 sessions a year."
+
+
+def messages_for(question: str, hmo: str, tier: str, ctx: str):
+    lang = "he" if any("֐" <= ch <= "׿" for ch in question) else "en"
+    return [
+        {"role": "system", "content": get_system_prompt("qa", lang)},
+        {"role": "system", "content": f"User profile:\nHMO: {hmo}\nTier: {tier}\n"},
+        {"role": "system", "content": f"Knowledge Base:\n{ctx}"},
+        {"role": "user", "content": question},
+    ]
+
+
+async def run(retriever: Retriever, client, live: bool):
+    ctx_tokens, prompt_tokens, latency, hits = [], [], [], 0
+    for i, (question, hmo, topic) in enumerate(QUESTIONS):
+        tier = TIER_NAMES[i % len(TIER_NAMES)]
+        t0 = time.perf_counter()
+        ctx, rows, _, _ = await retriever.aretrieve([hmo], question, question, [tier])
+        messages = messages_for(question, hmo, tier, ctx)
+        n = len(client.calls)
+        await client.chat(messages)
+        latency.append((time.perf_counter() - t0) * 1000 if live
+                       else client.calls[n]["latency_ms"])
+        ctx_tokens.append(count_tokens(ctx))
+        prompt_tokens.append(count_message_tokens(messages))
+        hits += any(retriever.emb.topics[r].startswith(topic) for r in rows)
+    return ctx_tokens, prompt_tokens, latency, hits / len(QUESTIONS)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--live", action="store_true", help="call the real Azure deployment")
+    parser.add_argument("--mode", choices=RETRIEVAL_MODES, default=None,
+                        help="ranking mode (default: embedding live, lexical offline)")
+    args = parser.parse_args()
+    mode = args.mode or ("embedding" if args.live else "lexical")
+
+    kb = ChunkedKnowledgeBase(DATA_DIR)
+    if args.live:
+        from openai_client import AzureOpenAIClient, AsyncAzureOpenAIClient
+        client, aclient, store = AzureOpenAIClient(), AsyncAzureOpenAIClient(), None
+        aclient.calls = []
+    else:
+        client, aclient = FakeAzureClient(), AsyncFakeAzureClient(responder=lambda m: REPLY)
+        store = EmbeddingStore(client.embedding_deployment, Path(tempfile.mkdtemp()))
+
+    print(f"{len(QUESTIONS)} questions, ranking mode: {mode}")
+    print(f"{'unit':>7} | {'ctx tok':>7} | {'prompt tok':>10} | {'p50 ms':>7} | "
+          f"{'mean ms':>7} | {'topic hit':>9}")
+    print("-" * 64)
+    results = {}
+    for unit in reversed(RETRIEVAL_UNITS):          # chunk (before) first
+        retriever = Retriever(kb, client, async_client=aclient, mode=mode,
+                              store=store, unit=unit)
+        ctx, prompt, ms, hit = asyncio.run(run(retriever, aclient, args.live))
+        results[unit] = (statistics.mean(ctx), statistics.mean(prompt), statistics.mean(ms))
+        print(f"{unit:>7} | {results[unit][0]:>7.0f} | {results[unit][1]:>10.0f} | "
+              f"{statistics.median(ms):>7.0f} | {results[unit][2]:>7.0f} | {hit:>9.2f}")
+    before, after = results["chunk"], results["record"]
+    print(f"record vs chunk: context tokens -{100 * (1 - after[0] / before[0]):.0f}%, "
+          f"prompt tokens -{100 * (1 - after[1] / before[1]):.0f}%, "
+          f"latency -{100 * (1 - after[2] / before[2]):.0f}%")
+
+
+if __name__ == "__main__":
+    main()
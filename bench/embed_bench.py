@@ -0,0 +1,95 @@
+"""
+Bulk embedding throughput: one request at a time vs the batched, concurrent,
+retrying pipeline in ``AzureOpenAIClient.embed``.
+
+The Azure endpoint is replaced by a fake ``embeddings.create`` with a
+latency of ``base + per_input × inputs`` that answers a share of the
+requests with ``429 Too Many Requests`` + ``retry-after-ms``.
+
+    python bench/embed_bench.py
+    python bench/embed_bench.py --texts 2000 --throttle 0.2
+"""
+from __future__ import annotations
+from types import SimpleNamespace
+from typing import List
+import argparse, os, random, threading, time
+import httpx
+import numpy as np
+from openai import RateLimitError
+
+from fakes import fake_embedding
+
+os.environ.setdefault("AZURE_OPENAI_KEY", "bench")
+os.environ.setdefault("AZURE_OPENAI_ENDPOINT", "https://bench.invalid")
+os.environ.setdefault("AZURE_OPENAI_API_VERSION", "2024-02-01")
+import openai_client  # noqa: E402
+
+
+class FakeEmbeddings:
+    """``client.embeddings`` stand-in with a latency model and random throttling."""
+
+    def __init__(self, base_ms: float, per_input_ms: float, throttle: float,
+                 retry_after_ms: int, seed: int = 0):
+        self.base_ms, self.per_input_ms = base_ms, per_input_ms
+        self.throttle, self.retry_after_ms = throttle, retry_after_ms
+        self.rng = random.Random(seed)
+        self.lock = threading.Lock()
+        self.requests = self.throttled = 0
+
+    def create(self, model: str, input: List[str]):
+        with self.lock:
+            self.requests += 1
+            throttled = self.rng.random() < self.throttle
+            self.throttled += throttled
+        if throttled:
+            request = httpx.Request("POST", "https://bench.invalid/embeddings")
+            response = httpx.Response(429, headers={"retry-after-ms": str(self.retry_after_ms)},
+                                      request=request)
+            raise RateLimitError("rate limited", response=response, body=None)
+        time.sleep((self.base_ms + self.per_input_ms * len(input)) / 1000)
+        return SimpleNamespace(data=[SimpleNamespace(embedding=fake_embedding(t)) for t in input])
+
+
+def run(label: str, texts: List[str], args, batch_size: int, concurrency: int) -> List[List[float]]:
+    openai_client.EMBED_BATCH_SIZE = batch_size
+    openai_client.EMBED_CONCURRENCY = concurrency
+    client = openai_client.AzureOpenAIClient()
+    fake = FakeEmbeddings(args.base_ms, args.per_input_ms, args.throttle, args.retry_after_ms)
+    client.bulk_client = SimpleNamespace(embeddings=fake)
+
+    streamed = []
+    out = client.embed(texts, on_batch=lambda start, vecs: streamed.append(len(vecs)))
+    b = client.last_bulk
+    print(f"{label:>26} | {b['batches']:>7} | {fake.throttled:>9} | {b['seconds']:>6.2f} | "
+          f"{b['texts_per_s']:>8.0f} | {b['tokens_per_s']:>9.0f}")
+    assert sum(streamed) == len(texts)
+    return out
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--texts", type=int, default=1000)
+    parser.add_argument("--base-ms", type=float, default=120.0)
+    parser.add_argument("--per-input-ms", type=float, default=1.5)
+    parser.add_argument("--throttle", type=float, default=0.1, help="share of requests answered 429")
+    parser.add_argument("--retry-after-ms", type=int, default=200)
+    args = parser.parse_args()
+
+    rng = random.Random(1)
+    words = "ביקור רופא שיניים טיפול הנחה מכבי כללית מאוחדת dental visit discount clinic".split()
+    texts = [f"{i}: " + " ".join(rng.choices(words, k=rng.randint(20, 120))) for i in range(args.texts)]
+
+    print(f"{args.texts} texts, {args.throttle:.0%} of requests throttled "
+          f"(retry-after {args.retry_after_ms} ms)")
+    print(f"{'pipeline':>26} | {'batches':>7} | {'throttled':>9} | {'s':>6} | "
+          f"{'texts/s':>8} | {'tokens/s':>9}")
+    print("-" * 80)
+    serial = run("16/request, 1 in flight", texts, args, batch_size=16, concurrency=1)
+    bulk = run("256/request, 4 in flight", texts, args, batch_size=256, concurrency=4)
+    small = run("64/request, 8 in flight", texts, args, batch_size=64, concurrency=8)
+    assert np.allclose(serial, bulk) and np.allclose(serial, small), "output order differs"
+    print("outputs identical and in input order")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+"""
+Extractor prompt size & latency per onboarding turn: full-history vs incremental
+vs incremental + local slot filler.
+
+    python bench/extractor_bench.py            # fake client, modelled latency
+    python bench/extractor_bench.py --live     # real Azure deployment (needs .env)
+"""
+from __future__ import annotations
+import argparse, time
+
+from fakes import FakeAzureClient
+from onboarding import ONBOARDING_EN, ONBOARDING_HE, extractor_responder
+from profile_extractor import (_build_incremental_messages, _build_messages,
+                               extract_profile, extract_profile_incremental)
+from tokens import count_message_tokens
+from slot_filler import fill_slots
+from validators import valid_fields
+
+
+def run(script, client, live: bool):
+    history, confirmed_full, confirmed_inc, confirmed_slot = [], {}, {}, {}
+    rows = []
+    for turn, (question, answer, _) in enumerate(script, 1):
+        history.append({"role": "assistant", "content": question})
+        convo = history + [{"role": "user", "content": answer}]
+
+        # full history (current behaviour)
+        full_tokens = count_message_tokens(_build_messages(convo))
+        t0 = time.perf_counter(); n = len(client.calls)
+        confirmed_full.update({k: v for k, v in extract_profile(convo, client=client).items() if v})
+        full_ms = (time.perf_counter() - t0) * 1000 if live else client.calls[n]["latency_ms"]
+
+        # incremental
+        msgs, missing = _build_incremental_messages(confirmed_inc, question, answer)
+        inc_tokens = count_message_tokens(msgs) if missing else 0
+        t0 = time.perf_counter(); n = len(client.calls)
+        extracted = extract_profile_incremental(confirmed_inc, question, answer, client=client)
+        confirmed_inc = valid_fields({**confirmed_inc, **{k: v for k, v in extracted.items() if v}})
+        inc_ms = ((time.perf_counter() - t0) * 1000 if live
+                  else client.calls[n]["latency_ms"] if len(client.calls) > n else 0.0)
+
+        # incremental + slot filler (LLM only when the rules give up)
+        msgs, missing = _build_incremental_messages(confirmed_slot, question, answer)
+        extracted = fill_slots(question, answer, confirmed_slot)
+        slot_tokens, slot_ms = 0, 0.0
+        if extracted is None:
+            slot_tokens = count_message_tokens(msgs) if missing else 0
+            t0 = time.perf_counter(); n = len(client.calls)
+            extracted = extract_profile_incremental(confirmed_slot, question, answer, client=client)
+            slot_ms = ((time.perf_counter() - t0) * 1000 if live
+                       else client.calls[n]["latency_ms"] if len(client.calls) > n else 0.0)
+        confirmed_slot = valid_fields({**{k: v for k, v in extracted.items() if v},
+                                       **confirmed_slot})
+
+        history.append({"role": "user", "content": answer})
+        rows.append((turn, full_tokens, inc_tokens, slot_tokens, full_ms, inc_ms, slot_ms))
+    return rows, confirmed_full, confirmed_inc, confirmed_slot
+
+
+def report(name, rows, confirmed_full, confirmed_inc, confirmed_slot):
+    print(f"\n{name}: {len(rows)} turns")
+    print(f"{'turn':>4} | {'full tok':>8} | {'incr tok':>8} | {'slot tok':>8} | "
+          f"{'full ms':>8} | {'incr ms':>8} | {'slot ms':>8}")
+    print("-" * 72)
+    for turn, *cols in rows:
+        print(f"{turn:>4} | {cols[0]:>8} | {cols[1]:>8} | {cols[2]:>8} | "
+              f"{cols[3]:>8.0f} | {cols[4]:>8.0f} | {cols[5]:>8.0f}")
+    tot = [sum(r[i] for r in rows) for i in range(1, 7)]
+    print("-" * 72)
+    print(f"{'sum':>4} | {tot[0]:>8} | {tot[1]:>8} | {tot[2]:>8} | "
+          f"{tot[3]:>8.0f} | {tot[4]:>8.0f} | {tot[5]:>8.0f}")
+    for label, tok, ms in (("incremental", tot[1], tot[4]), ("incr + slots", tot[2], tot[5])):
+        print(f"{label:>12}: input tokens -{100 * (1 - tok / tot[0]):.0f}%, "
+              f"extractor latency -{100 * (1 - ms / tot[3]):.0f}%")
+    llm_turns = sum(1 for r in rows if r[3])
+    print(f"slot filler answered {len(rows) - llm_turns}/{len(rows)} turns locally")
+    norm = lambda p: {k: str(v).lower() for k, v in p.items()}
+    print(f"same profile extracted: "
+          f"{norm(valid_fields(confirmed_full)) == norm(confirmed_inc) == norm(confirmed_slot)}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--live", action="store_true", help="call the real Azure deployment")
+    args = parser.parse_args()
+
+    for name, script in [("English onboarding", ONBOARDING_EN),
+                         ("Hebrew onboarding", ONBOARDING_HE)]:
+        if args.live:
+            from openai_client import AzureOpenAIClient
+            client = AzureOpenAIClient()
+            client.calls = []
+        else:
+            client = FakeAzureClient(responder=extractor_responder(script))
+        report(name, *run(script, client, args.live))
+
+
+if __name__ == "__main__":
+    main()
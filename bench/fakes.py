@@ -0,0 +1,95 @@
+"""
+In-process stand-ins for the Azure OpenAI clients used by the benchmarks.
+
+They never touch the network: embeddings are deterministic (seeded by the
+text hash) and chat latency follows a simple cost model
+``base + prompt_tokens × per_prompt_token + completion_tokens × per_output_token``
+so prompt-size changes show up as latency changes.
+"""
+from __future__ import annotations
+from pathlib import Path
+from typing import Callable, Dict, List
+import asyncio, hashlib, sys, time
+import numpy as np
+
+APP_DIR = Path(__file__).resolve().parent.parent / "app"
+if str(APP_DIR) not in sys.path:
+    sys.path.insert(0, str(APP_DIR))
+
+from tokens import count_message_tokens, count_tokens  # noqa: E402
+
+EMBED_DIM = 256
+
+
+def fake_embedding(text: str, dim: int = EMBED_DIM) -> List[float]:
+    seed = int(hashlib.sha256(text.encode("utf-8")).hexdigest()[:16], 16)
+    return np.random.default_rng(seed).standard_normal(dim).astype(np.float32).tolist()
+
+
+class FakeAzureClient:
+    """Sync client with the AzureOpenAIClient interface and a latency model."""
+
+    def __init__(self,
+                 responder: Callable[[List[Dict]], str] | None = None,
+                 base_ms: float = 250.0,
+                 per_prompt_token_ms: float = 0.2,
+                 per_output_token_ms: float = 12.0,
+                 embed_ms: float = 60.0,
+                 sleep: bool = False):
+        self.responder = responder or (lambda messages: "OK")
+        self.base_ms = base_ms
+        self.per_prompt_token_ms = per_prompt_token_ms
+        self.per_output_token_ms = per_output_token_ms
+        self.embed_ms = embed_ms
+        self.sleep = sleep
+        self.chat_deployment = "fake-chat"
+        self.embedding_deployment = "fake-embedding"
+        self.calls: List[Dict] = []
+
+    def _chat_cost(self, messages: List[Dict]) -> tuple[str, Dict]:
+        reply = self.responder(messages)
+        prompt_tokens = count_message_tokens(messages)
+        completion_tokens = count_tokens(reply)
+        latency_ms = (self.base_ms + prompt_tokens * self.per_prompt_token_ms
+                      + completion_tokens * self.per_output_token_ms)
+        call = {"kind": "chat", "prompt_tokens": prompt_tokens,
+                "completion_tokens": completion_tokens, "latency_ms": latency_ms}
+        self.calls.append(call)
+        return reply, call
+
+    def chat(self, messages: List[Dict], temperature: float = 0.2) -> str:
+        reply, call = self._chat_cost(messages)
+        if self.sleep:
+            time.sleep(call["latency_ms"] / 1000)
+        return reply
+
+    def embed(self, texts: List[str]) -> List[List[float]]:
+        self.calls.append({"kind": "embed", "texts": len(texts), "latency_ms": self.embed_ms})
+        if self.sleep:
+            time.sleep(self.embed_ms / 1000)
+        return [fake_embedding(t) for t in texts]
+
+
+class AsyncFakeAzureClient(FakeAzureClient):
+    """Async twin (AsyncAzureOpenAIClient interface); always sleeps for the modelled latency."""
+
+    async def chat(self, messages: List[Dict], temperature: float = 0.2) -> str:
+        reply, call = self._chat_cost(messages)
+        await asyncio.sleep(call["latency_ms"] / 1000)
+        return reply
+
+    async def chat_stream(self, messages: List[Dict], temperature: float = 0.2):
+        reply, call = self._chat_cost(messages)
+        words = reply.split(" ")
+        await asyncio.sleep(self.base_ms / 1000)
+        for w in words:
+            await asyncio.sleep(self.per_output_token_ms / 1000)
+            yield w + " "
+
+    async def embed(self, texts: List[str]) -> List[List[float]]:
+        self.calls.append({"kind": "embed", "texts": len(texts), "latency_ms": self.embed_ms})
+        await asyncio.sleep(self.embed_ms / 1000)
+        return [fake_embedding(t) for t in texts]
+
+    async def aclose(self):
+        pass
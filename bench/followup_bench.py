@@ -0,0 +1,99 @@
+"""
+Conversation-aware retrieval: embedding requests, index searches and
+retrieval latency of scripted QA conversations (new questions, follow-ups,
+an HMO switch, small talk) with the per-conversation state on and off.
+
+    python bench/followup_bench.py
+"""
+from __future__ import annotations
+from pathlib import Path
+from typing import Dict, List, Tuple
+import argparse, asyncio, statistics, tempfile, time
+
+from fakes import APP_DIR, AsyncFakeAzureClient, FakeAzureClient
+from conversation_retrieval import ConversationRetrieval
+from data_loader import ChunkedKnowledgeBase
+from embedding_store import EmbeddingStore
+from kb_search import Retriever
+from query_cache import QueryEmbeddingCache
+from utils import detect_hmos
+
+DATA_DIR = APP_DIR.parent / "phase2_data"
+
+# (profile HMO, tier, QA messages)
+CONVERSATIONS: List[Tuple[str, str, List[str]]] = [
+    ("מכבי", "זהב", ["How much discount do I get on dental fillings?", "and for silver?",
+                     "how much does it cost?", "thanks!"]),
+    ("כללית", "כסף", ["Is acupuncture covered?", "what about Maccabi?", "ok",
+                      "Do you have a smoking cessation workshop?", "and for gold members?",
+                      "great, thank you"]),
+    ("מאוחדת", "ארד", ["כמה הנחה יש על משקפי ראייה?", "ומה לגבי מכבי?", "ובמסלול זהב?",
+                       "תודה רבה"]),
+    ("מכבי", "כסף", ["Is there a speech therapy diagnosis for my son?",
+                     "How many stuttering treatments per year?", "and in clalit?", "bye"]),
+    ("כללית", "זהב", ["אילו בדיקות מכוסות בהריון?", "כמה זה עולה?", "סבבה",
+                      "יש סדנה להפסקת עישון?", "ולגבי מאוחדת?", "מעולה, תודה"]),
+]
+
+
+async def run(retriever: Retriever, aclient: AsyncFakeAzureClient, enabled: bool) -> Dict:
+    state = ConversationRetrieval(enabled=enabled)
+    retriever.emb.query_cache = QueryEmbeddingCache()
+    aclient.calls.clear()
+    searches = 0
+    rank = retriever.rank
+
+    def counting_rank(*args, **kwargs):
+        nonlocal searches
+        searches += 1
+        return rank(*args, **kwargs)
+
+    retriever.rank = counting_rank
+    ms: List[float] = []
+    try:
+        for n, (hmo, tier, messages) in enumerate(CONVERSATIONS):
+            history: List[Dict] = []
+            for message in messages:
+                query = "".join(m["content"] + "\n" for m in history[-2:]) + message
+                t0 = time.perf_counter()
+                hmos = list(dict.fromkeys(detect_hmos(message) + [hmo]))   # as api.py
+                await state.retrieve(retriever, f"user-{n}", history, message, query,
+                                     hmos, [tier])
+                ms.append((time.perf_counter() - t0) * 1000)
+                history += [{"role": "user", "content": message},
+                            {"role": "assistant", "content": "..."}]
+    finally:
+        del retriever.rank
+    return {"embeds": sum(c["kind"] == "embed" for c in aclient.calls),
+            "searches": searches, "ms": ms, "stats": state.stats()}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--embed-ms", type=float, default=60.0, help="fake embedding latency")
+    args = parser.parse_args()
+
+    kb = ChunkedKnowledgeBase(DATA_DIR)
+    client, aclient = FakeAzureClient(), AsyncFakeAzureClient(embed_ms=args.embed_ms)
+    store = EmbeddingStore(client.embedding_deployment, Path(tempfile.mkdtemp()))
+    retriever = Retriever(kb, client, async_client=aclient, store=store)
+
+    turns = sum(len(m) for _, _, m in CONVERSATIONS)
+    print(f"{len(CONVERSATIONS)} conversations, {turns} QA turns, "
+          f"fake embedding latency {args.embed_ms:.0f} ms")
+    print(f"{'retrieval':>20} | {'embed req':>9} | {'searches':>8} | "
+          f"{'mean ms':>7} | decisions")
+    print("-" * 78)
+    for label, enabled in (("every turn", False), ("conversation state", True)):
+        r = asyncio.run(run(retriever, aclient, enabled))
+        decisions = ", ".join(f"{k[:-6]} {v}" for k, v in r["stats"].items()
+                              if k.endswith("_turns") and v)
+        print(f"{label:>20} | {r['embeds']:>9} | {r['searches']:>8} | "
+              f"{statistics.mean(r['ms']):>7.1f} | {decisions}")
+    s = r["stats"]
+    print(f"avoided per conversation: {s['embeds_avoided_per_conversation']:.1f} embedding, "
+          f"{s['searches_avoided_per_conversation']:.1f} search calls")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,106 @@
+"""
+Language detection: the previous ``langdetect`` path vs the script-count
+detector in ``utils.detect_lang`` – speed, accuracy and determinism on a
+labelled sample of conversations (onboarding replies + QA questions, short
+replies, IDs and mixed-script messages).
+
+Every message is labelled with the language the bot should answer in, i.e.
+the conversation's language, and detected with the conversation so far as
+history (as ``/chat`` does).
+
+    python bench/lang_bench.py
+"""
+from __future__ import annotations
+from typing import Dict, List, Tuple
+import argparse, statistics, time
+
+from langdetect import DetectorFactory, LangDetectException, detect
+
+from onboarding import ONBOARDING_EN, ONBOARDING_HE
+from retrieval_bench import QUESTIONS
+from utils import detect_lang, next_lang
+
+QA_EN = [q for q, _, _ in QUESTIONS if q.isascii()]
+QA_HE = [q for q, _, _ in QUESTIONS if not q.isascii()]
+
+# (conversation language, user messages)
+CONVERSATIONS: List[Tuple[str, List[str]]] = [
+    ("en", [a for _, a, _ in ONBOARDING_EN] + QA_EN),
+    ("he", [a for _, a, _ in ONBOARDING_HE] + QA_HE),
+    ("he", ["שלום", "דנה לוי", "123456789", "נקבה", "34", "maccabi", "987654321", "gold",
+            "כן", "ok", "תודה!", "מה לגבי שיניים?"]),
+    ("en", ["hi", "Noa Cohen", "מכבי", "I'm insured with מכבי", "silver", "yes",
+            "What does מאוחדת offer for glasses?", "thx"]),
+    ("he", ["היי", "אני עם Maccabi Gold", "כמה עולה טיפול שורש?", "ok thanks",
+            "ומה לגבי Clalit?"]),
+    ("en", ["Hello there, I need some help", "Dana", "Levi", "f", "Meuhedet",
+            "Bronze", "correct", "Do you cover IVF?"]),
+]
+
+
+def legacy_detect_lang(message: str, history: List[Dict]) -> str:
+    """The previous utils.detect_lang (langdetect, Hebrew-in-history fallback)."""
+    try:
+        return "he" if detect(message) == "he" else "en"
+    except LangDetectException:
+        for m in reversed(history):
+            if m.get("role") == "user":
+                if any("֐" <= ch <= "ת" for ch in m["content"]):
+                    return "he"
+                break
+        return "en"
+
+
+def run(detector, repeats: int) -> Tuple[float, float, int, int]:
+    """(accuracy, mean µs per call, unstable messages, messages)."""
+    correct = unstable = total = 0
+    us: List[float] = []
+    for lang, messages in CONVERSATIONS:
+        history: List[Dict] = []
+        sticky = None
+        for message in messages:
+            answers = set()
+            for _ in range(repeats):
+                t0 = time.perf_counter()
+                answers.add(detector(message, history, sticky))
+                us.append((time.perf_counter() - t0) * 1e6)
+            got = answers.pop() if len(answers) == 1 else None
+            unstable += got is None
+            correct += got == lang
+            total += 1
+            sticky = next_lang(sticky, message)
+            history += [{"role": "user", "content": message},
+                        {"role": "assistant", "content": "..."}]
+    return correct / total, statistics.mean(us), unstable, total
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--repeats", type=int, default=5, help="calls per message")
+    args = parser.parse_args()
+
+    t0 = time.perf_counter()
+    detect("warm up the langdetect profiles")
+    load_ms = (time.perf_counter() - t0) * 1000
+
+    detectors = [
+        ("langdetect (previous)", lambda m, h, s: legacy_detect_lang(m, h)),
+        ("script, history replay", lambda m, h, s: detect_lang(m, h)),
+        ("script, sticky session", lambda m, h, s: detect_lang(m, h, s)),
+    ]
+    n = sum(len(msgs) for _, msgs in CONVERSATIONS)
+    print(f"{n} labelled messages in {len(CONVERSATIONS)} conversations, "
+          f"{args.repeats} calls each (langdetect profile load: {load_ms:.0f} ms)")
+    print(f"{'detector':>24} | {'accuracy':>8} | {'µs/call':>8} | {'unstable':>8}")
+    print("-" * 58)
+    for label, detector in detectors:
+        acc, us, unstable, total = run(detector, args.repeats)
+        print(f"{label:>24} | {acc:>8.1%} | {us:>8.1f} | {unstable:>4}/{total}")
+
+    DetectorFactory.seed = 0
+    acc, us, unstable, total = run(detectors[0][1], args.repeats)
+    print(f"{'langdetect, seeded':>24} | {acc:>8.1%} | {us:>8.1f} | {unstable:>4}/{total}")
+
+
+if __name__ == "__main__":
+    main()
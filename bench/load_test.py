@@ -0,0 +1,286 @@
+"""
+End-to-end load test of ``/chat`` (or ``/chat/stream``) against the local
+mock Azure server (``bench/mock_azure.py``).
+
+Each virtual user runs scripted conversations in session mode – Hebrew or
+English onboarding until the profile is confirmed, then QA questions – and
+the driver reports per-phase p50/p95/p99 turn latency, requests/s and
+upstream (mock) calls per turn. Results can be stored as a baseline and
+later runs checked against it.
+
+    python bench/load_test.py                          # spawn mock + API, print report
+    python bench/load_test.py --save-baseline          # store bench/baselines/load_test.json
+    python bench/load_test.py --check                  # exit 1 on regression vs the baseline
+    python bench/load_test.py --stream --users 16
+    python bench/load_test.py --target http://127.0.0.1:8000 --mock http://127.0.0.1:8100
+"""
+from __future__ import annotations
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, List, Tuple
+import argparse, asyncio, json, os, re, socket, subprocess, sys, tempfile, time
+
+import httpx
+
+from fakes import APP_DIR
+from onboarding import ONBOARDING_EN, ONBOARDING_HE
+from retrieval_bench import QUESTIONS
+
+BENCH_DIR = Path(__file__).resolve().parent
+BASELINE = BENCH_DIR / "baselines" / "load_test.json"
+_HEBREW = re.compile(r"[֐-׿]")
+
+QA_EN = [q for q, _, _ in QUESTIONS if not _HEBREW.search(q)]
+QA_HE = [q for q, _, _ in QUESTIONS if _HEBREW.search(q)]
+
+# latency / throughput may drift this much before --check fails; calls per turn
+# are deterministic for a given workload and may only drift by CALLS_SLACK
+CALLS_SLACK = 0.05
+
+
+def conversation(i: int, qa_turns: int) -> Tuple[List[str], List[str]]:
+    """User messages of conversation *i*: (onboarding replies, QA questions)."""
+    script, questions = (ONBOARDING_EN, QA_EN) if i % 2 == 0 else (ONBOARDING_HE, QA_HE)
+    qa = [questions[(i // 2 + k) % len(questions)] for k in range(qa_turns)]
+    return [answer for _, answer, _ in script], qa
+
+
+def percentile(values: List[float], p: float) -> float:
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(p / 100 * (len(values) - 1))))]
+
+
+# ─────────────────────────── driver ──────────────────────────────
+async def send(http: httpx.AsyncClient, session_id: str, message: str, stream: bool) -> Dict:
+    payload = {"session_id": session_id, "message": message}
+    if not stream:
+        resp = await http.post("/chat", json=payload)
+        resp.raise_for_status()
+        return resp.json()
+    async with http.stream("POST", "/chat/stream", json=payload) as resp:
+        resp.raise_for_status()
+        async for line in resp.aiter_lines():
+            if not line.startswith("data: "):
+                continue
+            event = json.loads(line[6:])
+            if event["type"] == "error":
+                raise RuntimeError(f"{event['status']}: {event['detail']}")
+            if event["type"] == "done":
+                return event
+    raise RuntimeError("stream ended without a done event")
+
+
+async def user(http: httpx.AsyncClient, queue: asyncio.Queue, args, results: Dict):
+    while True:
+        try:
+            i = queue.get_nowait()
+        except asyncio.QueueEmpty:
+            return
+        session_id = (await http.post("/sessions")).json()["session_id"]
+        onboarding, qa = conversation(i, args.qa_turns)
+        phase = "info_collection"
+        for message in onboarding:
+            if phase == "qa":                   # profile confirmed early – rest is small talk
+                break
+            phase = await turn(http, session_id, message, args.stream, "onboarding", results)
+            if phase is None:
+                break
+        if phase != "qa":
+            results["errors"].append(f"conversation {i} never reached QA")
+            continue
+        for message in qa:
+            if await turn(http, session_id, message, args.stream, "qa", results) is None:
+                break
+
+
+async def turn(http: httpx.AsyncClient, session_id: str, message: str, stream: bool,
+               label: str, results: Dict) -> str | None:
+    """Send one timed turn; returns the next phase (None on error)."""
+    t0 = time.perf_counter()
+    try:
+        data = await send(http, session_id, message, stream)
+    except Exception as exc:
+        results["errors"].append(f"{label}: {exc}")
+        return None
+    results[label].append((time.perf_counter() - t0) * 1000)
+    return data.get("phase")
+
+
+async def run_load(target: str, mock: str, args) -> Dict:
+    results: Dict[str, List] = {"onboarding": [], "qa": [], "errors": []}
+    queue: asyncio.Queue = asyncio.Queue()
+    for i in range(args.conversations):
+        queue.put_nowait(i)
+    limits = httpx.Limits(max_connections=args.users, max_keepalive_connections=args.users)
+    async with httpx.AsyncClient(base_url=target, timeout=120, limits=limits) as http, \
+               httpx.AsyncClient(base_url=mock) as mock_http:
+        await mock_http.post("/mock/reset")
+        t0 = time.perf_counter()
+        await asyncio.gather(*(user(http, queue, args, results) for _ in range(args.users)))
+        wall = time.perf_counter() - t0
+        upstream = (await mock_http.get("/mock/stats")).json()
+
+    turns = len(results["onboarding"]) + len(results["qa"])
+    report = {"turns": turns, "errors": len(results["errors"]), "seconds": round(wall, 2),
+              "req_s": round(turns / wall, 2) if wall else 0.0}
+    for label in ("onboarding", "qa"):
+        ms = results[label]
+        report[label] = {"turns": len(ms), **{f"p{p}": round(percentile(ms, p), 1)
+                                             for p in (50, 95, 99)}}
+    calls = upstream["calls"]
+    chat_calls = sum(v for k, v in calls.items() if not k.startswith("embed"))
+    report["upstream_per_turn"] = {
+        "total": round((chat_calls + calls.get("embed", 0)) / max(turns, 1), 3),
+        **{k: round(v / max(turns, 1), 3) for k, v in sorted(calls.items())
+           if k != "embed_texts"},
+    }
+    report["error_samples"] = results["errors"][:5]
+    return report
+
+
+# ─────────────────────────── processes ──────────────────────────────
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def wait_for(url: str, timeout: float = 120.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            if httpx.get(url, timeout=2).status_code == 200:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.2)
+    raise TimeoutError(f"{url} not ready after {timeout:.0f} s")
+
+
+@contextmanager
+def servers(args):
+    """Spawn the mock and the API (pointed at it); yield (api url, mock url)."""
+    mock_port, api_port = free_port(), free_port()
+    tmp = Path(tempfile.mkdtemp())
+    env = {**os.environ,
+           "PYTHONPATH": str(APP_DIR),
+           "AZURE_OPENAI_ENDPOINT": f"http://127.0.0.1:{mock_port}",
+           "AZURE_OPENAI_KEY": "mock", "AZURE_OPENAI_API_VERSION": "2024-02-15-preview",
+           "AZURE_OPENAI_DEPLOYMENT": "mock-chat", "AZURE_OPENAI_EMBEDDING": "mock-embedding",
+           "EMBED_CACHE_DIR": str(tmp / "embed_cache"), "KB_SNAPSHOT": str(tmp / "none"),
+           "SESSION_STORE": "memory", "QUERY_CACHE_DB": "", **dict(args.env)}
+    mock_cmd = [sys.executable, str(BENCH_DIR / "mock_azure.py"), "--port", str(mock_port),
+                "--chat-latency", args.chat_latency, "--token-ms", str(args.token_ms),
+                "--embed-latency", args.embed_latency, "--seed", str(args.seed),
+                "--chat-capacity", str(args.chat_capacity)]
+    api_cmd = [sys.executable, "-m", "uvicorn", "main:app", "--port", str(api_port),
+               "--log-level", "warning"]
+    procs = [subprocess.Popen(mock_cmd, cwd=APP_DIR.parent, env=env,
+                              stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)]
+    try:
+        wait_for(f"http://127.0.0.1:{mock_port}/mock/stats")
+        procs.append(subprocess.Popen(api_cmd, cwd=APP_DIR.parent, env=env,
+                                      stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL))
+        wait_for(f"http://127.0.0.1:{api_port}/ready")
+        yield f"http://127.0.0.1:{api_port}", f"http://127.0.0.1:{mock_port}"
+    finally:
+        for p in reversed(procs):
+            p.terminate()
+            try:
+                p.wait(timeout=10)
+            except subprocess.TimeoutExpired:   # still draining requests
+                p.kill()
+                p.wait()
+
+
+# ─────────────────────────── baseline ──────────────────────────────
+def scenario(args) -> str:
+    return (f"{'stream' if args.stream else 'chat'}-u{args.users}-c{args.conversations}"
+            f"-q{args.qa_turns}-{args.chat_latency}")
+
+
+def check(report: Dict, base: Dict, tolerance: float) -> List[str]:
+    """Regressions of *report* against *base* (empty = OK)."""
+    failures = []
+    for label in ("onboarding", "qa"):
+        for p in ("p50", "p95", "p99"):
+            now, was = report[label][p], base[label][p]
+            if now > was * (1 + tolerance):
+                failures.append(f"{label} {p} {now:.0f} ms > baseline {was:.0f} ms")
+    if report["req_s"] < base["req_s"] * (1 - tolerance):
+        failures.append(f"req/s {report['req_s']} < baseline {base['req_s']}")
+    for kind, now in report["upstream_per_turn"].items():
+        was = base["upstream_per_turn"].get(kind, 0.0)
+        if now > was + CALLS_SLACK:
+            failures.append(f"upstream {kind} calls/turn {now} > baseline {was}")
+    if report["errors"] > base["errors"]:
+        failures.append(f"{report['errors']} errors (baseline {base['errors']})")
+    return failures
+
+
+def print_report(report: Dict):
+    print(f"{report['turns']} turns in {report['seconds']} s → {report['req_s']} req/s, "
+          f"{report['errors']} errors")
+    print(f"{'phase':>12} | {'turns':>5} | {'p50 ms':>7} | {'p95 ms':>7} | {'p99 ms':>7}")
+    print("-" * 50)
+    for label in ("onboarding", "qa"):
+        r = report[label]
+        print(f"{label:>12} | {r['turns']:>5} | {r['p50']:>7.0f} | {r['p95']:>7.0f} | {r['p99']:>7.0f}")
+    print("upstream calls per turn: " + ", ".join(f"{k}={v}" for k, v in
+                                                  report["upstream_per_turn"].items()))
+    for sample in report["error_samples"]:
+        print(f"  error: {sample}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--users", type=int, default=8, help="concurrent conversations")
+    parser.add_argument("--conversations", type=int, default=24)
+    parser.add_argument("--qa-turns", type=int, default=4, help="QA questions per conversation")
+    parser.add_argument("--stream", action="store_true", help="use /chat/stream")
+    parser.add_argument("--chat-latency", default="lognormal:400,0.35")
+    parser.add_argument("--token-ms", type=float, default=8.0)
+    parser.add_argument("--embed-latency", default="lognormal:40,0.3")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--chat-capacity", type=int, default=0,
+                        help="mock chat calls served at once (0 → unlimited)")
+    parser.add_argument("--env", nargs=2, action="append", default=[], metavar=("NAME", "VALUE"),
+                        help="extra env var for the spawned API (repeatable)")
+    parser.add_argument("--target", help="running API (skips spawning; needs --mock)")
+    parser.add_argument("--mock", help="running mock_azure.py the target API uses")
+    parser.add_argument("--baseline", type=Path, default=BASELINE)
+    parser.add_argument("--save-baseline", action="store_true")
+    parser.add_argument("--check", action="store_true", help="exit 1 on regression")
+    parser.add_argument("--tolerance", type=float, default=0.25)
+    args = parser.parse_args()
+
+    if args.target:
+        report = asyncio.run(run_load(args.target, args.mock, args))
+    else:
+        with servers(args) as (target, mock):
+            report = asyncio.run(run_load(target, mock, args))
+    print_report(report)
+
+    key = scenario(args)
+    baselines = json.loads(args.baseline.read_text("utf-8")) if args.baseline.exists() else {}
+    if args.save_baseline:
+        baselines[key] = {k: v for k, v in report.items() if k != "error_samples"}
+        args.baseline.parent.mkdir(parents=True, exist_ok=True)
+        args.baseline.write_text(json.dumps(baselines, indent=2, sort_keys=True) + "\n", "utf-8")
+        print(f"baseline {key!r} saved to {args.baseline}")
+    if args.check:
+        if key not in baselines:
+            print(f"FAIL: no baseline {key!r} in {args.baseline}")
+            sys.exit(1)
+        failures = check(report, baselines[key], args.tolerance)
+        for f in failures:
+            print(f"FAIL: {f}")
+        if failures:
+            sys.exit(1)
+        print(f"OK: within {args.tolerance:.0%} of baseline {key!r}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+"""
+Request-path cost of logging: the old inline stdout + file handlers vs the
+queue-backed logger (``app/logger.py``), for the records one QA turn writes.
+
+Only the time spent in the calling thread is measured – that is what blocks
+the event loop. Turns are paced at ``--rate`` per second (the server waits on
+the LLM between turns); ``--rate 0`` logs back to back, where the writer
+thread competes for the GIL. The writer's drain time is reported separately.
+
+    python bench/logging_bench.py
+    python bench/logging_bench.py --turns 5000 --rate 0 --response-chars 3000
+"""
+from __future__ import annotations
+from pathlib import Path
+import argparse, logging, os, statistics, sys, tempfile, time
+
+TMP = Path(tempfile.mkdtemp())
+os.environ["LOG_DIR"] = str(TMP)
+
+from fakes import APP_DIR  # noqa: E402,F401  (puts app/ on sys.path)
+import logger as log  # noqa: E402
+
+
+def legacy_logger(name: str) -> logging.Logger:
+    """The previous init_logger: synchronous stdout + plain file handler at DEBUG."""
+    lg = logging.getLogger(name)
+    lg.setLevel(logging.DEBUG)
+    for handler in (logging.StreamHandler(sys.stdout),
+                    logging.FileHandler(TMP / f"{name}.log", encoding="utf-8")):
+        handler.setLevel(logging.DEBUG)
+        handler.setFormatter(logging.Formatter(log.FMT))
+        lg.addHandler(handler)
+    lg.propagate = False
+    return lg
+
+
+def turn(lg: logging.Logger, response: str, timings: dict):
+    """Roughly the records of one QA turn (api, extractor, retrieval, client)."""
+    lg.info("Phase is info_collection, extracting profile incrementally.")
+    lg.info("Slot filler resolved %s locally.", ["age"])
+    lg.info("Extractor raw reply: %s", response[:200])
+    lg.debug("Query embedding cache miss for %d texts", 2)
+    lg.info("Prompt tokens: %s", {"system": 129, "profile": 27, "kb": 523, "user": 10, "total": 691})
+    lg.debug("LLM response: %s", response)
+    lg.info("LLM tokens prompt=%s  completion=%s", 691, 240)
+    lg.info("LLM stream: ttft=%.0f ms total=%.0f ms chars=%d", 412.0, 1630.0, len(response))
+    lg.debug("LLM stream response: %s", response)
+    lg.info("Turn timings (ms): %s", timings)
+
+
+def measure(lg: logging.Logger, turns: int, response: str, rate: float) -> list[float]:
+    timings = {"detect_lang": 0.4, "extract_profile": 1.9, "retrieval": 1.7,
+               "completion": 1200.0, "total": 1210.3}
+    out = []
+    for i in range(turns):
+        t0 = time.perf_counter()
+        turn(lg, response, timings)
+        out.append((time.perf_counter() - t0) * 1e6)
+        if rate:
+            time.sleep(1 / rate)
+    return out
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--turns", type=int, default=2000)
+    parser.add_argument("--rate", type=float, default=500.0, help="turns/s, 0 → back to back")
+    parser.add_argument("--response-chars", type=int, default=1500)
+    args = parser.parse_args()
+
+    response = ("לפי מאגר המידע, חברי הקופה זכאים להנחה. " * 100)[:args.response_chars]
+    real_stdout = sys.stdout
+    console = open(TMP / "stdout.txt", "w", encoding="utf-8")
+    sys.stdout = console                 # console output goes to a file for both setups
+
+    rows = []
+    try:
+        lg = legacy_logger("bench.legacy")
+        rows.append(("inline stdout+file", measure(lg, args.turns, response, args.rate), 0.0))
+
+        for label, name in (("queue, json", "bench.queue"),
+                            ("queue, json, sampled 10%", "bench.sampled")):
+            if "sampled" in label:
+                log.LOG_SAMPLE = f"{name}=0.1"
+            lg = log.init_logger(name, filename=f"{name}.log")
+            us = measure(lg, args.turns, response, args.rate)
+            t0 = time.perf_counter()
+            while log.stats()["queued"]:
+                time.sleep(0.001)
+            rows.append((label, us, (time.perf_counter() - t0) * 1000))
+    finally:
+        sys.stdout = real_stdout
+        log.shutdown()
+        console.close()
+
+    print(f"{args.turns} turns × 10 records at {args.rate or 'max'} turns/s, "
+          f"{args.response_chars}-char LLM response")
+    print(f"{'setup':>26} | {'mean µs':>8} | {'p50 µs':>7} | {'p99 µs':>7} | {'drain ms':>8}")
+    print("-" * 68)
+    for label, us, drain in rows:
+        us.sort()
+        print(f"{label:>26} | {statistics.mean(us):>8.1f} | {statistics.median(us):>7.1f} | "
+              f"{us[int(0.99 * (len(us) - 1))]:>7.1f} | {drain:>8.1f}")
+    print(f"dropped records: {log.stats()['dropped']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,248 @@
+"""
+Local stand-in for an Azure OpenAI resource (OpenAI wire format), so the
+real API can be load-tested end to end without credentials.
+
+* ``POST /openai/deployments/{name}/chat/completions`` – JSON or SSE
+  streaming (``stream: true``); replies are scripted by call type:
+  extractor → JSON of the fields the scripted onboarding replies reveal,
+  onboarding → the next scripted question, summary / QA → canned text.
+* ``POST /openai/deployments/{name}/embeddings`` – deterministic vectors
+  (seeded by the text hash, float or base64 encoding).
+* ``GET /mock/stats`` / ``POST /mock/reset`` – upstream calls by type.
+
+With ``--chat-capacity N`` at most N chat calls are served at once and the
+rest wait their turn (a throttled deployment), so upstream latency grows
+with the load.
+
+Latency specs: ``fixed:MS``, ``uniform:LO,HI``, ``normal:MEAN,SD`` or
+``lognormal:MEDIAN,SIGMA`` (ms). A chat call waits one first-token sample,
+then ``--token-ms`` per output token (spread over the deltas when streaming).
+
+    python bench/mock_azure.py --port 8100 --chat-latency lognormal:400,0.35
+
+Point the API at it with ``AZURE_OPENAI_ENDPOINT=http://127.0.0.1:8100``
+(any key / API version).
+"""
+from __future__ import annotations
+from collections import Counter
+from contextlib import asynccontextmanager
+from typing import Dict, List
+import argparse, asyncio, base64, json, random, re, time
+
+import numpy as np
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+from fakes import fake_embedding
+from onboarding import ONBOARDING_EN, ONBOARDING_HE, extractor_responder
+from tokens import count_message_tokens, count_tokens
+
+_HEBREW = re.compile(r"[֐-׿]")
+
+QA_REPLY = {
+    "en": ("According to the knowledge base, members of your HMO and tier are entitled to "
+           "this service at a discount; details, limits per year and the phone number for "
+           "appointments are listed above. "),
+    "he": ("לפי מאגר המידע, חברי הקופה במסלול שלך זכאים לשירות זה בהנחה; הפרטים, "
+           "המגבלות השנתיות ומספר הטלפון לקביעת תור מופיעים למעלה. "),
+}
+SUMMARY_REPLY = "- The user completed onboarding.\n- The user asked about HMO services."
+
+
+class Latency:
+    """Random latency (ms) drawn from a ``kind:params`` spec."""
+
+    def __init__(self, spec: str, rng: random.Random):
+        kind, _, params = spec.partition(":")
+        self.kind, self.rng = kind, rng
+        self.params = [float(p) for p in params.split(",") if p]
+        if kind not in {"fixed", "uniform", "normal", "lognormal"}:
+            raise ValueError(f"unknown latency distribution {spec!r}")
+
+    def sample(self) -> float:
+        p = self.params
+        if self.kind == "fixed":
+            return p[0]
+        if self.kind == "uniform":
+            return self.rng.uniform(p[0], p[1])
+        if self.kind == "normal":
+            return max(0.0, self.rng.gauss(p[0], p[1]))
+        return p[0] * self.rng.lognormvariate(0.0, p[1])
+
+
+class MockAzure:
+    """Responder + latency model + call counters behind the HTTP routes."""
+
+    def __init__(self, chat_latency: str = "lognormal:400,0.35", token_ms: float = 8.0,
+                 embed_latency: str = "lognormal:40,0.3", embed_item_ms: float = 0.2,
+                 reply_tokens: int = 60, seed: int = 0, chat_capacity: int = 0):
+        rng = random.Random(seed)
+        self.capacity = asyncio.Semaphore(chat_capacity) if chat_capacity else None
+        self.in_flight = self.peak_in_flight = 0
+        self.chat_latency = Latency(chat_latency, rng)
+        self.embed_latency = Latency(embed_latency, rng)
+        self.token_ms, self.embed_item_ms = token_ms, embed_item_ms
+        self.reply_tokens = reply_tokens
+        self.extract = extractor_responder(ONBOARDING_EN + ONBOARDING_HE)
+        # scripted user reply → next scripted assistant question
+        self.next_question: Dict[str, str] = {}
+        for script in (ONBOARDING_EN, ONBOARDING_HE):
+            for (_, answer, _), (question, _, _) in zip(script, script[1:]):
+                self.next_question[answer] = question
+            self.next_question[script[-1][1]] = script[-1][0]
+        self.calls: Counter = Counter()
+        self.tokens: Counter = Counter()
+
+    # ────────────────── replies ──────────────────
+    def classify(self, messages: List[Dict]) -> str:
+        system = messages[0]["content"] if messages and messages[0]["role"] == "system" else ""
+        if system.startswith("You are a strict JSON extractor"):
+            return "extract"
+        if system.startswith("You maintain a running summary"):
+            return "summary"
+        if any(m["role"] == "system" and m["content"].startswith("Knowledge Base:")
+               for m in messages):
+            return "qa"
+        return "onboarding"
+
+    def reply(self, kind: str, messages: List[Dict]) -> str:
+        if kind == "extract":
+            return self.extract(messages)
+        if kind == "summary":
+            return SUMMARY_REPLY
+        user = next((m["content"] for m in reversed(messages) if m["role"] == "user"), "")
+        lang = "he" if _HEBREW.search(user) else "en"
+        if kind == "onboarding":
+            return self.next_question.get(user.strip(), ONBOARDING_HE[0][0] if lang == "he"
+                                          else ONBOARDING_EN[0][0])
+        words = (QA_REPLY[lang] * 8).split()
+        return " ".join(words[:self.reply_tokens])
+
+    @asynccontextmanager
+    async def _serving(self):
+        """One chat call being processed (after waiting for capacity, if limited)."""
+        self.in_flight += 1
+        self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+        try:
+            if self.capacity is None:
+                yield
+            else:
+                async with self.capacity:
+                    yield
+        finally:
+            self.in_flight -= 1
+
+    # ────────────────── wire format ──────────────────
+    async def chat(self, deployment: str, body: Dict):
+        messages = body["messages"]
+        kind = self.classify(messages)
+        text = self.reply(kind, messages)
+        self.calls[kind] += 1
+        prompt_tokens, completion_tokens = count_message_tokens(messages), count_tokens(text)
+        self.tokens["prompt"] += prompt_tokens
+        self.tokens["completion"] += completion_tokens
+        base = {"id": f"chatcmpl-mock-{sum(self.calls.values())}", "created": int(time.time()),
+                "model": deployment}
+        first_ms = self.chat_latency.sample()
+
+        if not body.get("stream"):
+            async with self._serving():
+                await asyncio.sleep((first_ms + completion_tokens * self.token_ms) / 1000)
+            return JSONResponse({
+                **base, "object": "chat.completion",
+                "choices": [{"index": 0, "finish_reason": "stop",
+                             "message": {"role": "assistant", "content": text}}],
+                "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+                          "total_tokens": prompt_tokens + completion_tokens},
+            })
+
+        pieces = re.findall(r"\S+\s*", text) or [text]
+        per_piece_ms = completion_tokens * self.token_ms / len(pieces)
+
+        def chunk(delta: Dict, finish: str | None = None) -> str:
+            return "data: " + json.dumps({
+                **base, "object": "chat.completion.chunk",
+                "choices": [{"index": 0, "delta": delta, "finish_reason": finish}],
+            }, ensure_ascii=False) + "\n\n"
+
+        async def events():
+            async with self._serving():
+                await asyncio.sleep(first_ms / 1000)
+                yield chunk({"role": "assistant", "content": ""})
+                for piece in pieces:
+                    await asyncio.sleep(per_piece_ms / 1000)
+                    yield chunk({"content": piece})
+            yield chunk({}, "stop")
+            yield "data: [DONE]\n\n"
+
+        return StreamingResponse(events(), media_type="text/event-stream")
+
+    async def embeddings(self, deployment: str, body: Dict):
+        texts = body["input"] if isinstance(body["input"], list) else [body["input"]]
+        self.calls["embed"] += 1
+        self.calls["embed_texts"] += len(texts)
+        await asyncio.sleep((self.embed_latency.sample() + self.embed_item_ms * len(texts)) / 1000)
+        b64 = body.get("encoding_format") == "base64"
+        data = []
+        for i, text in enumerate(texts):
+            vec = fake_embedding(text)
+            if b64:
+                vec = base64.b64encode(np.asarray(vec, dtype=np.float32).tobytes()).decode()
+            data.append({"object": "embedding", "index": i, "embedding": vec})
+        tokens = sum(count_tokens(t) for t in texts)
+        return JSONResponse({"object": "list", "data": data, "model": deployment,
+                             "usage": {"prompt_tokens": tokens, "total_tokens": tokens}})
+
+    def stats(self) -> Dict:
+        return {"calls": dict(self.calls), "tokens": dict(self.tokens),
+                "peak_in_flight": self.peak_in_flight}
+
+
+def create_app(mock: MockAzure) -> FastAPI:
+    app = FastAPI(title="Mock Azure OpenAI")
+
+    @app.post("/openai/deployments/{deployment}/chat/completions")
+    async def chat(deployment: str, request: Request):
+        return await mock.chat(deployment, await request.json())
+
+    @app.post("/openai/deployments/{deployment}/embeddings")
+    async def embeddings(deployment: str, request: Request):
+        return await mock.embeddings(deployment, await request.json())
+
+    @app.get("/mock/stats")
+    async def stats():
+        return mock.stats()
+
+    @app.post("/mock/reset")
+    async def reset():
+        mock.calls.clear()
+        mock.tokens.clear()
+        mock.peak_in_flight = mock.in_flight
+        return mock.stats()
+
+    return app
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8100)
+    parser.add_argument("--chat-latency", default="lognormal:400,0.35",
+                        help="time to first token (ms distribution)")
+    parser.add_argument("--token-ms", type=float, default=8.0, help="per output token")
+    parser.add_argument("--embed-latency", default="lognormal:40,0.3")
+    parser.add_argument("--embed-item-ms", type=float, default=0.2, help="per input text")
+    parser.add_argument("--reply-tokens", type=int, default=60, help="QA reply length (words)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--chat-capacity", type=int, default=0,
+                        help="chat calls served at once (0 → unlimited)")
+    args = parser.parse_args()
+
+    mock = MockAzure(args.chat_latency, args.token_ms, args.embed_latency,
+                     args.embed_item_ms, args.reply_tokens, args.seed, args.chat_capacity)
+    uvicorn.run(create_app(mock), host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
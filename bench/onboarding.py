@@ -0,0 +1,66 @@
+"""Scripted onboarding conversations (assistant question, user reply, fields revealed)."""
+
+ONBOARDING_EN = [
+    ("Hello! I'll help you with information about your HMO services. "
+     "To get started, could you please tell me your first and last name?",
+     "Hi, my name is Dana Levi", {"first_name": "Dana", "last_name": "Levi"}),
+    ("Nice to meet you, Dana. Could you please provide your 9-digit national ID number?",
+     "sure, one sec", {}),
+    ("No problem, take your time. Please type your 9-digit ID number when ready.",
+     "123456789", {"id_number": "123456789"}),
+    ("Thank you. What is your gender?",
+     "female", {"gender": "female"}),
+    ("And how old are you? (age between 0 and 120)",
+     "I'm 34", {"age": 34}),
+    ("Which HMO are you a member of – Maccabi, Meuhedet or Clalit?",
+     "what's the difference between them?", {}),
+    ("They are Israel's three health maintenance organizations. Which one are you insured with?",
+     "Maccabi", {"hmo": "Maccabi"}),
+    ("Great. Please give me your 9-digit HMO card number.",
+     "98765432", {}),
+    ("That number has only 8 digits. The HMO card number must have exactly 9 digits – could you check it again?",
+     "sorry, 987654321", {"hmo_card": "987654321"}),
+    ("Thanks. What is your membership tier – Gold, Silver or Bronze?",
+     "I think it's gold", {"tier": "Gold"}),
+    ("Here is a summary of your details: Dana Levi, ID 123456789, female, 34, "
+     "Maccabi, card 987654321, Gold tier. Is everything correct? (yes / no)",
+     "yes, that's right", {}),
+    ("Perfect, your details are confirmed. How can I help you today?",
+     "thanks!", {}),
+]
+
+ONBOARDING_HE = [
+    ("שלום! אשמח לעזור לך במידע על שירותי קופת החולים. מה שמך הפרטי ושם המשפחה?",
+     "קוראים לי יוסי כהן", {"first_name": "יוסי", "last_name": "כהן"}),
+    ("נעים מאוד יוסי. מה מספר תעודת הזהות שלך (9 ספרות)?",
+     "012345678", {"id_number": "012345678"}),
+    ("תודה. מה המגדר שלך?", "זכר", {"gender": "זכר"}),
+    ("בן כמה אתה?", "בן 52", {"age": 52}),
+    ("באיזו קופת חולים אתה חבר – מכבי, מאוחדת או כללית?", "כללית", {"hmo": "כללית"}),
+    ("מה מספר כרטיס הקופה שלך (9 ספרות)?", "555666777", {"hmo_card": "555666777"}),
+    ("מה רמת הביטוח שלך – זהב, כסף או ארד?", "כסף", {"tier": "כסף"}),
+    ("לסיכום: יוסי כהן, ת.ז 012345678, זכר, 52, כללית, כרטיס 555666777, כסף. האם הפרטים נכונים? (כן / לא)",
+     "כן", {}),
+]
+
+
+def extractor_responder(script):
+    """
+    Fake extractor: returns the fields revealed by every scripted user reply
+    present in the prompt, restricted to the fields the prompt asks for.
+    """
+    import json
+
+    def respond(messages):
+        prompt = "\n".join(m["content"] for m in messages)
+        found = {}
+        for _, user_text, fields in script:
+            if f"user: {user_text}" in prompt:
+                found.update(fields)
+        system = messages[0]["content"]
+        if "Missing fields:" in system:
+            wanted = json.loads(system.split("Missing fields:", 1)[1])
+            found = {k: v for k, v in found.items() if k in wanted}
+        return json.dumps(found, ensure_ascii=False)
+
+    return respond
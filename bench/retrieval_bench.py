@@ -0,0 +1,107 @@
+"""
+Retrieval recall & latency on a fixed question set: embedding vs lexical
+(BM25) vs hybrid (reciprocal-rank fusion), plus the deadline fallback.
+
+    python bench/retrieval_bench.py            # fake client (recall of the embedding
+                                               # modes is meaningless – random vectors)
+    python bench/retrieval_bench.py --live     # real Azure deployment (needs .env)
+"""
+from __future__ import annotations
+from pathlib import Path
+import argparse, asyncio, statistics, tempfile, time
+
+from fakes import APP_DIR, AsyncFakeAzureClient, FakeAzureClient
+from data_loader import ChunkedKnowledgeBase
+from embedding_store import EmbeddingStore
+from kb_search import RETRIEVAL_MODES, Retriever
+from query_cache import QueryEmbeddingCache
+
+DATA_DIR = APP_DIR.parent / "phase2_data"
+
+DENTAL, SPEECH, PREGNANCY = "מרפאות שיניים", "מרפאות תקשורת", "הריון"
+WORKSHOPS, ALTERNATIVE, OPTOMETRY = "סדנאות בריאות", "רפואה משלימה", "אופטומטריה"
+
+# (question, HMO, expected topic prefix)
+QUESTIONS = [
+    ("How much discount do I get on dental fillings?",          "מכבי",    DENTAL),
+    ("Is teeth cleaning free for gold members?",                "כללית",   DENTAL),
+    ("What about root canal treatment?",                        "מאוחדת",  DENTAL),
+    ("Do you cover crowns and implants?",                       "מכבי",    DENTAL),
+    ("Is there a speech therapy diagnosis for my son?",         "כללית",   SPEECH),
+    ("How many stuttering treatments per year?",                "מאוחדת",  SPEECH),
+    ("What benefits are there for swallowing disorders?",       "מכבי",    SPEECH),
+    ("I'm pregnant, what tests are covered?",                   "מאוחדת",  PREGNANCY),
+    ("Is there a childbirth preparation course for pregnancy?", "כללית",   PREGNANCY),
+    ("Genetic screening tests discount?",                       "מכבי",    PREGNANCY),
+    ("Do you have a smoking cessation workshop?",               "מכבי",    WORKSHOPS),
+    ("Nutrition workshop with a dietitian?",                    "כללית",   WORKSHOPS),
+    ("Stress management workshop for silver members",           "מאוחדת",  WORKSHOPS),
+    ("Is acupuncture covered?",                                 "כללית",   ALTERNATIVE),
+    ("Reflexology sessions per year on bronze?",                "מכבי",    ALTERNATIVE),
+    ("Discount on chiropractic treatment?",                     "מאוחדת",  ALTERNATIVE),
+    ("How much do glasses cost for me?",                        "מאוחדת",  OPTOMETRY),
+    ("Contact lenses discount on gold",                         "כללית",   OPTOMETRY),
+    ("Laser vision correction benefits",                        "מכבי",    OPTOMETRY),
+    ("כמה הנחה יש על סתימות?",                                  "מכבי",    DENTAL),
+    ("האם יש טיפול בגמגום לילדים?",                             "כללית",   SPEECH),
+    ("אילו בדיקות מכוסות בהריון?",                              "מאוחדת",  PREGNANCY),
+    ("יש סדנה להפסקת עישון?",                                   "כללית",   WORKSHOPS),
+    ("כמה טיפולי דיקור סיני מגיעים לי בשנה?",                   "מאוחדת",  ALTERNATIVE),
+    ("מה ההנחה על משקפי ראייה במסלול כסף?",                     "מכבי",    OPTOMETRY),
+    ("האם בדיקת ראייה חינם?",                                   "כללית",   OPTOMETRY),
+]
+
+
+def recall(rankings: list[list[int]], topics: list[str], k: int) -> float:
+    hits = sum(any(topics[r].startswith(topic) for r in rows[:k])
+               for rows, (_, _, topic) in zip(rankings, QUESTIONS))
+    return hits / len(QUESTIONS)
+
+
+async def run(retriever: Retriever) -> tuple[list[float], list[list[int]]]:
+    """Per-question latency (ms) and the rows actually served."""
+    ms, rankings = [], []
+    for question, hmo, _ in QUESTIONS:
+        retriever.emb.query_cache = QueryEmbeddingCache()     # every query is a miss
+        t0 = time.perf_counter()
+        _, rows, _, _ = await retriever.aretrieve([hmo], question, question)
+        ms.append((time.perf_counter() - t0) * 1000)
+        rankings.append(rows)
+    return ms, rankings
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--live", action="store_true", help="call the real Azure deployment")
+    parser.add_argument("--deadline-ms", type=float, default=40.0,
+                        help="embedding deadline for the fallback run")
+    args = parser.parse_args()
+
+    kb = ChunkedKnowledgeBase(DATA_DIR)
+    if args.live:
+        from openai_client import AzureOpenAIClient, AsyncAzureOpenAIClient
+        client, aclient, store = AzureOpenAIClient(), AsyncAzureOpenAIClient(), None
+    else:
+        client, aclient = FakeAzureClient(), AsyncFakeAzureClient()
+        store = EmbeddingStore(client.embedding_deployment, Path(tempfile.mkdtemp()))
+
+    retriever = Retriever(kb, client, async_client=aclient, store=store)
+
+    print(f"{len(QUESTIONS)} questions, {len(retriever.docs)} {retriever.unit}s")
+    print(f"{'mode':>22} | {'R@1':>5} | {'R@3':>5} | {'p50 ms':>7} | {'p95 ms':>7}")
+    print("-" * 58)
+    runs = [(mode, mode, 0.0) for mode in RETRIEVAL_MODES]
+    runs.append((f"embedding ≤{args.deadline_ms:.0f} ms", "embedding", args.deadline_ms))
+    for label, mode, deadline in runs:
+        retriever.mode, retriever.deadline_ms, retriever.fallbacks = mode, deadline, 0
+        ms, rankings = asyncio.run(run(retriever))
+        ms.sort()
+        p95 = ms[min(len(ms) - 1, int(0.95 * len(ms)))]
+        r1, r3 = (recall(rankings, retriever.emb.topics, k) for k in (1, 3))
+        print(f"{label:>22} | {r1:>5.2f} | {r3:>5.2f} | "
+              f"{statistics.median(ms):>7.1f} | {p95:>7.1f}"
+              + (f"   ({retriever.fallbacks} lexical fallbacks)" if deadline else ""))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,144 @@
+"""
+Multi-worker startup: ``app/serve.py`` (KB built once, shared read-only) vs
+plain ``uvicorn main:app --workers N`` (every worker parses and embeds on its
+own), against the mock Azure server.
+
+For 1, 4 and 16 workers it reports the time until every worker is ready,
+the embedding requests / texts sent upstream, and per-worker RSS and PSS
+(PSS splits shared pages between the processes mapping them, so it is the
+memory a worker really adds).
+
+    python bench/workers_bench.py
+    python bench/workers_bench.py --workers 2 8 --embed-latency fixed:400
+"""
+from __future__ import annotations
+from pathlib import Path
+from typing import Dict, List
+import argparse, json, os, statistics, subprocess, sys, tempfile, time
+
+import httpx
+
+from fakes import APP_DIR
+from load_test import BENCH_DIR, free_port, wait_for
+
+TMP = Path(tempfile.mkdtemp())
+os.environ["LOG_DIR"] = str(TMP)
+from serve import memory  # noqa: E402
+
+
+def descendants(pid: int) -> List[int]:
+    """Every process below *pid* (from /proc)."""
+    children: Dict[int, List[int]] = {}
+    for stat in Path("/proc").glob("[0-9]*/stat"):
+        try:
+            fields = stat.read_text().rsplit(")", 1)[1].split()
+        except OSError:
+            continue
+        children.setdefault(int(fields[1]), []).append(int(stat.parent.name))
+    out, todo = [], [pid]
+    while todo:
+        kids = children.get(todo.pop(), [])
+        out += kids
+        todo += kids
+    return out
+
+
+def workers_of(pid: int) -> List[int]:
+    """Worker processes of a server: its spawned children, or itself when it has none."""
+    spawned = [p for p in descendants(pid)
+               if b"spawn_main" in Path(f"/proc/{p}/cmdline").read_bytes()]
+    return spawned or [pid]
+
+
+def ready_count(log_dir: Path) -> int:
+    """Workers that logged "Backend ready" (uvicorn workers share one log dir)."""
+    return sum(line.count('"Backend ready') for f in log_dir.rglob("components.log")
+               for line in f.read_text("utf-8").splitlines())
+
+
+def run(mode: str, n: int, mock: str, base_env: Dict[str, str], timeout: float) -> Dict:
+    tmp = Path(tempfile.mkdtemp(dir=TMP))
+    (tmp / "logs").mkdir()
+    port = free_port()
+    env = {**base_env, "EMBED_CACHE_DIR": str(tmp / "embed_cache"),
+           "KB_SNAPSHOT": str(tmp / "none"), "SERVE_SNAPSHOT": str(tmp / "published.npz"),
+           "LOG_DIR": str(tmp / "logs"), "SESSION_DB": str(tmp / "sessions.sqlite")}
+    if mode == "shared":
+        cmd = [sys.executable, str(APP_DIR / "serve.py"), "--workers", str(n),
+               "--port", str(port), "--log-level", "warning", "--report", str(tmp / "report.json")]
+        done = lambda: (tmp / "report.json").exists()
+    else:
+        cmd = [sys.executable, "-m", "uvicorn", "main:app", "--port", str(port),
+               "--log-level", "warning"] + (["--workers", str(n)] if n > 1 else [])
+        done = lambda: ready_count(tmp / "logs") >= n
+    httpx.post(f"{mock}/mock/reset")
+
+    t0 = time.perf_counter()
+    proc = subprocess.Popen(cmd, cwd=APP_DIR.parent, env=env,
+                            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        while not done():
+            if proc.poll() is not None or time.perf_counter() - t0 > timeout:
+                raise RuntimeError(f"{mode} × {n}: not ready (exit code {proc.returncode})")
+            time.sleep(0.05)
+        ready_s = time.perf_counter() - t0
+        wait_for(f"http://127.0.0.1:{port}/ready")
+        time.sleep(0.5)
+        workers = workers_of(proc.pid)
+        mem = [memory(p) for p in workers]
+        # the index matrix is a view on the store file, not a private copy
+        mapped = sum(b"vectors.f32" in Path(f"/proc/{p}/maps").read_bytes() for p in workers)
+        total_pss = sum(memory(p).get("pss_mb", 0.0) for p in [proc.pid, *descendants(proc.pid)])
+        calls = httpx.get(f"{mock}/mock/stats").json()["calls"]
+    finally:
+        proc.terminate()
+        proc.wait(timeout=60)
+    return {"mode": mode, "workers": n, "ready_s": ready_s,
+            "embed_calls": calls.get("embed", 0), "embed_texts": calls.get("embed_texts", 0),
+            "mapped": mapped,
+            "rss_mb": statistics.mean(m["rss_mb"] for m in mem),
+            "pss_mb": statistics.mean(m["pss_mb"] for m in mem), "total_pss_mb": total_pss}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 4, 16])
+    parser.add_argument("--embed-latency", default="lognormal:40,0.3")
+    parser.add_argument("--timeout", type=float, default=300.0)
+    args = parser.parse_args()
+
+    mock_port = free_port()
+    mock = f"http://127.0.0.1:{mock_port}"
+    env = {**os.environ,
+           "PYTHONPATH": str(APP_DIR),
+           "AZURE_OPENAI_ENDPOINT": mock,
+           "AZURE_OPENAI_KEY": "mock", "AZURE_OPENAI_API_VERSION": "2024-02-15-preview",
+           "AZURE_OPENAI_DEPLOYMENT": "mock-chat", "AZURE_OPENAI_EMBEDDING": "mock-embedding",
+           "SESSION_STORE": "sqlite", "QUERY_CACHE_DB": "", "LOG_CONSOLE": "0"}
+    mock_proc = subprocess.Popen([sys.executable, str(BENCH_DIR / "mock_azure.py"),
+                                  "--port", str(mock_port), "--embed-latency", args.embed_latency],
+                                 cwd=APP_DIR.parent, env=env,
+                                 stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    rows = []
+    try:
+        wait_for(f"{mock}/mock/stats")
+        for n in args.workers:
+            for mode in ("per-worker", "shared"):
+                rows.append(run(mode, n, mock, env, args.timeout))
+                print(json.dumps(rows[-1]), file=sys.stderr)
+    finally:
+        mock_proc.terminate()
+        mock_proc.wait(timeout=10)
+
+    print(f"{'setup':>22} | {'ready s':>7} | {'embed req':>9} | {'texts':>5} | "
+          f"{'RSS/worker':>10} | {'PSS/worker':>10} | {'PSS total':>9} | {'memmap':>6}")
+    print("-" * 99)
+    for r in rows:
+        label = f"{r['mode']} × {r['workers']}"
+        print(f"{label:>22} | {r['ready_s']:>7.2f} | {r['embed_calls']:>9} | {r['embed_texts']:>5} | "
+              f"{r['rss_mb']:>7.1f} MiB | {r['pss_mb']:>7.1f} MiB | {r['total_pss_mb']:>5.0f} MiB | "
+              f"{r['mapped']:>2}/{r['workers']:<3}")
+
+
+if __name__ == "__main__":
+    main()
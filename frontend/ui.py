@@ -2,7 +2,12 @@ import streamlit as st
 import requests
 import json
 
-API_URL = "http://localhost:8000/chat"
+BASE_URL = "http://localhost:8000"
+API_URL = BASE_URL + "/chat"
+STREAM_URL = API_URL + "/stream"
+USE_STREAMING = True  # render tokens as they arrive (falls back to /chat when False)
+USE_SESSIONS = True   # server keeps history/phase/profile; we only send the new message
+SESSION_LOST = "session_lost"   # 404 for our session id (expired / backend restarted)
     
 st.set_page_config(page_title="HMO Chatbot", layout="wide")
 st.title("🏥 Health Maintenance Organization (HMO) ChatBot")
@@ -12,6 +17,8 @@ if "phase" not in st.session_state:
     st.session_state.phase = "info_collection"
     st.session_state.history = []  # chat history list[dict]
     st.session_state.profile = {}  # filled UserInfo dict
+    st.session_state.session_id = None
+    st.session_state.stateless = not USE_SESSIONS
 
 # col_chat, col_profile = st.columns([3, 1])
 
@@ -21,6 +28,8 @@ def call_backend(payload: dict):
     """Call the backend API and return the response."""
     try:
         r = requests.post(API_URL, json=payload, timeout=60)
+        if r.status_code == 404 and payload.get("session_id"):
+            return SESSION_LOST
         r.raise_for_status()  # raises on 4xx / 5xx
         if "application/json" in r.headers.get("content-type", ""):
             return r.json()  # fine – ChatResponse
@@ -31,32 +40,116 @@ def call_backend(payload: dict):
     except requests.RequestException as e:
         st.error(f"❌ Could not reach backend: {e}")
         return None
-    
-# ───────────────────────── Render chat history ───────────────────────────
-for msg in st.session_state.history:
-    st.chat_message(msg["role"]).write(msg["content"])
 
 
-# ───────────────────────── Handle user input ─────────────────────────────
-if prompt := st.chat_input("Your message..."):
-    user_lang = st.session_state.get("last_lang", "en")  # default to English
+def create_session():
+    """Open a server-side conversation session and return its id."""
+    try:
+        r = requests.post(BASE_URL + "/sessions", timeout=10)
+        r.raise_for_status()
+        return r.json()["session_id"]
+    except requests.RequestException as e:
+        st.error(f"❌ Could not reach backend: {e}")
+        return None
+
+# ───────────────────────── Helper: streaming call ────────────────────────
+def stream_backend(payload: dict, placeholder):
+    """
+    Call /chat/stream and render the reply progressively into *placeholder*.
+    Returns the final ChatResponse dict (same shape as /chat) or None.
+    """
+    text = ""
+    try:
+        with requests.post(STREAM_URL, json=payload, stream=True, timeout=60) as r:
+            if r.status_code == 404 and payload.get("session_id"):
+                return SESSION_LOST
+            if r.status_code != 200:
+                st.error(f"❌ Backend error {r.status_code}: {r.text[:300]}")
+                return None
+            for line in r.iter_lines(decode_unicode=True):
+                if not line or not line.startswith("data: "):
+                    continue
+                event = json.loads(line[len("data: "):])
+                if event["type"] == "delta":
+                    text += event["content"]
+                    placeholder.markdown(text + "▌")
+                elif event["type"] == "done":
+                    placeholder.markdown(event["reply"])
+                    return event
+                elif event["type"] == "error":
+                    st.error(f"❌ Backend error {event.get('status')}: {event['detail'][:300]}")
+                    return None
+    except (requests.RequestException, json.JSONDecodeError) as e:
+        st.error(f"❌ Could not reach backend: {e}")
+    return None
 
+def stateless_payload(prompt: str) -> dict:
+    """Request carrying the whole conversation state kept in this tab."""
     payload = {
         "phase": st.session_state.phase,
         "message": prompt,
         "history": st.session_state.history
         # "user_info": st.session_state.profile,
     }
-    
+
     # Only include user_info once we actually have it.
     if st.session_state.profile:
         payload["user_info"] = st.session_state.profile
+    elif st.session_state.get("partial_info") is not None:
+        payload["partial_info"] = st.session_state.partial_info
+    return payload
+
+
+def send(payload: dict, placeholder=None):
+    return stream_backend(payload, placeholder) if USE_STREAMING else call_backend(payload)
+
+# ───────────────────────── Render chat history ───────────────────────────
+for msg in st.session_state.history:
+    st.chat_message(msg["role"]).write(msg["content"])
+
+
+# ───────────────────────── Handle user input ─────────────────────────────
+if prompt := st.chat_input("Your message..."):
+    user_lang = st.session_state.get("last_lang", "en")  # default to English
+
+    if not st.session_state.get("stateless", not USE_SESSIONS):
+        if not st.session_state.session_id:
+            st.session_state.session_id = create_session()
+        payload = {"session_id": st.session_state.session_id, "message": prompt}
+    else:
+        payload = stateless_payload(prompt)
 
-    response = call_backend(payload)
+    if USE_STREAMING:
+        st.chat_message("user").write(prompt)
+        with st.chat_message("assistant"):
+            placeholder = st.empty()
+            response = send(payload, placeholder)
+            if response == SESSION_LOST:
+                # the server no longer knows this conversation – a new session
+                # would start empty, so this tab sends its own state from now on
+                st.session_state.session_id = None
+                st.session_state.stateless = True
+                response = send(stateless_payload(prompt), placeholder)
+    else:
+        response = send(payload)
+        if response == SESSION_LOST:
+            st.session_state.session_id = None
+            st.session_state.stateless = True
+            response = send(stateless_payload(prompt))
     
     if response:
-        st.session_state.history = response["history"]
-        st.session_state.profile = response["user_info"]
+        if response.get("session_id"):
+            # session mode: the response only carries the new turn
+            st.session_state.history += [
+                {"role": "user", "content": prompt},
+                {"role": "assistant", "content": response["reply"]},
+            ]
+            if response.get("user_info"):
+                st.session_state.profile = response["user_info"]
+        else:
+            st.session_state.history = response["history"]
+            st.session_state.profile = response["user_info"]
+            st.session_state.partial_info = response.get("partial_info")
         
         # Backend declares profile complete
         if response.get("full_info"):                